@@ -0,0 +1,140 @@
+import socket
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+from listener_logging import connection_log
+from listener_metrics import metrics
+
+DEFAULT_BURST = 20  # Connections a source may open back to back before its rate applies
+DEFAULT_MAX_SOURCES = 65536  # Source IPs with bucket state; the least recently seen is evicted first
+
+RATE_LIMITED = "rate_limited"
+CONNECTION_LIMIT = "connection_limit"
+REASONS = (RATE_LIMITED, CONNECTION_LIMIT)
+
+_LINGER_RESET = struct.pack("ii", 1, 0)  # SO_LINGER on with a zero timeout: close() sends RST
+
+
+def close_now(client_socket):
+    """Drop a connection with an RST: no FIN exchange and no TIME_WAIT entry left behind."""
+    try:
+        client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, _LINGER_RESET)
+    except OSError:
+        pass
+    client_socket.close()
+
+
+class AdmissionControl:
+    """Per-source-IP token buckets plus a global cap on concurrent connections.
+
+    Runs right after accept(), before any TLS work. Each source IP may open
+    `rate` connections per second with bursts of up to `burst`; bucket state
+    lives in an LRU table of at most `max_sources` entries, so a flood of
+    spoofed or rotating addresses cannot grow memory. An evicted source simply
+    starts again with a full bucket. `max_connections` (0 for no cap) bounds
+    connections admitted but not yet released; that count is also what a
+    graceful shutdown waits on, via wait_idle().
+    """
+
+    def __init__(self, rate=0.0, burst=DEFAULT_BURST, max_sources=DEFAULT_MAX_SOURCES, max_connections=0):
+        self.rate = rate
+        self.burst = burst
+        self.max_sources = max_sources
+        self.max_connections = max_connections
+        self.buckets = OrderedDict()  # ip -> [tokens, last refill time]
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.active = 0
+        self.counters = {"admitted": 0, "sources_evicted": 0, "peak_active_connections": 0}
+        self.counters.update((f"rejected_{reason}", 0) for reason in REASONS)
+
+    def _take_token(self, ip, now):
+        bucket = self.buckets.get(ip)
+        if bucket is None:
+            bucket = self.buckets[ip] = [float(self.burst), now]
+            if len(self.buckets) > self.max_sources:
+                self.buckets.popitem(last=False)
+                self.counters["sources_evicted"] += 1
+        else:
+            self.buckets.move_to_end(ip)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] < 1.0:
+            return False
+        bucket[0] -= 1.0
+        return True
+
+    def admit(self, ip, port):
+        """Return None and count the connection as active, or the reason it is rejected."""
+        now = time.monotonic()
+        with self.lock:
+            if self.max_connections and self.active >= self.max_connections:
+                reason = CONNECTION_LIMIT
+            elif self.rate and not self._take_token(ip, now):
+                reason = RATE_LIMITED
+            else:
+                self.active += 1
+                self.counters["admitted"] += 1
+                if self.active > self.counters["peak_active_connections"]:
+                    self.counters["peak_active_connections"] = self.active
+                return None
+            self.counters[f"rejected_{reason}"] += 1
+        metrics.inc(f"rejected_{reason}", port)
+        return reason
+
+    def admit_socket(self, client_socket, address, port):
+        """admit() for an accepted socket; rejected sockets are reset and closed here."""
+        reason = self.admit(address[0], port)
+        if reason is None:
+            return True
+        connection_log.debug("Rejected %s on port %s: %s", address, port, reason)
+        close_now(client_socket)
+        return False
+
+    def release(self):
+        """Mark one admitted connection as finished."""
+        with self.lock:
+            self.active -= 1
+            if not self.active:
+                self.idle.notify_all()
+
+    def wait_idle(self, timeout):
+        """Block until no admitted connection is open or `timeout` passes; returns how many are left."""
+        with self.idle:
+            self.idle.wait_for(lambda: self.active <= 0, timeout)
+            return self.active
+
+    def stats(self):
+        with self.lock:
+            snapshot = dict(self.counters)
+            snapshot["active_connections"] = self.active
+            snapshot["tracked_sources"] = len(self.buckets)
+        return snapshot
+
+
+def add_admission_arguments(parser):
+    """Add the admission-control options shared by the listener scripts to an argparse parser."""
+    group = parser.add_argument_group("admission control")
+    group.add_argument("--rate-per-ip", type=float, default=0.0,
+                       help="New connections per second allowed from one source IP (0: unlimited)")
+    group.add_argument("--burst-per-ip", type=int, default=DEFAULT_BURST,
+                       help="Connections a source IP may open back to back before --rate-per-ip applies")
+    group.add_argument("--max-sources", type=int, default=DEFAULT_MAX_SOURCES,
+                       help="Source IPs tracked at once; the least recently seen are forgotten first")
+    group.add_argument("--max-connections", type=int, default=0,
+                       help="Concurrent admitted connections across all ports (0: unlimited)")
+    return group
+
+
+def admission_from_args(args, track=False):
+    """Build an AdmissionControl from parsed arguments.
+
+    Returns None when no limit is configured, unless `track` asks for one
+    anyway to count open connections (for a graceful drain).
+    """
+    if not args.rate_per_ip and not args.max_connections and not track:
+        return None
+    return AdmissionControl(rate=args.rate_per_ip, burst=args.burst_per_ip, max_sources=args.max_sources,
+                            max_connections=args.max_connections)
@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import time
+from functools import partial
+
+from connection_journal import DROPPED, ERROR, REJECTED, SERVED
+from http_session import DEFAULT_IDLE_TIMEOUT, PLAIN_RESPONSE, SSL_RESPONSE, serve_connection_async
+from lifecycle import shutdown, wait_for_drain
+from listener_logging import connection_log
+from listener_metrics import metrics
+from socket_tuning import SocketOptions, open_listening_socket
+from tls_config import current_context, server_context
+
+try:
+    import uvloop  # Optional faster event loop
+except ImportError:
+    uvloop = None
+
+HANDSHAKE_TIMEOUT = 10.0
+CLOSE_TIMEOUT = 1.0  # Seconds to wait for a closed connection to finish (the peer's TLS close_notify)
+
+# Per-process counters; only touched from the event loop thread
+stats = {"connections": 0, "requests": 0, "client_errors": 0}
+
+
+async def handle_client(reader, writer, port, ssl_enabled, idle_timeout=DEFAULT_IDLE_TIMEOUT, max_requests=1,
+                        response_cache=None, resumption=None, admission=None, ssl_context=None,
+                        handshake_timeout=HANDSHAKE_TIMEOUT, journal=None):
+    """Serve one client; each connection runs as its own task so slow clients do not stall the port.
+
+    With `ssl_context` the server was started without TLS and the handshake is
+    done and timed here, after admission control has accepted the client.
+    """
+    address = writer.get_extra_info("peername")
+    if admission is not None and admission.admit(address[0], port) is not None:
+        writer.transport.abort()  # Dropped before any TLS work
+        if journal is not None:
+            journal.record(port, address, ssl_enabled, REJECTED)
+        return
+    try:
+        if ssl_context is not None:
+            started = time.monotonic()
+            try:
+                await writer.start_tls(current_context(ssl_context), ssl_handshake_timeout=handshake_timeout)
+                metrics.observe("handshake", port, time.monotonic() - started)
+            except (OSError, asyncio.TimeoutError) as e:
+                metrics.inc("handshake_failures", port)
+                connection_log.error("SSL handshake error on port %s: %s", port, e)
+                writer.transport.abort()
+                if journal is not None:
+                    journal.record(port, address, True, DROPPED)
+                return
+        await _serve_client(reader, writer, port, address, ssl_enabled, idle_timeout, max_requests, response_cache,
+                            resumption, journal)
+    finally:
+        if admission is not None:
+            admission.release()
+
+
+async def _serve_client(reader, writer, port, address, ssl_enabled, idle_timeout, max_requests, response_cache,
+                        resumption, journal):
+    started, began = time.time(), time.monotonic()
+    outcome = SERVED
+    stats["connections"] += 1
+    metrics.inc("accepts", port)
+    ssl_object = writer.get_extra_info("ssl_object")
+    if ssl_object is not None and resumption is not None:
+        resumption.record(ssl_object)
+    connection_log.info("New connection from %s on port %s", address, port)
+    response = SSL_RESPONSE if ssl_enabled else PLAIN_RESPONSE
+    pick_response = response_cache.picker(response) if response_cache else lambda request: response
+    try:
+        stats["requests"] += await serve_connection_async(
+            reader, writer, port, pick_response,
+            idle_timeout=idle_timeout, max_requests=max_requests,
+        )
+    except Exception as client_error:
+        outcome = ERROR
+        stats["client_errors"] += 1
+        metrics.inc("request_errors", port)
+        connection_log.error("Error handling client request on port %s: %s", port, client_error)
+    finally:
+        writer.close()
+        try:
+            await asyncio.wait_for(writer.wait_closed(), CLOSE_TIMEOUT)
+        except Exception:
+            pass  # Peer already went away, or never acknowledged the close
+        if journal is not None:
+            journal.record(port, address, ssl_enabled, outcome, time.monotonic() - began, started)
+
+
+async def serve_ports(ports_to_listen, socket_options=None, handshake_timeout=HANDSHAKE_TIMEOUT,
+                      reuse_port=False, idle_timeout=DEFAULT_IDLE_TIMEOUT, max_requests=1, response_cache=None,
+                      resumption=None, backlog_monitor=None, admission=None, drain_timeout=None, journal=None):
+    """Start one asyncio server per (port, ssl_context) pair and serve them all until cancelled.
+
+    With `drain_timeout`, a graceful stop closes the listening sockets and
+    waits up to that long for `admission`'s open connections to finish.
+    """
+    socket_options = socket_options or SocketOptions()
+    # TLS is started per connection instead of by the server (StreamWriter.start_tls,
+    # Python 3.11+): admission sees clients before any handshake work, and each
+    # handshake is timed and its failures counted, which server-side TLS hides.
+    late_tls = hasattr(asyncio.StreamWriter, "start_tls")
+    servers = []
+    listening = {}
+    for port, context in ports_to_listen:
+        try:
+            # The socket is built by hand so backlog, buffers and TCP_DEFER_ACCEPT
+            # apply; asyncio itself accepts up to `backlog` connections per wakeup
+            # and sets TCP_NODELAY on every transport.
+            server_socket = open_listening_socket(port, socket_options, reuse_port)
+            server = await asyncio.start_server(
+                partial(handle_client, port=port, ssl_enabled=context is not None,
+                        idle_timeout=idle_timeout, max_requests=max_requests, response_cache=response_cache,
+                        resumption=resumption, admission=admission, ssl_context=context if late_tls else None,
+                        handshake_timeout=handshake_timeout, journal=journal),
+                sock=server_socket,
+                ssl=None if late_tls else server_context(context),
+                ssl_handshake_timeout=handshake_timeout if context and not late_tls else None,
+                backlog=socket_options.backlog,
+            )
+        except OSError as e:
+            logging.critical(f"Critical error on port {port}: {e}")
+            continue
+        listening[port] = server_socket
+        if context:
+            logging.info(f"SSL server is securely listening on port {port}...")
+        else:
+            logging.info(f"Non-SSL server is listening on port {port}...")
+        servers.append(server)
+
+    if not servers:
+        logging.critical("No ports could be opened; nothing to serve.")
+        return
+    if backlog_monitor is not None:
+        backlog_monitor.watch(listening)
+    try:
+        if drain_timeout is None:
+            await asyncio.gather(*(server.serve_forever() for server in servers))
+        else:
+            await _serve_until_stopped(servers, admission, drain_timeout)
+    finally:
+        for server in servers:
+            server.close()
+        logging.info("Asyncio servers have been shut down.")
+
+
+async def _serve_until_stopped(servers, admission, drain_timeout):
+    loop = asyncio.get_running_loop()
+    stopped = asyncio.Event()
+    shutdown.on_stop(lambda: loop.call_soon_threadsafe(stopped.set))
+    await stopped.wait()
+    for server in servers:
+        server.close()  # Stops accepting; connections already open keep running
+    # Waiting happens off the loop so the connections being drained keep being served
+    await loop.run_in_executor(None, wait_for_drain, admission, drain_timeout)
+
+
+def run_listeners(ports_to_listen, use_uvloop=False, socket_options=None, handshake_timeout=HANDSHAKE_TIMEOUT,
+                  reuse_port=False, idle_timeout=DEFAULT_IDLE_TIMEOUT, max_requests=1, response_cache=None,
+                  resumption=None, backlog_monitor=None, admission=None, drain_timeout=None, journal=None):
+    """Blocking entry point for the asyncio mode, optionally on uvloop."""
+    if use_uvloop:
+        if uvloop is None:
+            logging.warning("uvloop is not installed; using the default asyncio event loop.")
+        else:
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            logging.info("Using uvloop event loop.")
+    asyncio.run(serve_ports(ports_to_listen, socket_options=socket_options, handshake_timeout=handshake_timeout,
+                            reuse_port=reuse_port, idle_timeout=idle_timeout, max_requests=max_requests,
+                            response_cache=response_cache, resumption=resumption,
+                            backlog_monitor=backlog_monitor, admission=admission,
+                            drain_timeout=drain_timeout, journal=journal))
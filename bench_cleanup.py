@@ -0,0 +1,305 @@
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import random
+import shutil
+import stat
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter, namedtuple
+
+import cleanup_tasks
+from cleanup_engine import DEFAULT_DELETE_WORKERS, remove_tree
+from cleanup_results import CleanupResults
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+DEFAULT_FAN_OUT = 8
+DEFAULT_DEPTH = 3
+DEFAULT_FILES_PER_DIR = 50
+DEFAULT_SIZES = "fixed:0"
+DEFAULT_WORKERS = "1,4,16"
+DEFAULT_REPEAT = 3
+DEFAULT_SEED = 1
+
+# Audit events (sys.addaudithook) raised by the filesystem calls a cleanup makes. os.stat and
+# os.lstat raise none, so stats are not in the counts.
+COUNTED_EVENTS = frozenset(["open", "os.remove", "os.rmdir", "os.scandir", "os.listdir", "os.chmod", "os.rename",
+                            "shutil.rmtree"])
+
+TreeStats = namedtuple("TreeStats", ["files", "directories", "bytes"])
+
+_syscalls = Counter()
+_syscalls_lock = threading.Lock()
+_counting = False
+
+
+def _count_syscall(event, args):
+    if _counting and event in COUNTED_EVENTS:
+        with _syscalls_lock:
+            _syscalls[event] += 1
+
+
+def parse_sizes(spec):
+    """A function drawing file sizes from `spec`: "fixed:N", "uniform:MIN-MAX" or "lognormal:MEDIAN,SIGMA"."""
+    kind, _, value = spec.partition(":")
+    try:
+        if kind == "fixed":
+            size = int(value)
+            return lambda rng: size
+        if kind == "uniform":
+            low, high = (int(part) for part in value.split("-"))
+            return lambda rng: rng.randint(low, high)
+        if kind == "lognormal":
+            median, sigma = (float(part) for part in value.split(","))
+            return lambda rng: int(rng.lognormvariate(math.log(max(median, 1.0)), sigma))
+    except ValueError:
+        pass
+    raise argparse.ArgumentTypeError(f"invalid size distribution {spec!r} "
+                                     "(use fixed:N, uniform:MIN-MAX or lognormal:MEDIAN,SIGMA)")
+
+
+def build_tree(root, fan_out, depth, files_per_dir, sizes=lambda rng: 0, seed=DEFAULT_SEED, read_only=0.0,
+               locked=0.0):
+    """Create a synthetic tree under `root`, the same one for the same arguments and seed.
+
+    A `read_only` fraction of the files is made read-only and a `locked`
+    fraction is returned to be held open during the run (which blocks
+    deletion on Windows only). Returns (TreeStats, locked paths).
+    """
+    rng = random.Random(seed)
+    payload = b""
+    files = directories = total = 0
+    locked_paths = []
+    pending = [(root, depth)]
+    while pending:
+        path, remaining = pending.pop()
+        os.makedirs(path, exist_ok=True)
+        directories += 1
+        for index in range(files_per_dir):
+            file_path = os.path.join(path, f"file{index:05d}.tmp")
+            size = max(0, sizes(rng))
+            if size > len(payload):
+                payload = b"x" * max(size, 2 * len(payload))
+            with open(file_path, "wb") as file:
+                file.write(payload[:size])
+            files += 1
+            total += size
+            if rng.random() < read_only:
+                os.chmod(file_path, stat.S_IREAD)
+            if rng.random() < locked:
+                locked_paths.append(file_path)
+        if remaining:
+            pending.extend((os.path.join(path, f"dir{index:03d}"), remaining - 1) for index in range(fan_out))
+    return TreeStats(files, directories, total), locked_paths
+
+
+def _remaining(root):
+    """(files, bytes) still under `root`."""
+    count = total = 0
+    for directory, _, files in os.walk(root):
+        count += len(files)
+        total += sum(os.lstat(os.path.join(directory, name)).st_size for name in files)
+    return count, total
+
+
+def _force_remove(root):
+    # Read-only leftovers cannot be deleted on Windows until their flag is cleared
+    def clear_read_only(function, path, _):
+        os.chmod(path, stat.S_IWRITE)
+        function(path)
+
+    if os.path.exists(root):
+        shutil.rmtree(root, onerror=clear_read_only)
+
+
+def cleanup_cases(workers, cleanup_workers, work_dir):
+    """{name: function(root)} for every benchmark case; Windows locations are replaced by the synthetic tree."""
+    missing = os.path.join(work_dir, "missing")  # So nothing but the tree under test is touched
+    cases = {"shutil.rmtree": lambda root: shutil.rmtree(root, ignore_errors=True)}
+    for count in workers:
+        # remove_tree logs every survivor; a clean run should have none
+        cases[f"remove_tree-{count}"] = lambda root, count=count: remove_tree(root, workers=count)
+    cases.update({
+        "clear_temp_files": lambda root: cleanup_tasks.clear_temp_files(root, workers=cleanup_workers),
+        "clear_prefetch_files": lambda root: cleanup_tasks.clear_prefetch_files(root, workers=cleanup_workers),
+        "clear_memory_dump_files": lambda root: cleanup_tasks.clear_memory_dump_files([root], workers=cleanup_workers),
+        "clear_application_cache": lambda root: cleanup_tasks.clear_application_cache(
+            cleanup_workers, chrome_cache=root, firefox_dir=missing),
+        "clear_windows_error_reporting_files": lambda root: cleanup_tasks.clear_windows_error_reporting_files(
+            cleanup_workers, error_dirs=[root]),
+        "clear_windows_update_cache": lambda root: cleanup_tasks.clear_windows_update_cache(
+            cleanup_workers, update_cache_dir=root),
+        "clear_edge_browser_data": lambda root: cleanup_tasks.clear_edge_browser_data(
+            cleanup_workers, edge_cache=root, edge_cookies=missing),
+    })
+    return cases
+
+
+def time_case(name, run, args, work_dir):
+    """Build a fresh tree and time `run(root)` on it, `args.repeat` times; returns the best and median runs.
+
+    Peak memory comes from one more, untimed run under tracemalloc, which
+    would otherwise slow the timed ones down.
+    """
+    global _counting
+    runs = []
+    syscalls = {}
+    peak_memory = None
+    remaining = remaining_bytes = skipped = 0
+    for attempt in range(args.repeat + (0 if args.no_memory else 1)):
+        traced = attempt == args.repeat
+        root = os.path.join(work_dir, f"{name}-{attempt}")
+        tree, locked = build_tree(root, args.fan_out, args.depth, args.files_per_dir, parse_sizes(args.sizes),
+                                  args.seed, args.read_only, args.locked)
+        handles = [open(path, "rb") for path in locked]
+        cleanup_tasks.results = CleanupResults(failures_path=None, progress_interval=None)
+        _syscalls.clear()
+        if traced:
+            tracemalloc.start()
+        if not args.log_cleanup:
+            logging.disable(logging.INFO)  # Per-file log lines would swamp the numbers
+        _counting = True
+        started = time.perf_counter()
+        try:
+            run(root)
+        finally:
+            elapsed = time.perf_counter() - started
+            _counting = False
+            logging.disable(logging.NOTSET)
+            for handle in handles:
+                handle.close()
+        if traced:
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            runs.append(elapsed)
+            syscalls = dict(sorted(_syscalls.items()))
+            remaining, remaining_bytes = _remaining(root)
+            skipped = cleanup_tasks.results.failures
+        _force_remove(root)
+    runs.sort()
+    median = runs[len(runs) // 2]
+    result = {"files": tree.files, "directories": tree.directories, "bytes": tree.bytes,
+              "entries": tree.files + tree.directories, "best_seconds": round(runs[0], 4),
+              "median_seconds": round(median, 4),
+              "deleted_files": tree.files - remaining, "deleted_bytes": tree.bytes - remaining_bytes,
+              # Throughput counts what was deleted: the top-level cases leave the subdirectories alone
+              "files_per_sec": round((tree.files - remaining) / median) if median else None,
+              "bytes_per_sec": round((tree.bytes - remaining_bytes) / median) if median else None,
+              "entries_per_sec": round((tree.files + tree.directories) / median) if median else None,
+              "syscalls": syscalls, "peak_memory_bytes": peak_memory, "remaining_files": remaining,
+              "skipped": skipped}
+    logging.info(f"{name}: {result['median_seconds']}s median, {result['files_per_sec']} files/s, "
+                 f"{sum(syscalls.values())} audited calls"
+                 + (f", {peak_memory / 2**20:.1f} MiB peak" if peak_memory is not None else "")
+                 + (f", {remaining} files left" if remaining else ""))
+    return result
+
+
+def compare(current, baseline_path):
+    """Log median time, throughput and peak memory changes against an earlier results file."""
+    with open(baseline_path, encoding="utf-8") as file:
+        baseline = json.load(file)["results"]
+
+    def change(before, after):
+        return f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+
+    for name, result in current.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        line = (f"{name}: {before['median_seconds']}s -> {result['median_seconds']}s "
+                f"({change(before['median_seconds'], result['median_seconds'])})")
+        if before.get("files_per_sec") and result.get("files_per_sec"):
+            line += (f", {before['files_per_sec']} -> {result['files_per_sec']} files/s "
+                     f"({change(before['files_per_sec'], result['files_per_sec'])})")
+        if before.get("peak_memory_bytes") and result.get("peak_memory_bytes"):
+            line += f", peak memory {change(before['peak_memory_bytes'], result['peak_memory_bytes'])}"
+        if before.get("syscalls") and result.get("syscalls"):
+            line += (f", audited calls {sum(before['syscalls'].values())} -> "
+                     f"{sum(result['syscalls'].values())}")
+        logging.info(line)
+
+
+def size_spec(spec):
+    """argparse type for --sizes: checks the distribution but keeps the text, which goes into the report."""
+    parse_sizes(spec)
+    return spec
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the cleanup functions on synthetic directory trees.")
+    parser.add_argument("--dir", help="Where to build the trees (default: the system temp dir; try a tmpfs "
+                                      "or a real disk to see the difference)")
+    parser.add_argument("--fan-out", type=int, default=DEFAULT_FAN_OUT, help="Subdirectories per directory")
+    parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH, help="Levels of subdirectories below the root")
+    parser.add_argument("--files-per-dir", type=int, default=DEFAULT_FILES_PER_DIR, help="Files in every directory")
+    parser.add_argument("--sizes", type=size_spec, default=DEFAULT_SIZES,
+                        help="File size distribution: fixed:N, uniform:MIN-MAX or lognormal:MEDIAN,SIGMA "
+                             "(default: %(default)s)")
+    parser.add_argument("--file-size", type=int, help="Shorthand for --sizes fixed:N")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Seed for sizes and read-only/locked picks")
+    parser.add_argument("--read-only", type=float, default=0.0, help="Fraction of files made read-only")
+    parser.add_argument("--locked", type=float, default=0.0,
+                        help="Fraction of files held open during the run (blocks deletion on Windows only)")
+    parser.add_argument("--cases", help="Comma-separated cases to run (default: all)")
+    parser.add_argument("--workers", default=DEFAULT_WORKERS, help="Comma-separated remove_tree worker counts")
+    parser.add_argument("--cleanup-workers", type=int, default=DEFAULT_DELETE_WORKERS,
+                        help="Workers for the clear_* cases (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Runs per case (best and median kept)")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the extra tracemalloc run per case")
+    parser.add_argument("--log-cleanup", action="store_true", help="Keep the cleanup functions' INFO logging on")
+    parser.add_argument("--output", help="Write results as JSON to this file (default: stdout)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args(argv)
+    if args.file_size is not None:
+        args.sizes = f"fixed:{args.file_size}"
+    return args
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    args = parse_args(argv)
+    sys.addaudithook(_count_syscall)
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="bench-cleanup-", dir=args.dir) as work_dir:
+        cases = cleanup_cases([int(count) for count in args.workers.split(",")], args.cleanup_workers, work_dir)
+        names = args.cases.split(",") if args.cases else list(cases)
+        unknown = [name for name in names if name not in cases]
+        if unknown:
+            raise SystemExit(f"Unknown cases: {', '.join(unknown)} (known: {', '.join(cases)})")
+        for name in names:
+            results[name] = time_case(name, cases[name], args, work_dir)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": results,
+    }
+    if resource is not None:
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        report["host"]["max_rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text + "\n")
+        logging.info(f"Results written to {args.output}")
+    else:
+        print(text)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import shutil
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Windows
+
+try:
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+except ImportError:
+    x509 = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCANNER_SCRIPT = os.path.join(HERE, "ports scanner.py")
+ENGINE_SCRIPT = os.path.join(HERE, "portlistener3.py")
+
+DEFAULT_SSL_PORT = 18443  # High loopback ports, no root needed
+DEFAULT_PLAIN_PORT = 18080
+DEFAULT_DURATION = 10.0
+DEFAULT_CONCURRENCY = 50
+DEFAULT_REQUESTS_PER_CONNECTION = 100
+STARTUP_TIMEOUT = 15.0
+SAMPLE_INTERVAL = 0.1  # Seconds between /proc samples of the server
+
+# name -> (tls, keep_alive)
+SCENARIOS = {
+    "plain-oneshot": (False, False),
+    "plain-keepalive": (False, True),
+    "tls-oneshot": (True, False),
+    "tls-keepalive": (True, True),
+}
+DEFAULT_SCENARIOS = ",".join(SCENARIOS)
+
+REQUEST = b"GET / HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n"
+CLOSE_REQUEST = b"GET / HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n"
+
+
+def make_self_signed_cert(directory):
+    """Write a throwaway localhost cert.pem/key.pem into `directory` and return their paths.
+
+    Uses the cryptography package when installed, otherwise the openssl CLI;
+    neither touches the network.
+    """
+    cert_file = os.path.join(directory, "cert.pem")
+    key_file = os.path.join(directory, "key.pem")
+    if x509 is not None:
+        key = ec.generate_private_key(ec.SECP256R1())
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+        now = time.time()
+        cert = (x509.CertificateBuilder()
+                .subject_name(name).issuer_name(name)
+                .public_key(key.public_key())
+                .serial_number(x509.random_serial_number())
+                .not_valid_before(_utc(now - 60)).not_valid_after(_utc(now + 86400))
+                .sign(key, hashes.SHA256()))
+        with open(key_file, "wb") as file:
+            file.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                         serialization.NoEncryption()))
+        with open(cert_file, "wb") as file:
+            file.write(cert.public_bytes(serialization.Encoding.PEM))
+        return cert_file, key_file
+
+    openssl = shutil.which("openssl")
+    if openssl is None:
+        raise RuntimeError("Generating a test certificate needs the cryptography package or the openssl CLI")
+    subprocess.run([openssl, "req", "-x509", "-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1",
+                    "-nodes", "-keyout", key_file, "-out", cert_file, "-days", "1", "-subj", "/CN=localhost"],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return cert_file, key_file
+
+
+def _utc(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def summarize_latencies(values):
+    """p50/p99/p999/mean/max in milliseconds."""
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+        "p999_ms": round(percentile(values, 0.999) * 1000, 3),
+        "mean_ms": round(sum(values) / len(values) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3),
+    }
+
+
+class ProcessSampler:
+    """Polls /proc/<pid>/status for peak RSS (VmHWM) and the highest thread count seen."""
+
+    def __init__(self, pid, interval=SAMPLE_INTERVAL):
+        self.path = f"/proc/{pid}/status"
+        self.interval = interval
+        self.peak_rss_kb = None
+        self.peak_threads = None
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="bench-sampler", daemon=True)
+
+    def start(self):
+        if os.path.exists(self.path):
+            self.thread.start()
+        return self
+
+    def sample(self):
+        try:
+            with open(self.path) as status:
+                for line in status:
+                    if line.startswith("VmHWM:"):
+                        self.peak_rss_kb = int(line.split()[1])
+                    elif line.startswith("Threads:"):
+                        self.peak_threads = max(self.peak_threads or 0, int(line.split()[1]))
+        except (OSError, ValueError):
+            pass  # Process already gone
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        if self.thread.is_alive():
+            self.sample()
+            self.stop_event.set()
+            self.thread.join()
+        return {"peak_rss_kb": self.peak_rss_kb, "peak_threads": self.peak_threads}
+
+
+def server_command(args, cert_file, key_file, keep_alive):
+    if args.target == "engine":
+        return [sys.executable, ENGINE_SCRIPT, "--cert", cert_file, "--key", key_file,
+                "--first-port", str(args.ssl_port), "--last-port", str(args.ssl_port)]
+    command = [sys.executable, SCANNER_SCRIPT, "--cert", cert_file, "--key", key_file,
+               "--ssl-ports", str(args.ssl_port), "--plain-ports", str(args.plain_port),
+               "--mode", args.mode, "--workers", str(args.workers),
+               "--log-sample", str(args.log_sample), "--stats-interval", "3600"]
+    if keep_alive:
+        command += ["--keep-alive", "--max-requests", str(args.requests_per_connection)]
+    return command + args.server_arg
+
+
+def wait_for_port(port, process, timeout=STARTUP_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return True
+        except OSError:
+            time.sleep(0.05)
+    return False
+
+
+class RateLimiter:
+    """Spaces connection attempts `1/rate` seconds apart across all client tasks."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.next_slot = time.monotonic()
+
+    async def wait(self):
+        now = time.monotonic()
+        slot = max(self.next_slot, now)
+        self.next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+async def read_response(reader):
+    """Read one HTTP response; returns False if the server closed the connection."""
+    head = await reader.readuntil(b"\r\n\r\n")
+    length = 0
+    keep_open = True
+    for line in head.split(b"\r\n")[1:]:
+        name, _, value = line.partition(b":")
+        name = name.strip().lower()
+        if name == b"content-length":
+            length = int(value)
+        elif name == b"connection" and value.strip().lower() == b"close":
+            keep_open = False
+    if length:
+        await reader.readexactly(length)
+    return keep_open
+
+
+async def client_task(results, deadline, port, client_context, keep_alive, requests_per_connection, limiter,
+                      handshake_only):
+    while time.monotonic() < deadline:
+        if limiter is not None:
+            await limiter.wait()
+            if time.monotonic() >= deadline:
+                return
+        writer = None
+        started = time.monotonic()
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port, ssl=client_context,
+                                                           server_hostname="localhost" if client_context else None)
+            results["connect"].append(time.monotonic() - started)
+            results["connections"] += 1
+            if handshake_only:
+                await reader.read()  # The engine closes right after the handshake
+                continue
+            budget = requests_per_connection if keep_alive else 1
+            for sent in range(1, budget + 1):
+                last = sent == budget or time.monotonic() >= deadline
+                request_started = time.monotonic()
+                writer.write(CLOSE_REQUEST if last else REQUEST)
+                keep_open = await read_response(reader)
+                # One-shot latency covers connect + handshake + request, keep-alive just the request
+                results["latency"].append(time.monotonic() - (request_started if keep_alive else started))
+                results["requests"] += 1
+                if last or not keep_open:
+                    break
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ssl.SSLError, ValueError) as e:
+            results["errors"] += 1
+            results["error_types"][type(e).__name__] = results["error_types"].get(type(e).__name__, 0) + 1
+        finally:
+            if writer is not None:
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except (OSError, ssl.SSLError):
+                    pass
+
+
+async def drive_load(port, tls, keep_alive, args):
+    client_context = None
+    if tls:
+        client_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        client_context.check_hostname = False
+        client_context.verify_mode = ssl.CERT_NONE  # Throwaway self-signed cert
+    results = {"connections": 0, "requests": 0, "errors": 0, "error_types": {}, "latency": [], "connect": []}
+    limiter = RateLimiter(args.rate) if args.rate else None
+    started = time.monotonic()
+    deadline = started + args.duration
+    await asyncio.gather(*(client_task(results, deadline, port, client_context, keep_alive,
+                                       args.requests_per_connection, limiter, args.target == "engine")
+                           for _ in range(args.concurrency)))
+    results["elapsed"] = time.monotonic() - started
+    return results
+
+
+def run_scenario(name, args, cert_file, key_file, work_dir):
+    tls, keep_alive = SCENARIOS[name]
+    if args.target == "engine" and not tls:
+        logging.warning(f"Skipping {name}: the engine target only serves TLS")
+        return None
+    port = args.ssl_port if tls else args.plain_port
+    log_path = os.path.join(work_dir, f"{name}.log")
+    with open(log_path, "wb") as server_log:
+        process = subprocess.Popen(server_command(args, cert_file, key_file, keep_alive),
+                                   stdout=server_log, stderr=subprocess.STDOUT, cwd=HERE)
+    try:
+        if not wait_for_port(port, process):
+            with open(log_path, errors="replace") as server_log:
+                tail = server_log.read()[-2000:]
+            raise RuntimeError(f"Listener for {name} did not start on port {port}:\n{tail}")
+        sampler = ProcessSampler(process.pid).start()
+        logging.info(f"Running {name} for {args.duration:.0f}s against port {port}")
+        raw = asyncio.run(drive_load(port, tls, keep_alive, args))
+        server = sampler.stop()
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    elapsed = raw["elapsed"]
+    return {
+        "tls": tls,
+        "keep_alive": keep_alive,
+        "elapsed_seconds": round(elapsed, 3),
+        "requests": raw["requests"],
+        "connections": raw["connections"],
+        "errors": raw["errors"],
+        "error_types": raw["error_types"],
+        "requests_per_sec": round(raw["requests"] / elapsed, 1),
+        "connections_per_sec": round(raw["connections"] / elapsed, 1),
+        "handshakes_per_sec": round(raw["connections"] / elapsed, 1) if tls else 0.0,
+        "latency": summarize_latencies(raw["latency"]),
+        "connect_latency": summarize_latencies(raw["connect"]),
+        "server_peak_rss_kb": server["peak_rss_kb"],
+        "server_peak_threads": server["peak_threads"],
+    }
+
+
+def compare(current, baseline_path):
+    """Log requests/sec and p99 changes against an earlier results file."""
+    with open(baseline_path, encoding="utf-8") as file:
+        baseline = json.load(file)["scenarios"]
+    for name, result in current.items():
+        before = baseline.get(name)
+        if not result or not before:
+            continue
+        # The engine target serves no requests, so fall back to connections
+        rps_before = before["requests_per_sec"] or before["connections_per_sec"]
+        rps_now = result["requests_per_sec"] or result["connections_per_sec"]
+        p99_before = before["latency"].get("p99_ms") or before["connect_latency"].get("p99_ms")
+        p99_now = result["latency"].get("p99_ms") or result["connect_latency"].get("p99_ms")
+        change = (rps_now - rps_before) / rps_before * 100 if rps_before else 0.0
+        logging.info(f"{name}: {rps_before} -> {rps_now} per sec ({change:+.1f}%), p99 {p99_before} -> {p99_now} ms")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Loopback load benchmark for the port listeners.")
+    parser.add_argument("--target", choices=("scanner", "engine"), default="scanner",
+                        help="scanner: 'ports scanner.py' HTTP listener; engine: portlistener3 TLS accept loop")
+    parser.add_argument("--scenarios", default=DEFAULT_SCENARIOS,
+                        help=f"Comma-separated scenarios to run (default: {DEFAULT_SCENARIOS})")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="Seconds of load per scenario")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Concurrent client connections")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="New connections per second across all clients (0: as fast as possible)")
+    parser.add_argument("--requests-per-connection", type=int, default=DEFAULT_REQUESTS_PER_CONNECTION,
+                        help="Requests sent on each kept-alive connection")
+    parser.add_argument("--mode", choices=("threads", "asyncio"), default="threads", help="Listener serving mode")
+    parser.add_argument("--workers", type=int, default=1, help="Listener worker processes")
+    parser.add_argument("--log-sample", type=int, default=1000,
+                        help="Listener logs one in N connection events, so logging does not dominate")
+    parser.add_argument("--ssl-port", type=int, default=DEFAULT_SSL_PORT)
+    parser.add_argument("--plain-port", type=int, default=DEFAULT_PLAIN_PORT)
+    parser.add_argument("--server-arg", action="append", default=[],
+                        help="Extra argument passed to the listener (repeatable), e.g. --server-arg=--uvloop")
+    parser.add_argument("--output", help="Write results as JSON to this file (default: stdout)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios.split(",") if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    return args
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    args = parse_args(argv)
+    scenarios = {}
+    with tempfile.TemporaryDirectory(prefix="bench-listeners-") as work_dir:
+        cert_file, key_file = make_self_signed_cert(work_dir)
+        for name in args.scenarios.split(","):
+            scenarios[name] = run_scenario(name, args, cert_file, key_file, work_dir)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        # ru_maxrss is KiB on Linux
+        "client_peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None,
+        "scenarios": scenarios,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text + "\n")
+        logging.info(f"Results written to {args.output}")
+    else:
+        print(text)
+    if args.compare:
+        compare(scenarios, args.compare)
+
+
+if __name__ == "__main__":
+    main()
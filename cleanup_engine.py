@@ -0,0 +1,357 @@
+import errno
+import itertools
+import logging
+import os
+import stat
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# Deletions wait on the filesystem rather than the CPU, so more threads than cores pay off
+DEFAULT_DELETE_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+DELETE_BATCH = 128  # Paths handed to a worker at a time
+
+MAX_INLINE_DEPTH = 64  # Deeper directories always go to the pool, keeping recursion shallow
+MAX_KEPT_FAILURES = 1000  # Failures returned when a recorder is given; the recorder counts the rest
+
+DeletionResult = namedtuple("DeletionResult", ["deleted", "failed"])  # failed: [(path, error), ...]
+
+# Walking by directory descriptor needs these to accept dir_fd (Linux, the BSDs, macOS; not Windows)
+_USE_DIR_FD = {os.open, os.unlink, os.rmdir} <= os.supports_dir_fd and os.scandir in os.supports_fd
+_DIR_FLAGS = os.O_RDONLY | getattr(os, "O_DIRECTORY", 0) | getattr(os, "O_NOFOLLOW", 0)
+
+
+def _entry_size(entry):
+    try:
+        return entry.stat(follow_symlinks=False).st_size  # Free on Windows, an lstat elsewhere
+    except OSError:
+        return 0
+
+
+def _delete_batch(batch, quiet):
+    # batch: [(path, size)]; size is 0 when nobody asked for byte counts
+    deleted = freed = 0
+    failed = []
+    for path, size in batch:
+        try:
+            os.remove(path)
+            deleted += 1
+            freed += size
+            logging.debug(f"Cleared: {path}")
+        except FileNotFoundError:
+            pass  # Already gone, e.g. removed by its owner since it was listed
+        except OSError as e:
+            if not quiet:
+                logging.warning(f"Skipped: {path} ({e})")
+            failed.append((path, e))
+    return deleted, freed, failed
+
+
+def _keep_failures(failed, new, recorder):
+    if recorder is None:
+        failed.extend(new)
+    else:
+        failed.extend(new[:max(0, MAX_KEPT_FAILURES - len(failed))])
+
+
+def _run_batches(batches, workers, skipped, recorder=None, on_failures=None):
+    """Delete each batch of (path, size) on a bounded pool; at most 2 * workers batches are queued at once.
+
+    `on_failures`, if given, is called from the pool with each batch's failed paths.
+    """
+    totals = {"deleted": 0}
+    failed = []
+    lock = threading.Lock()
+    slots = threading.BoundedSemaphore(workers * 2)
+
+    def collect(future):
+        try:
+            batch_deleted, batch_freed, batch_failed = future.result()
+            if recorder is not None:
+                recorder.record(batch_deleted, batch_freed, failures=batch_failed)
+            if on_failures is not None and batch_failed:
+                on_failures([path for path, _ in batch_failed])
+            with lock:
+                totals["deleted"] += batch_deleted
+                _keep_failures(failed, batch_failed, recorder)
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cleanup") as pool:
+        for batch in batches:
+            slots.acquire()  # Listing never runs far ahead of deleting
+            pool.submit(_delete_batch, batch, recorder is not None).add_done_callback(collect)
+    if skipped is not None:
+        skipped.extend(path for path, _ in failed)
+    return DeletionResult(totals["deleted"], failed)
+
+
+def _file_batches(root, recursive, batch_size, walk=None, sizes=False):
+    # os.scandir entries carry their full path and type, so no join or stat per file
+    batch = []
+    pending = [root]
+    while pending:
+        directory = pending.pop()
+        if walk is not None:
+            unchanged = walk.visit(directory)
+            if unchanged is not None:
+                # Nothing new since the last run: only its locked files that are due again
+                batch.extend((path, 0) for path in walk.due_retries(directory))
+                if recursive:
+                    pending.extend(unchanged)
+                continue
+        subdirectories = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                    except OSError:
+                        is_dir = False
+                    if is_dir:
+                        subdirectories.append(entry.path)
+                        continue
+                    if walk is not None and walk.should_skip(entry.path):
+                        continue
+                    batch.append((entry.path, _entry_size(entry) if sizes else 0))
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = []
+        except OSError as e:
+            logging.debug(f"Cannot list {e.filename}: {e}")  # Like os.walk, unreadable directories are passed over
+            continue
+        if walk is not None:
+            walk.listed_directory(directory, subdirectories)
+        if recursive:
+            pending.extend(subdirectories)
+    if batch:
+        yield batch
+
+
+def delete_files(root, workers=DEFAULT_DELETE_WORKERS, recursive=True, skipped=None, batch_size=DELETE_BATCH,
+                 index=None, recorder=None):
+    """Delete the files under `root` (its top level only unless `recursive`), leaving directories in place.
+
+    Directories are listed with os.scandir on the calling thread while up to
+    `workers` threads delete. Paths that could not be deleted are appended
+    to `skipped` and returned with their errors. With a ScanIndex as `index`,
+    directories unchanged since the last run are not listed again and known
+    locked files are only retried once their back-off expires.
+
+    With a TaskRecorder as `recorder`, files, bytes and failures are counted
+    there a batch at a time, failures are logged at DEBUG rather than one
+    WARNING each, and at most MAX_KEPT_FAILURES are returned.
+    """
+    walk = index.open_walk(root) if index is not None else None
+    batches = _file_batches(root, recursive, batch_size, walk, sizes=recorder is not None)
+    # The index schedules a retry for every failure, not just those returned
+    on_failures = partial(index.record_failures, walk) if walk is not None else None
+    result = _run_batches(batches, max(1, workers), skipped, recorder, on_failures)
+    if walk is not None:
+        index.save_walk(walk)
+        walk.report()
+    return result
+
+
+def delete_paths(paths, workers=DEFAULT_DELETE_WORKERS, skipped=None, batch_size=DELETE_BATCH, recorder=None,
+                 sizes=None):
+    """Delete the given file paths; failures are handled as in delete_files().
+
+    `sizes`, if known, are the files' sizes in the same order, for the recorder's byte count.
+    """
+    items = list(zip(paths, sizes if sizes is not None else itertools.repeat(0)))
+    batches = (items[start:start + batch_size] for start in range(0, len(items), batch_size))
+    return _run_batches(batches, max(1, workers), skipped, recorder)
+
+
+def _unlink(name, path, dir_fd):
+    try:
+        os.unlink(name if dir_fd is not None else path, dir_fd=dir_fd)
+    except PermissionError:
+        if os.name != "nt":
+            raise
+        os.chmod(path, stat.S_IWRITE)  # Read-only files cannot be deleted on Windows until the flag is cleared
+        os.unlink(path)
+
+
+class _Directory:
+    """A directory being removed; `pending` counts its unfinished subdirectories plus its own listing."""
+
+    __slots__ = ("parent", "name", "path", "depth", "fd", "pending", "blocked")
+
+    def __init__(self, parent, name, path):
+        self.parent = parent
+        self.name = name
+        self.path = path
+        self.depth = parent.depth + 1 if parent is not None else 0
+        self.fd = None
+        self.pending = 1
+        self.blocked = False  # Something inside survived, so this directory cannot be removed
+
+
+class _TreeRemover:
+    """Removes a tree with independent subdirectories handled by different pool threads.
+
+    A directory is listed once; its files are unlinked right away and its
+    subdirectories are queued for the pool, or walked inline once enough work
+    is queued. The last subdirectory to finish removes its parent, so no
+    thread ever waits on another. Where the platform allows it, everything is
+    done relative to an open directory descriptor, so paths are never
+    resolved again and a directory swapped for a symlink is not followed.
+    """
+
+    def __init__(self, workers, keep_root=False, recorder=None):
+        self.keep_root = keep_root
+        self.recorder = recorder
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rmtree")
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.max_queued = workers * 2
+        self.removed = 0
+        self.failed = []
+        self.error = None  # First unexpected exception from a clear(); remove() raises it
+        self.finished = threading.Event()
+
+    def _fail(self, directory, path, error):
+        with self.lock:
+            _keep_failures(self.failed, [(path, error)], self.recorder)
+            directory.blocked = True
+        if self.recorder is None:
+            logging.warning(f"Skipped: {path} ({error})")
+        else:
+            self.recorder.failed(path, error)
+
+    def _queue(self, directory):
+        with self.lock:
+            if self.queued >= self.max_queued and directory.depth <= MAX_INLINE_DEPTH:
+                return False
+            self.queued += 1
+        self.pool.submit(self._run_queued, directory)
+        return True
+
+    def _run_queued(self, directory):
+        with self.lock:
+            self.queued -= 1
+        self.clear(directory)
+
+    def clear(self, directory):
+        """Empty `directory` and, once its last subdirectory is gone, remove it."""
+        try:
+            self._clear(directory)
+        except Exception as e:
+            # Anything but an OSError is a bug; keep the directory and let remove() raise it
+            with self.lock:
+                directory.blocked = True
+                if self.error is None:
+                    self.error = e
+        finally:
+            self._done(directory)  # Always, or the parents' pending counts never reach zero
+
+    def _clear(self, directory):
+        parent_fd = directory.parent.fd if directory.parent is not None else None
+        try:
+            if _USE_DIR_FD:
+                directory.fd = os.open(directory.name if parent_fd is not None else directory.path, _DIR_FLAGS,
+                                       dir_fd=parent_fd)
+                listing = os.scandir(directory.fd)
+            else:
+                listing = os.scandir(directory.path)
+        except OSError as e:
+            self._fail(directory, directory.path, e)
+            return
+        removed = freed = 0
+        try:
+            with listing as entries:
+                for entry in entries:
+                    path = os.path.join(directory.path, entry.name)
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                    except OSError:
+                        is_dir = False
+                    if is_dir:
+                        child = _Directory(directory, entry.name, path)
+                        with self.lock:
+                            directory.pending += 1
+                        if not self._queue(child):
+                            self.clear(child)
+                        continue
+                    size = _entry_size(entry) if self.recorder is not None else 0
+                    try:
+                        _unlink(entry.name, path, directory.fd)
+                        removed += 1
+                        freed += size
+                    except FileNotFoundError:
+                        pass  # Already gone
+                    except OSError as e:
+                        self._fail(directory, path, e)
+        except OSError as e:
+            self._fail(directory, directory.path, e)
+        with self.lock:
+            self.removed += removed
+        if self.recorder is not None:
+            self.recorder.record(removed, freed)
+
+    def _done(self, directory):
+        # One piece of `directory` is finished; the last one removes it and reports to its parent
+        while directory is not None:
+            with self.lock:
+                directory.pending -= 1
+                if directory.pending:
+                    return
+            if directory.fd is not None:
+                os.close(directory.fd)
+                directory.fd = None
+            parent = directory.parent
+            if directory.blocked:
+                if parent is not None:
+                    parent.blocked = True  # Survivors were already reported; the directories above them stay
+            elif parent is not None or not self.keep_root:
+                try:
+                    if parent is not None and _USE_DIR_FD:
+                        os.rmdir(directory.name, dir_fd=parent.fd)
+                    else:
+                        os.rmdir(directory.path)
+                    with self.lock:
+                        self.removed += 1
+                    if self.recorder is not None:
+                        self.recorder.record(directories=1)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    self._fail(parent or directory, directory.path, e)
+            if parent is None:
+                self.finished.set()
+            directory = parent
+
+    def remove(self, root):
+        self.clear(_Directory(None, os.path.basename(root), root))
+        self.finished.wait()
+        self.pool.shutdown()
+        if self.error is not None:
+            raise self.error
+        return DeletionResult(self.removed, self.failed)
+
+
+def remove_tree(root, workers=DEFAULT_DELETE_WORKERS, skipped=None, keep_root=False, recorder=None):
+    """Remove `root` and everything below it, carrying on past entries that cannot be removed.
+
+    A faster replacement for shutil.rmtree: subtrees are removed in parallel
+    on up to `workers` threads. Every file or directory that survived is
+    logged, appended to `skipped` and returned with its error; the
+    directories above a survivor are necessarily kept too and are not listed
+    separately. With `keep_root` only the contents are removed. A symlink
+    given as `root` is refused, as shutil.rmtree does. A `recorder` is
+    used as in delete_files().
+    """
+    if os.path.islink(root):
+        error = OSError(errno.ELOOP, "Refusing to remove a tree through a symbolic link", root)
+        logging.warning(f"Skipped: {root} ({error})")
+        if recorder is not None:
+            recorder.failed(root, error)
+        result = DeletionResult(0, [(root, error)])
+    else:
+        result = _TreeRemover(max(1, workers), keep_root, recorder).remove(root)
+    if skipped is not None:
+        skipped.extend(path for path, _ in result.failed)
+    return result
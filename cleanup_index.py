@@ -0,0 +1,179 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_RETRY_BACKOFF = 60 * 60.0  # Seconds before a locked file is tried again; doubles with every failure
+MAX_RETRY_BACKOFF = 7 * 24 * 60 * 60.0
+# A directory modified this recently may change again within the same timestamp tick (FAT counts in
+# 2-second steps), so its mtime cannot vouch for its contents yet
+RACY_WINDOW_NS = 2 * 10**9
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    root TEXT NOT NULL, path TEXT NOT NULL, parent TEXT, mtime_ns INTEGER,
+    PRIMARY KEY (root, path));
+CREATE TABLE IF NOT EXISTS failures (
+    root TEXT NOT NULL, path TEXT NOT NULL, directory TEXT NOT NULL, failures INTEGER NOT NULL,
+    next_attempt REAL NOT NULL, PRIMARY KEY (root, path));
+CREATE TEMP TABLE new_failures (
+    root TEXT NOT NULL, path TEXT NOT NULL, directory TEXT NOT NULL, failures INTEGER NOT NULL,
+    next_attempt REAL NOT NULL, PRIMARY KEY (root, path));
+"""
+
+
+class IndexedWalk:
+    """One walk of `root` checked against what the index recorded last time.
+
+    A directory whose mtime is unchanged still holds exactly what was left
+    after the last run: its locked files and its subdirectories. It is not
+    listed again; its subdirectories are taken from the index and visited
+    in turn, since a directory's mtime says nothing about deeper levels.
+
+    The mtime stored is the one taken before listing, so a directory this
+    run deleted from is listed once more next time and skipped from then on.
+    Re-statting after the sweep would skip it a run sooner, but could not
+    tell our last unlink from a file added between the listing and that
+    unlink; only another listing could, which is what skipping saves.
+    """
+
+    def __init__(self, root, directories, failures, backoff, max_backoff):
+        self.root = root
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.now = time.time()
+        self.old = directories  # {path: (parent, mtime_ns)}
+        self.children = {}
+        for path, (parent, _) in directories.items():
+            self.children.setdefault(parent, []).append(path)
+        self.failures = failures  # {path: (directory, failures, next_attempt)}
+        self.failures_by_directory = {}
+        for path, (directory, _, _) in failures.items():
+            self.failures_by_directory.setdefault(directory, []).append(path)
+        self.seen = {}  # Directories of this walk: {path: (parent, mtime_ns or None)}
+        self.mtimes = {}  # Taken before listing, kept only once the listing succeeds
+        self.parents = {root: None}
+        self.deferred = set()
+        self.listed = self.skipped = self.retried = 0
+
+    def visit(self, directory):
+        """The recorded subdirectories if `directory` is unchanged and need not be listed, else None."""
+        parent = self.parents.get(directory)
+        # Recorded without an mtime until listed, so a directory that cannot be listed is tried again next time
+        self.seen[directory] = (parent, None)
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            return None  # Let the listing report it
+        if time.time_ns() - mtime < RACY_WINDOW_NS:
+            mtime = None
+        recorded = self.old.get(directory)
+        if mtime is None or recorded is None or recorded[1] != mtime:
+            self.mtimes[directory] = mtime
+            return None
+        self.seen[directory] = recorded
+        self.skipped += 1
+        children = self.children.get(directory, [])
+        for child in children:
+            self.parents[child] = directory
+        return children
+
+    def due_retries(self, directory):
+        """Known locked files in a skipped `directory` whose back-off has run out; the rest stay deferred."""
+        due = []
+        for path in self.failures_by_directory.get(directory, ()):
+            if self.failures[path][2] <= self.now:
+                due.append(path)
+                self.retried += 1
+            else:
+                self.deferred.add(path)
+        return due
+
+    def should_skip(self, path):
+        """True for a listed file that failed before and is still backing off."""
+        failure = self.failures.get(path)
+        if failure is None:
+            return False
+        if failure[2] > self.now:
+            self.deferred.add(path)
+            return True
+        self.retried += 1
+        return False
+
+    def listed_directory(self, directory, subdirectories):
+        self.listed += 1
+        self.seen[directory] = (self.parents.get(directory), self.mtimes.pop(directory, None))
+        for child in subdirectories:
+            self.parents[child] = directory
+
+    def deferred_rows(self):
+        return [(self.root, path) + self.failures[path] for path in self.deferred]
+
+    def failure_rows(self, failed):
+        """Rows for `failed` (paths that could not be deleted), each backing off for longer than last time."""
+        rows = []
+        for path in failed:
+            count = self.failures[path][1] + 1 if path in self.failures else 1
+            delay = min(self.backoff * 2 ** (count - 1), self.max_backoff)
+            rows.append((self.root, path, os.path.dirname(path), count, self.now + delay))
+        return rows
+
+    def report(self):
+        total = self.listed + self.skipped
+        saved = self.skipped / total * 100 if total else 0.0
+        logging.info(f"Scan index for {self.root}: {self.skipped} of {total} directory listings skipped "
+                     f"({saved:.1f}% of the walk), {len(self.deferred)} locked files deferred, "
+                     f"{self.retried} retried.")
+
+
+class ScanIndex:
+    """SQLite record of directory mtimes and locked files, shared by repeat cleanup runs.
+
+    A walk loads everything recorded for its root up front and writes the
+    new state back in one transaction, so the database is touched twice per
+    root rather than once per directory. Failures are the exception: they are
+    staged a batch at a time, so a run that cannot delete millions of files
+    does not hold them all in memory. Files that keep failing are tried
+    again after `backoff` seconds, doubling up to `max_backoff`.
+    """
+
+    def __init__(self, path, backoff=DEFAULT_RETRY_BACKOFF, max_backoff=MAX_RETRY_BACKOFF):
+        self.path = path
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lock = threading.Lock()  # Cleanup tasks run on several threads
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(_SCHEMA)
+
+    def open_walk(self, root):
+        with self.lock:
+            directories = {path: (parent, mtime) for path, parent, mtime in self.db.execute(
+                "SELECT path, parent, mtime_ns FROM directories WHERE root = ?", (root,))}
+            failures = {path: (directory, count, next_attempt) for path, directory, count, next_attempt in
+                        self.db.execute("SELECT path, directory, failures, next_attempt FROM failures WHERE root = ?",
+                                        (root,))}
+            self.db.execute("DELETE FROM new_failures WHERE root = ?", (root,))  # Left by an abandoned walk
+        return IndexedWalk(root, directories, failures, self.backoff, self.max_backoff)
+
+    def record_failures(self, walk, failed):
+        """Stage `failed` (paths that could not be deleted) for save_walk(); safe to call from cleanup threads."""
+        rows = walk.failure_rows(failed)
+        with self.lock, self.db:
+            self.db.executemany("INSERT OR REPLACE INTO new_failures VALUES (?, ?, ?, ?, ?)", rows)
+
+    def save_walk(self, walk):
+        """Store what `walk` saw, with the failures staged by record_failures() backing off."""
+        directories = [(walk.root, path, parent, mtime) for path, (parent, mtime) in walk.seen.items()]
+        with self.lock, self.db:
+            # Directories not seen this time are gone, or below one that could not be listed
+            self.db.execute("DELETE FROM directories WHERE root = ?", (walk.root,))
+            self.db.executemany("INSERT INTO directories VALUES (?, ?, ?, ?)", directories)
+            self.db.execute("DELETE FROM failures WHERE root = ?", (walk.root,))
+            self.db.executemany("INSERT INTO failures VALUES (?, ?, ?, ?, ?)", walk.deferred_rows())
+            self.db.execute("INSERT OR REPLACE INTO failures SELECT * FROM new_failures WHERE root = ?", (walk.root,))
+            self.db.execute("DELETE FROM new_failures WHERE root = ?", (walk.root,))
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,151 @@
+import errno
+import gzip
+import logging
+import threading
+import time
+from collections import Counter
+
+DEFAULT_FAILURE_SAMPLE = 25  # Failed paths kept in memory per task, for the summary
+DEFAULT_PROGRESS_INTERVAL = 10.0  # Seconds between progress lines per task
+DEFAULT_FAILURES_FILE = "cleanup-failures.txt.gz"
+
+
+def _error_name(error):
+    code = getattr(error, "errno", None)
+    if code is None:
+        return type(error).__name__
+    return errno.errorcode.get(code, str(code))
+
+
+class TaskRecorder:
+    """What one cleanup task has done so far; every update goes through its CleanupResults' lock."""
+
+    def __init__(self, results, name, expected=None):
+        self.results = results
+        self.name = name
+        self.expected = expected  # Files the task should delete, when known (e.g. from a plan), for the ETA
+        self.files = 0
+        self.bytes = 0
+        self.directories = 0
+        self.failures = 0
+        self.errors = Counter()  # errno name: failures
+        self.sample = []  # The first few (path, error) failures
+        self.started = time.monotonic()
+        self.last_progress = self.started
+
+    def record(self, files=0, size=0, directories=0, failures=()):
+        """Add a batch of results; `failures` is [(path, error), ...]. Safe from any thread."""
+        self.results.record(self, files, size, directories, failures)
+
+    def failed(self, path, error):
+        self.record(failures=[(path, error)])
+
+    def progress_line(self, now):
+        elapsed = max(now - self.started, 1e-9)
+        rate = self.files / elapsed
+        line = f"{self.name}: {self.files} files ({self.bytes / 2**20:.1f} MiB) deleted, {rate:.0f} files/s"
+        if self.expected:
+            done = min(self.files + self.failures, self.expected)
+            line += f", {done / self.expected * 100:.0f}%"
+            if rate:
+                line += f", ETA {(self.expected - done) / rate:.0f}s"
+        if self.failures:
+            line += f", {self.failures} failed"
+        return line
+
+
+class CleanupResults:
+    """Thread-safe totals for a cleanup run, in memory bounded by the number of tasks.
+
+    Tasks record batches rather than single files. Each task keeps counters
+    (files, bytes, directories, failures by errno) and the first
+    `sample_size` failed paths for the summary. Every failed path, sampled
+    or not, is written to a gzip file (`failures_path`, created only when
+    something fails) instead of being held in memory. While a task runs, a progress line with its rate (and ETA when
+    its total is known) is logged every `progress_interval` seconds.
+    """
+
+    def __init__(self, sample_size=DEFAULT_FAILURE_SAMPLE, failures_path=DEFAULT_FAILURES_FILE,
+                 progress_interval=DEFAULT_PROGRESS_INTERVAL):
+        self.sample_size = sample_size
+        self.failures_path = failures_path
+        self.progress_interval = progress_interval
+        self.lock = threading.Lock()
+        self.tasks = {}
+        self.spill = None
+        self.spilled = 0
+
+    def task(self, name, expected=None):
+        """The recorder for task `name`, created on first use; `expected` adds to its known total."""
+        with self.lock:
+            recorder = self.tasks.get(name)
+            if recorder is None:
+                recorder = self.tasks[name] = TaskRecorder(self, name)
+            if expected:
+                recorder.expected = (recorder.expected or 0) + expected
+            return recorder
+
+    def record(self, recorder, files, size, directories, failures):
+        line = None
+        with self.lock:
+            recorder.files += files
+            recorder.bytes += size
+            recorder.directories += directories
+            for path, error in failures:
+                recorder.failures += 1
+                recorder.errors[_error_name(error)] += 1
+                if len(recorder.sample) < self.sample_size:
+                    recorder.sample.append((path, error))
+                self._spill(recorder.name, path, error)
+            now = time.monotonic()
+            if self.progress_interval is not None and now - recorder.last_progress >= self.progress_interval:
+                recorder.last_progress = now
+                line = recorder.progress_line(now)
+        if line:
+            logging.info(line)  # Outside the lock: the log handler may block
+
+    def _spill(self, task, path, error):
+        if self.failures_path is None:
+            return
+        if self.spill is None:
+            self.spill = gzip.open(self.failures_path, "wt", encoding="utf-8", errors="backslashreplace")
+        self.spill.write(f"{task}\t{path}\t{_error_name(error)}\t{error}\n")
+        self.spilled += 1
+
+    @property
+    def failures(self):
+        with self.lock:
+            return sum(recorder.failures for recorder in self.tasks.values())
+
+    def log_summary(self):
+        """Log per-task totals and the sampled failures."""
+        with self.lock:
+            recorders = list(self.tasks.values())
+        logging.info("\n--- Cleanup Summary ---")
+        for recorder in recorders:
+            line = (f"{recorder.name}: {recorder.files} files ({recorder.bytes / 2**20:.1f} MiB) deleted in "
+                    f"{time.monotonic() - recorder.started:.1f}s")
+            if recorder.directories:
+                line += f", {recorder.directories} directories removed"
+            if recorder.failures:
+                errors = ", ".join(f"{name}: {count}" for name, count in recorder.errors.most_common())
+                line += f", {recorder.failures} failed ({errors})"
+            logging.info(line)
+        failed = [recorder for recorder in recorders if recorder.failures]
+        if not failed:
+            logging.info("All cleanup tasks completed successfully!")
+            return
+        logging.warning("The following files or tasks were skipped (locked or in use):")
+        for recorder in failed:
+            for path, error in recorder.sample:
+                logging.warning(f"  - {path} ({error})")
+            if recorder.failures > len(recorder.sample):
+                logging.warning(f"  ... and {recorder.failures - len(recorder.sample)} more from {recorder.name}")
+        if self.spilled:
+            logging.warning(f"All {self.spilled} failures are listed in {self.failures_path}")
+
+    def close(self):
+        with self.lock:
+            if self.spill is not None:
+                self.spill.close()
+                self.spill = None
@@ -0,0 +1,166 @@
+import heapq
+import json
+import logging
+import os
+import re
+from collections import namedtuple
+
+from cleanup_engine import DEFAULT_DELETE_WORKERS, delete_paths
+from cleanup_plan import FILE, TOP_FILES
+
+DEFAULT_HEAP_LIMIT = 100000  # Oldest files remembered per pass; bounds memory whatever the file count
+ORDERS = ("mtime", "atime")
+
+# Keep at most `max_bytes` and/or `max_files` under a target, deleting the
+# oldest by `order` first; None means no limit of that kind.
+RetentionPolicy = namedtuple("RetentionPolicy", ["max_bytes", "max_files", "order"])
+RetentionResult = namedtuple("RetentionResult", ["files", "bytes", "deleted_files", "deleted_bytes", "passes"])
+
+_SIZE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*$", re.IGNORECASE)
+_UNITS = {"": 1, "K": 2**10, "M": 2**20, "G": 2**30, "T": 2**40}
+
+
+def parse_size(value):
+    """Bytes from an int or a string like "2GB", "500 MiB" or "1.5G" (binary units)."""
+    if value is None or isinstance(value, int):
+        return value
+    match = _SIZE.match(str(value))
+    if not match:
+        raise ValueError(f"Invalid size: {value!r}")
+    return int(float(match.group(1)) * _UNITS[match.group(2).upper()])
+
+
+def load_policies(path):
+    """Read retention policies from a JSON file.
+
+    {"targets": [{"task": "clear_application_cache", "max_bytes": "2GB", "order": "atime"},
+                 {"path": "D:\\\\Builds\\\\cache", "max_files": 50000}]}
+
+    A "task" entry covers every directory that cleanup task cleans; a "path"
+    entry covers one directory and takes precedence. Returns
+    ({task: policy}, {path: policy}).
+    """
+    with open(path, encoding="utf-8") as file:
+        config = json.load(file)
+    by_task, by_path = {}, {}
+    for entry in config.get("targets", []):
+        order = entry.get("order", "mtime")
+        if order not in ORDERS:
+            raise ValueError(f"{path}: order must be one of {', '.join(ORDERS)}, not {order!r}")
+        policy = RetentionPolicy(parse_size(entry.get("max_bytes")), entry.get("max_files"), order)
+        if policy.max_bytes is None and policy.max_files is None:
+            raise ValueError(f"{path}: {entry} sets neither max_bytes nor max_files")
+        if "path" in entry:
+            by_path[os.path.normpath(os.path.expandvars(entry["path"]))] = policy
+        elif "task" in entry:
+            by_task[entry["task"]] = policy
+        else:
+            raise ValueError(f"{path}: {entry} names neither a task nor a path")
+    return by_task, by_path
+
+
+def _oldest(root, recursive, order, limit):
+    """Stream `root` once: ([(time, size, path)] for the `limit` oldest files, oldest first, files, bytes)."""
+    heap = []  # Max-heap on time (negated), so the newest of the kept files is the one to drop
+    files = total = 0
+    pending = [root]
+    while pending:
+        try:
+            with os.scandir(pending.pop()) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if recursive:
+                                pending.append(entry.path)
+                            continue
+                        info = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    # A file read since it was written is still in use, so it counts from the later of the two
+                    used = max(info.st_atime, info.st_mtime) if order == "atime" else info.st_mtime
+                    files += 1
+                    total += info.st_size
+                    if len(heap) < limit:
+                        heapq.heappush(heap, (-used, info.st_size, entry.path))
+                    elif -used > heap[0][0]:
+                        heapq.heapreplace(heap, (-used, info.st_size, entry.path))
+        except OSError as e:
+            logging.debug(f"Cannot list {e.filename}: {e}")
+    return sorted((-used, size, path) for used, size, path in heap), files, total
+
+
+def trim(root, policy, recursive=True, workers=DEFAULT_DELETE_WORKERS, skipped=None, heap_limit=DEFAULT_HEAP_LIMIT,
+         recorder=None):
+    """Delete the oldest files under `root` until it is within `policy`; returns a RetentionResult.
+
+    Memory is bounded by `heap_limit` entries: when even the oldest
+    `heap_limit` files are not enough, the tree is streamed again.
+    """
+    deleted_files = deleted_bytes = passes = 0
+    while True:
+        oldest, files, total = _oldest(root, recursive, policy.order, heap_limit)
+        passes += 1
+        if passes == 1:
+            first_files, first_bytes = files, total
+        excess_bytes = total - policy.max_bytes if policy.max_bytes is not None else 0
+        excess_files = files - policy.max_files if policy.max_files is not None else 0
+        freed_this_pass = 0
+        position = 0
+        while (excess_bytes > 0 or excess_files > 0) and position < len(oldest):
+            # Take just enough of the oldest files to cover what is left over, then delete them together
+            chosen = []
+            need_bytes, need_files = excess_bytes, excess_files
+            while (need_bytes > 0 or need_files > 0) and position < len(oldest):
+                _, size, path = oldest[position]
+                chosen.append((path, size))
+                need_bytes -= size
+                need_files -= 1
+                position += 1
+            result = delete_paths([path for path, _ in chosen], workers=workers, skipped=skipped, recorder=recorder,
+                                  sizes=[size for _, size in chosen])
+            failed = {path for path, _ in result.failed}
+            for path, size in chosen:
+                if path not in failed:
+                    excess_bytes -= size
+                    excess_files -= 1
+                    deleted_files += 1
+                    deleted_bytes += size
+                    freed_this_pass += 1
+        # Done when within quota, when every file was already in view, or when nothing more can be deleted
+        if excess_bytes <= 0 and excess_files <= 0 or len(oldest) < heap_limit or not freed_this_pass:
+            return RetentionResult(first_files, first_bytes, deleted_files, deleted_bytes, passes)
+
+
+def _describe(policy):
+    limits = []
+    if policy.max_bytes is not None:
+        limits.append(f"{policy.max_bytes / 2**20:.1f} MiB")
+    if policy.max_files is not None:
+        limits.append(f"{policy.max_files} files")
+    return " and ".join(limits) + f" (oldest {policy.order} first)"
+
+
+def apply_retention(targets, policies, workers=DEFAULT_DELETE_WORKERS, skipped=None, results=None):
+    """Trim every directory in `targets` (CleanupTargets) that a policy from load_policies() covers.
+
+    With a CleanupResults as `results`, each target's task records there
+    ("retention" for directories configured by path alone).
+    """
+    by_task, by_path = policies
+    trimmed = {}
+    targets = list(targets)
+    known = {os.path.normpath(target.path) for target in targets}
+    # Paths configured outside the task targets are trimmed too, recursively
+    extra = [("retention", path, True, policy) for path, policy in by_path.items() if path not in known]
+    planned = [(target.task, target.path, target.kind != TOP_FILES,
+                by_path.get(os.path.normpath(target.path), by_task.get(target.task)))
+               for target in targets if target.kind != FILE]
+    for task, path, recursive, policy in planned + extra:
+        if policy is None or not os.path.isdir(path):
+            continue
+        recorder = results.task(task) if results is not None else None
+        result = trim(path, policy, recursive, workers, skipped, recorder=recorder)
+        trimmed[path] = result
+        logging.info(f"{path}: {result.files} files, {result.bytes / 2**20:.1f} MiB; deleted {result.deleted_files} "
+                     f"files ({result.deleted_bytes / 2**20:.1f} MiB) to keep it within {_describe(policy)}.")
+    return trimmed
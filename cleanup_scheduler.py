@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# Resource classes: tasks of one class share its concurrency limit
+DISK = "disk"  # Deletes or rewrites many files
+CPU = "cpu"  # Busy in Python rather than waiting
+EXTERNAL = "external"  # Waits on an external program
+DEFAULT_LIMITS = {DISK: 2, CPU: os.cpu_count() or 1, EXTERNAL: 4}
+
+DEFAULT_COMMAND_TIMEOUT = 600.0  # Seconds before an external command is killed
+
+# Task outcomes
+OK = "ok"
+FAILED = "failed"
+TIMED_OUT = "timeout"
+
+# A task either calls `run` on a thread or runs `commands` (argv lists, one
+# after another, each limited to `timeout` seconds). It starts once every
+# task named in `after` has finished; names that are not scheduled are ignored.
+CleanupTask = namedtuple("CleanupTask", ["name", "resource", "run", "commands", "after", "timeout"],
+                         defaults=(None, (), (), DEFAULT_COMMAND_TIMEOUT))
+TaskResult = namedtuple("TaskResult", ["name", "resource", "status", "started", "finished", "error"])
+
+
+async def run_command(argv, timeout=DEFAULT_COMMAND_TIMEOUT):
+    """Run `argv` without a shell; returns (exit status, output) or raises asyncio.TimeoutError once killed."""
+    process = await asyncio.create_subprocess_exec(*argv, stdout=asyncio.subprocess.PIPE,
+                                                   stderr=asyncio.subprocess.STDOUT)
+    try:
+        output, _ = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise
+    return process.returncode, output.decode(errors="replace")
+
+
+def _check_order(tasks):
+    # Depth-first walk over the declared dependencies; a task met again while still on the path closes a cycle
+    state = {}
+
+    def visit(name, path):
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            raise ValueError(f"Cyclic task dependencies: {' -> '.join(path + [name])}")
+        state[name] = "visiting"
+        for dependency in tasks[name].after:
+            if dependency in tasks:
+                visit(dependency, path + [name])
+        state[name] = "done"
+
+    for name in tasks:
+        visit(name, [])
+
+
+class CleanupScheduler:
+    """Runs cleanup tasks concurrently, honouring dependencies and per-resource limits.
+
+    Every task waits for the tasks it is declared `after`, then for a slot in
+    its resource class, so cheap file deletions no longer queue behind a slow
+    external command. Python tasks run on a thread pool; commands run as
+    asyncio subprocesses and are killed at their timeout.
+    """
+
+    def __init__(self, tasks, limits=None):
+        self.tasks = {task.name: task for task in tasks}
+        _check_order(self.tasks)
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+
+    async def _run_commands(self, task):
+        status, error = OK, None
+        for argv in task.commands:
+            command = " ".join(argv)
+            try:
+                returncode, output = await run_command(argv, task.timeout)
+            except asyncio.TimeoutError:
+                logging.error(f"{task.name}: '{command}' killed after {task.timeout:g}s")
+                status, error = TIMED_OUT, f"'{command}' timed out"
+                continue
+            except OSError as e:
+                logging.error(f"{task.name}: cannot run '{command}': {e}")
+                status, error = FAILED, str(e)
+                continue
+            if returncode:
+                last_line = output.strip().splitlines()[-1:] or [""]
+                logging.error(f"{task.name}: '{command}' exited with status {returncode} {last_line[0]}".rstrip())
+                if status == OK:
+                    status, error = FAILED, f"'{command}' exited with status {returncode}"
+            else:
+                logging.info(f"{task.name}: '{command}' completed.")
+        return status, error
+
+    async def _run_task(self, task, finished, slots, pool):
+        for dependency in task.after:
+            if dependency in finished:
+                await finished[dependency].wait()
+        async with slots[task.resource]:
+            started = time.perf_counter()
+            logging.info(f"Started {task.name} ({task.resource})")
+            try:
+                if task.commands:
+                    status, error = await self._run_commands(task)
+                else:
+                    await asyncio.get_running_loop().run_in_executor(pool, task.run)
+                    status, error = OK, None
+            except Exception as e:
+                logging.error(f"{task.name} failed: {e}")
+                status, error = FAILED, str(e)
+            result = TaskResult(task.name, task.resource, status, started, time.perf_counter(), error)
+        logging.info(f"Finished {task.name} in {result.finished - result.started:.1f}s ({status})")
+        finished[task.name].set()  # Dependants run whatever the outcome; ordering is not a success condition
+        return result
+
+    async def run_async(self):
+        """Run every task; returns their TaskResults in registration order."""
+        finished = {name: asyncio.Event() for name in self.tasks}
+        slots = {resource: asyncio.Semaphore(limit) for resource, limit in self.limits.items()}
+        threads = sum(limit for resource, limit in self.limits.items() if resource != EXTERNAL)
+        with ThreadPoolExecutor(max_workers=max(1, threads), thread_name_prefix="task") as pool:
+            return list(await asyncio.gather(*(self._run_task(task, finished, slots, pool)
+                                               for task in self.tasks.values())))
+
+    def run(self):
+        return asyncio.run(self.run_async())
+
+    def critical_path(self, results):
+        """The chain of results that decided the total time, first to last.
+
+        It ends at the task that finished last and steps back each time to
+        whichever of its dependencies finished last.
+        """
+        if not results:
+            return []
+        by_name = {result.name: result for result in results}
+        path = [max(results, key=lambda result: result.finished)]
+        while True:
+            dependencies = [by_name[name] for name in self.tasks[path[-1].name].after if name in by_name]
+            if not dependencies:
+                return path[::-1]
+            path.append(max(dependencies, key=lambda result: result.finished))
+
+    def log_report(self, results):
+        """Log wall-clock time per task, the total and the critical path."""
+        if not results:
+            return
+        start = min(result.started for result in results)
+        logging.info("\n--- Task Timings ---")
+        for result in sorted(results, key=lambda result: result.started):
+            logging.info(f"  {result.name:<40} {result.resource:<9} {result.status:<8} "
+                         f"+{result.started - start:7.1f}s  {result.finished - result.started:7.1f}s")
+        wall = max(result.finished for result in results) - start
+        busy = sum(result.finished - result.started for result in results)
+        logging.info(f"Wall-clock time: {wall:.1f}s for {busy:.1f}s of task time")
+        path = self.critical_path(results)
+        logging.info("Critical path: " + " -> ".join(f"{result.name} ({result.finished - result.started:.1f}s)"
+                                                     for result in path))
@@ -0,0 +1,348 @@
+import argparse
+import ctypes
+import logging
+import os
+from functools import partial
+
+from cleanup_engine import DEFAULT_DELETE_WORKERS, delete_files, delete_paths, remove_tree
+from cleanup_index import ScanIndex
+from cleanup_plan import FILE, FILES, TOP_FILES, TREE, TREE_CONTENTS, CleanupTarget, dry_run, execute_plan, load_plan
+from cleanup_results import DEFAULT_FAILURES_FILE, DEFAULT_PROGRESS_INTERVAL, CleanupResults
+from cleanup_retention import apply_retention, load_policies
+from cleanup_scheduler import CPU, DISK, EXTERNAL, CleanupScheduler, CleanupTask
+from cleanup_watch import add_watch_arguments, watch_from_args
+
+results = CleanupResults()  # Per-task counts and a sample of the files that couldn't be cleared
+
+PREFETCH_DIR = "C:\\Windows\\Prefetch"
+DUMP_PATHS = [
+    r"C:\Windows\Minidump",  # Mini dump files directory
+    r"C:\Windows\MEMORY.DMP"  # System memory dump file
+]
+ERROR_REPORT_DIRS = [
+    r"C:\ProgramData\Microsoft\Windows\WER\ReportQueue",
+    r"C:\ProgramData\Microsoft\Windows\WER\ReportArchive",
+]
+UPDATE_CACHE_DIR = "C:\\Windows\\SoftwareDistribution\\Download"
+CHROME_CACHE = os.path.expandvars(r"%LOCALAPPDATA%\Google\Chrome\User Data\Default\Cache")
+CHROME_COOKIES = os.path.expandvars(r"%LOCALAPPDATA%\Google\Chrome\User Data\Default\Cookies")
+FIREFOX_PROFILES = os.path.expandvars(r"%APPDATA%\Mozilla\Firefox\Profiles")
+EDGE_CACHE = os.path.expandvars(r"%LOCALAPPDATA%\Microsoft\Edge\User Data\Default\Cache")
+EDGE_COOKIES = os.path.expandvars(r"%LOCALAPPDATA%\Microsoft\Edge\User Data\Default\Cookies")
+EVENT_LOGS = ["System", "Application", "Security", "Setup"]
+
+LONG_COMMAND_TIMEOUT = 2 * 60 * 60.0  # dism and defrag can take an hour on a slow disk
+SHORT_COMMAND_TIMEOUT = 60.0
+
+
+def is_admin():
+    """Check if the script is running with administrative privileges."""
+    try:
+        return ctypes.windll.shell32.IsUserAnAdmin()
+    except Exception:
+        return False
+
+
+# ------------------------------
+# File Cleanup Tasks
+# ------------------------------
+
+def clear_temp_files(temp_dir=None, workers=DEFAULT_DELETE_WORKERS, index=None):
+    """Clear temporary files."""
+    temp_dir = temp_dir or os.getenv('TEMP', "C:\\Windows\\Temp")
+    logging.info("Clearing temporary files...")
+    if os.path.exists(temp_dir):
+        delete_files(temp_dir, workers=workers, index=index, recorder=results.task("clear_temp_files"))
+    logging.info(f"Completed clearing temporary files in {temp_dir}.")
+
+
+def clear_prefetch_files(prefetch_dir=PREFETCH_DIR, workers=DEFAULT_DELETE_WORKERS, index=None):
+    """Clear prefetch files."""
+    logging.info("Clearing prefetch files...")
+    if os.path.exists(prefetch_dir):
+        delete_files(prefetch_dir, workers=workers, recursive=False, index=index,
+                     recorder=results.task("clear_prefetch_files"))
+    logging.info("Completed clearing prefetch files.")
+
+
+def clear_memory_dump_files(dump_paths=DUMP_PATHS, workers=DEFAULT_DELETE_WORKERS, index=None):
+    """Clear system memory dump files."""
+    logging.info("Clearing memory dump files...")
+    recorder = results.task("clear_memory_dump_files")
+    for dump_path in dump_paths:
+        if os.path.isfile(dump_path):  # Case for MEMORY.DMP
+            delete_paths([dump_path], workers=workers, recorder=recorder, sizes=[os.path.getsize(dump_path)])
+        elif os.path.isdir(dump_path):  # Case for directories like Minidump
+            delete_files(dump_path, workers=workers, recursive=False, index=index, recorder=recorder)
+    logging.info("Finished clearing memory dump files.")
+
+
+def clear_application_cache(workers=DEFAULT_DELETE_WORKERS, chrome_cache=CHROME_CACHE, firefox_dir=FIREFOX_PROFILES):
+    """Clear cache files for various applications."""
+    logging.info("Clearing application caches...")
+    recorder = results.task("clear_application_cache")
+    if os.path.exists(chrome_cache):
+        # Entries in use are skipped and counted; everything else goes
+        if remove_tree(chrome_cache, workers=workers, recorder=recorder).failed:
+            logging.warning("Chrome cache only partly cleared.")
+        else:
+            logging.info("Cleared Chrome cache.")
+
+    for profile in firefox_profiles(firefox_dir):
+        cache_path = os.path.join(firefox_dir, profile, "cache2")
+        if os.path.exists(cache_path):
+            if remove_tree(cache_path, workers=workers, recorder=recorder).failed:
+                logging.warning(f"Firefox cache only partly cleared for profile: {profile}")
+            else:
+                logging.info(f"Cleared Firefox cache for profile: {profile}")
+    logging.info("Completed clearing application caches.")
+
+
+def clear_cookies(chrome_cookies=CHROME_COOKIES, firefox_dir=FIREFOX_PROFILES):
+    """Clear browser cookies."""
+    logging.info("Clearing browser cookies...")
+    recorder = results.task("clear_cookies")
+    if os.path.exists(chrome_cookies):
+        try:
+            os.remove(chrome_cookies)
+            recorder.record(files=1)
+            logging.info("Cleared Chrome cookies.")
+        except Exception as e:
+            logging.warning(f"Failed to clear Chrome cookies. ({e})")
+            recorder.failed(chrome_cookies, e)
+
+    for profile in firefox_profiles(firefox_dir):
+        cookies_file = os.path.join(firefox_dir, profile, "cookies.sqlite")
+        if os.path.exists(cookies_file):
+            try:
+                os.remove(cookies_file)
+                recorder.record(files=1)
+                logging.info(f"Cleared Firefox cookies for profile: {profile}")
+            except Exception as e:
+                logging.warning(f"Failed to clear Firefox cookies for profile {profile}. ({e})")
+                recorder.failed(cookies_file, e)
+    logging.info("Completed clearing browser cookies.")
+
+
+def clear_windows_error_reporting_files(workers=DEFAULT_DELETE_WORKERS, error_dirs=ERROR_REPORT_DIRS):
+    """Clear Windows Error Reporting files."""
+    logging.info("Clearing Windows Error Reporting files...")
+    recorder = results.task("clear_windows_error_reporting_files")
+    for dir_path in error_dirs:
+        if os.path.exists(dir_path):
+            if remove_tree(dir_path, workers=workers, recorder=recorder).failed:
+                logging.warning(f"Error reports in {dir_path} only partly cleared.")
+            else:
+                logging.info(f"Cleared: {dir_path}")
+    logging.info("Completed clearing Windows Error Reporting files.")
+
+
+def clear_windows_update_cache(workers=DEFAULT_DELETE_WORKERS, update_cache_dir=UPDATE_CACHE_DIR):
+    """Clear Windows Update Cache."""
+    logging.info("Clearing Windows Update Cache...")
+    if os.path.exists(update_cache_dir):
+        # The Download folder itself stays; only its contents are removed
+        if remove_tree(update_cache_dir, workers=workers, keep_root=True,
+                       recorder=results.task("clear_windows_update_cache")).failed:
+            logging.error("Windows Update Cache only partly cleared.")
+        else:
+            logging.info("Windows Update Cache cleared successfully.")
+
+
+def clear_edge_browser_data(workers=DEFAULT_DELETE_WORKERS, edge_cache=EDGE_CACHE, edge_cookies=EDGE_COOKIES):
+    """Clear Microsoft Edge browser data."""
+    logging.info("Clearing Microsoft Edge browser data...")
+    recorder = results.task("clear_edge_browser_data")
+    if os.path.exists(edge_cache):
+        if remove_tree(edge_cache, workers=workers, recorder=recorder).failed:
+            logging.warning("Edge Cache only partly cleared.")
+        else:
+            logging.info("Cleared Edge Cache.")
+
+    if os.path.exists(edge_cookies):
+        try:
+            os.remove(edge_cookies)
+            recorder.record(files=1)
+            logging.info("Cleared Edge Cookies.")
+        except Exception as e:
+            logging.warning(f"Failed to clear Edge Cookies: {e}")
+            recorder.failed(edge_cookies, e)
+    logging.info("Completed clearing Microsoft Edge browser data.")
+
+
+def clear_recycle_bin():
+    """Empty Recycle Bin."""
+    logging.info("Emptying Recycle Bin...")
+    try:
+        result = ctypes.windll.shell32.SHEmptyRecycleBinW(None, None, 3)
+        if result == 0:
+            logging.info("Recycle Bin emptied.")
+        elif result == 2:
+            logging.info("Recycle Bin was already empty.")
+        else:
+            logging.warning("Failed to empty Recycle Bin.")
+    except Exception as e:
+        logging.error(f"Error emptying Recycle Bin: {e}")
+
+
+def clean_registry():
+    """Placeholder for cleaning the registry."""
+    logging.info("Cleaning Windows registry using external tools or commands...")
+    # This function can integrate with tools like CCleaner or PowerShell scripts to clean the registry.
+    logging.info("Registry cleanup is a placeholder. Please use tools like CCleaner for this task.")
+
+
+def firefox_profiles(firefox_dir=FIREFOX_PROFILES):
+    """Names of the Firefox profiles, or an empty list without Firefox."""
+    if not os.path.isdir(firefox_dir):
+        return []
+    return os.listdir(firefox_dir)
+
+
+# ------------------------------
+# Task Registry
+# ------------------------------
+
+# Everything that deletes files; defragmenting before these finish would move data about to be freed
+DELETION_TASKS = (
+    "clear_temp_files", "clear_prefetch_files", "clear_memory_dump_files", "clear_application_cache",
+    "clear_cookies", "clear_windows_error_reporting_files", "clear_windows_update_cache", "clear_edge_browser_data",
+    "clear_recycle_bin", "clear_unused_windows_install_files", "clear_old_restore_points",
+)
+
+
+def cleanup_registry(workers=DEFAULT_DELETE_WORKERS, index=None):
+    """Every cleanup task either utility can run, by name.
+
+    Long external commands come first so they start before the file tasks
+    claim their slots and stay off the end of the critical path. `index`
+    (a ScanIndex) is handed to the tasks that sweep directories of files.
+    """
+    tasks = [
+        CleanupTask("clear_unused_windows_install_files", EXTERNAL,
+                    commands=[["dism", "/online", "/cleanup-image", "/StartComponentCleanup", "/ResetBase"]],
+                    timeout=LONG_COMMAND_TIMEOUT),
+        CleanupTask("clear_old_restore_points", EXTERNAL,
+                    commands=[["vssadmin", "delete", "shadows", "/for=C:", "/oldest", "/quiet"]]),
+        CleanupTask("clear_system_logs", EXTERNAL, commands=[["wevtutil", "cl", log_type] for log_type in EVENT_LOGS],
+                    timeout=SHORT_COMMAND_TIMEOUT),
+        CleanupTask("flush_dns_cache", EXTERNAL, commands=[["ipconfig", "/flushdns"]], timeout=SHORT_COMMAND_TIMEOUT),
+        CleanupTask("clear_temp_files", DISK, partial(clear_temp_files, workers=workers, index=index)),
+        CleanupTask("clear_prefetch_files", DISK, partial(clear_prefetch_files, workers=workers, index=index)),
+        CleanupTask("clear_memory_dump_files", DISK, partial(clear_memory_dump_files, workers=workers, index=index)),
+        CleanupTask("clear_windows_update_cache", DISK, partial(clear_windows_update_cache, workers=workers)),
+        CleanupTask("clear_windows_error_reporting_files", DISK,
+                    partial(clear_windows_error_reporting_files, workers=workers)),
+        CleanupTask("clear_application_cache", DISK, partial(clear_application_cache, workers=workers)),
+        CleanupTask("clear_cookies", DISK, clear_cookies),
+        CleanupTask("clear_edge_browser_data", DISK, partial(clear_edge_browser_data, workers=workers)),
+        CleanupTask("clear_recycle_bin", DISK, clear_recycle_bin),
+        CleanupTask("clean_registry", CPU, clean_registry),
+        CleanupTask("optimize_storage", EXTERNAL, commands=[["defrag", "C:", "/O"]], after=DELETION_TASKS,
+                    timeout=LONG_COMMAND_TIMEOUT),
+    ]
+    return {task.name: task for task in tasks}
+
+
+def cleanup_targets(names=None):
+    """What the file-based tasks in `names` (default: all) would remove, for a dry-run plan."""
+    targets = [
+        CleanupTarget("clear_temp_files", os.getenv('TEMP', "C:\\Windows\\Temp"), FILES),
+        CleanupTarget("clear_prefetch_files", PREFETCH_DIR, TOP_FILES),
+    ]
+    targets += [CleanupTarget("clear_memory_dump_files", path, FILE if os.path.isfile(path) else TOP_FILES)
+                for path in DUMP_PATHS]
+    targets.append(CleanupTarget("clear_application_cache", CHROME_CACHE, TREE))
+    targets += [CleanupTarget("clear_application_cache", os.path.join(FIREFOX_PROFILES, profile, "cache2"), TREE)
+                for profile in firefox_profiles()]
+    targets.append(CleanupTarget("clear_cookies", CHROME_COOKIES, FILE))
+    targets += [CleanupTarget("clear_cookies", os.path.join(FIREFOX_PROFILES, profile, "cookies.sqlite"), FILE)
+                for profile in firefox_profiles()]
+    targets.append(CleanupTarget("clear_windows_update_cache", UPDATE_CACHE_DIR, TREE_CONTENTS))
+    targets += [CleanupTarget("clear_windows_error_reporting_files", path, TREE) for path in ERROR_REPORT_DIRS]
+    targets.append(CleanupTarget("clear_edge_browser_data", EDGE_CACHE, TREE))
+    targets.append(CleanupTarget("clear_edge_browser_data", EDGE_COOKIES, FILE))
+    return [target for target in targets if names is None or target.task in names]
+
+
+# ------------------------------
+# Command Line
+# ------------------------------
+
+def add_cleanup_arguments(parser, default_tasks):
+    """Add the options shared by the cleanup scripts to an argparse parser."""
+    parser.add_argument("--workers", type=int, default=DEFAULT_DELETE_WORKERS,
+                        help="Threads deleting files in parallel")
+    parser.add_argument("--tasks", type=parse_task_list, default=",".join(default_tasks),
+                        help="Comma-separated tasks to run, or 'all' for every registered task (default: %(default)s)")
+    parser.add_argument("--index", metavar="FILE",
+                        help="SQLite scan index kept between runs: directories unchanged since the last run are "
+                             "not listed again and locked files are retried with a growing back-off")
+    parser.add_argument("--failures-file", default=DEFAULT_FAILURES_FILE,
+                        help="Gzip file listing every failed path, including those in the summary's sample "
+                             "(created only when something fails; default: %(default)s)")
+    parser.add_argument("--progress-interval", type=float, default=DEFAULT_PROGRESS_INTERVAL,
+                        help="Seconds between progress lines while a task runs (default: %(default)s)")
+    parser.add_argument("--max-disk-tasks", type=int,
+                        help="Disk-heavy tasks allowed to run at once (default: 2)")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--plan", metavar="FILE",
+                      help="Dry run: list and size what would be deleted, write the plan to FILE (.gz to compress)")
+    mode.add_argument("--execute-plan", metavar="FILE",
+                      help="Delete exactly the files listed in a plan written by --plan")
+    mode.add_argument("--retention", metavar="CONFIG",
+                      help="Only trim the directories that CONFIG (JSON) gives a byte or file quota, oldest first")
+    add_watch_arguments(parser)
+    return parser
+
+
+def parse_task_list(spec):
+    """argparse type for --tasks: registered task names."""
+    known = list(cleanup_registry())
+    if spec == "all":
+        return known
+    names = [name.strip() for name in spec.split(",") if name.strip()]
+    unknown = [name for name in names if name not in known]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown tasks: {', '.join(unknown)} (known: {', '.join(known)})")
+    return names
+
+
+def run_cleanup(args):
+    """Run the cleanup the parsed command line asks for and log a summary."""
+    results.failures_path = args.failures_file
+    results.progress_interval = args.progress_interval
+    if args.plan:
+        dry_run(cleanup_targets(args.tasks), args.plan)  # Listing needs no administrator rights
+        return
+    if args.watch:
+        # Runs until stopped; the user's own temp directory needs no administrator rights either
+        watch_from_args(args, [os.getenv('TEMP', "C:\\Windows\\Temp")], results.task("watch"))
+        results.log_summary()
+        results.close()
+        return
+
+    if not is_admin():
+        logging.error("You must run this script as an administrator.")
+        return
+
+    if args.execute_plan:
+        # Only the planned files; the command-line tasks are left out
+        execute_plan(load_plan(args.execute_plan), args.workers, results=results)
+    elif args.retention:
+        apply_retention(cleanup_targets(args.tasks), load_policies(args.retention), args.workers, results=results)
+    else:
+        index = ScanIndex(args.index) if args.index else None
+        registry = cleanup_registry(args.workers, index)
+        limits = {DISK: args.max_disk_tasks} if args.max_disk_tasks else None
+        # Registry order, not command-line order: it starts the long commands first
+        scheduler = CleanupScheduler([task for name, task in registry.items() if name in args.tasks], limits)
+        try:
+            scheduler.log_report(scheduler.run())
+        finally:
+            if index is not None:
+                index.close()
+
+    # Display summary of deleted and skipped files.
+    results.log_summary()
+    results.close()
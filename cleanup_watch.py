@@ -0,0 +1,336 @@
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import queue
+import select
+import signal
+import struct
+import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from cleanup_engine import delete_paths
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = Observer = None
+
+DEFAULT_MIN_AGE = 60 * 60.0  # Seconds a file must go unmodified before it is deleted
+DEFAULT_WATCH_BATCH = 64  # Files deleted at a time
+DEFAULT_WATCH_RATE = 200.0  # Files deleted per second at most
+WATCH_TICK = 1.0  # Longest wait for events before due candidates are looked at
+
+# What a backend reports about a path
+CHANGED = "changed"  # Created, written or moved in: the file's age starts again
+REMOVED = "removed"
+NEW_DIRECTORY = "new_directory"  # Needs watching and a one-off listing
+OVERFLOW = "overflow"  # Events were lost; the watched trees must be listed again
+
+WatchEvent = namedtuple("WatchEvent", ["path", "kind"])
+
+# inotify(7) constants
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x1000000
+IN_DONT_FOLLOW = 0x2000000
+IN_EXCL_UNLINK = 0x4000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+_INOTIFY_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+                 | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK)
+_INOTIFY_EVENT = struct.Struct("iIII")  # wd, mask, cookie, length of the name that follows
+
+
+class InotifyBackend:
+    """Linux inotify through libc, one watch per directory."""
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, f"inotify_init1: {os.strerror(error)}")
+        self.directories = {}  # wd: path
+
+    def add_watch(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), _INOTIFY_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOSPC:
+                logging.warning(f"Cannot watch {path}: out of inotify watches (raise fs.inotify.max_user_watches)")
+            elif error not in (errno.ENOENT, errno.ENOTDIR):
+                logging.warning(f"Cannot watch {path}: {os.strerror(error)}")
+            return
+        self.directories[wd] = path
+
+    def read_events(self, timeout):
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 256 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _INOTIFY_EVENT.unpack_from(data, offset)
+            name = data[offset + _INOTIFY_EVENT.size:offset + _INOTIFY_EVENT.size + length].rstrip(b"\0")
+            offset += _INOTIFY_EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                events.append(WatchEvent(None, OVERFLOW))
+                continue
+            if mask & IN_IGNORED:
+                self.directories.pop(wd, None)  # The directory is gone and so is its watch
+                continue
+            directory = self.directories.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                events.append(WatchEvent(path, REMOVED))
+            elif mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    events.append(WatchEvent(path, NEW_DIRECTORY))
+            else:
+                events.append(WatchEvent(path, CHANGED))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class WatchdogBackend:
+    """The watchdog package (ReadDirectoryChangesW on Windows, FSEvents on macOS); it watches subtrees itself."""
+
+    def __init__(self):
+        if Observer is None:
+            raise RuntimeError("The watchdog backend requires the 'watchdog' package")
+        self.events = queue.SimpleQueue()
+        self.observer = Observer()
+        self.handler = FileSystemEventHandler()
+        self.handler.on_any_event = self._queue
+        self.watched = []
+        self.observer.start()
+
+    def _queue(self, event):
+        if event.event_type == "moved":
+            self.events.put(WatchEvent(event.src_path, REMOVED))
+            self.events.put(WatchEvent(event.dest_path, NEW_DIRECTORY if event.is_directory else CHANGED))
+        elif event.event_type == "deleted":
+            self.events.put(WatchEvent(event.src_path, REMOVED))
+        elif event.is_directory:
+            if event.event_type == "created":
+                self.events.put(WatchEvent(event.src_path, NEW_DIRECTORY))
+        elif event.event_type in ("created", "modified", "closed"):
+            self.events.put(WatchEvent(event.src_path, CHANGED))
+
+    def add_watch(self, path):
+        if any(path == root or path.startswith(os.path.join(root, "")) for root in self.watched):
+            return  # Already covered by a recursive watch
+        self.watched.append(path)
+        self.observer.schedule(self.handler, path, recursive=True)
+
+    def read_events(self, timeout):
+        try:
+            events = [self.events.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
+    def close(self):
+        self.observer.stop()
+        self.observer.join()
+
+
+BACKENDS = {"inotify": InotifyBackend, "watchdog": WatchdogBackend}
+
+
+def open_backend(name=None):
+    """The named backend, or by default inotify on Linux and watchdog elsewhere."""
+    if name is None:
+        name = "inotify" if sys.platform.startswith("linux") else "watchdog"
+    return BACKENDS[name]()
+
+
+class TempWatcher:
+    """Keeps watched directories trimmed as files age, instead of sweeping them now and then.
+
+    The trees are listed once at start; after that only change events are
+    read. Every file seen is a candidate keyed by its last change, oldest
+    first, so the due ones are always at the front. Once a candidate has gone
+    `min_age` seconds without changing it is deleted, at most `rate` files a
+    second in batches of `batch_size`, which keeps the disk load flat; while
+    due files remain, the loop wakes for each batch instead of every tick.
+    Deletions and failures are counted in `recorder` (a TaskRecorder), if
+    given, so nothing grows with the time spent watching.
+    """
+
+    def __init__(self, roots, backend=None, min_age=DEFAULT_MIN_AGE, batch_size=DEFAULT_WATCH_BATCH,
+                 rate=DEFAULT_WATCH_RATE, recorder=None):
+        self.roots = list(roots)
+        self.backend = backend or open_backend()
+        self.min_age = min_age
+        self.batch_size = batch_size
+        self.rate = rate
+        self.recorder = recorder
+        self.candidates = OrderedDict()  # path: time.monotonic() of its last change, oldest first
+        self.stopping = threading.Event()
+        self.deleted = 0
+
+    def _touch(self, path, changed):
+        self.candidates[path] = changed
+        self.candidates.move_to_end(path)
+
+    def _add_tree(self, root):
+        # Watch first, then list, so nothing created in between is missed
+        now_wall, now = time.time(), time.monotonic()
+        found = []
+        pending = [root]
+        while pending:
+            directory = pending.pop()
+            self.backend.add_watch(directory)
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                pending.append(entry.path)
+                            else:
+                                found.append((now - max(0.0, now_wall - entry.stat(follow_symlinks=False).st_mtime),
+                                              entry.path))
+                        except OSError:
+                            continue
+            except OSError as e:
+                logging.debug(f"Cannot list {e.filename}: {e}")
+        for changed, path in sorted(found):
+            if path not in self.candidates:
+                self._touch(path, changed)
+        return len(found)
+
+    def _apply(self, events):
+        now = time.monotonic()
+        rescan = False
+        for path, kind in events:
+            if kind == CHANGED:
+                self._touch(path, now)
+            elif kind == REMOVED:
+                self.candidates.pop(path, None)
+            elif kind == NEW_DIRECTORY:
+                self._add_tree(path)
+            elif kind == OVERFLOW:
+                rescan = True
+        if rescan:
+            logging.warning("Change events were lost; listing the watched directories again.")
+            for root in self.roots:
+                self._add_tree(root)
+
+    def _due(self, limit):
+        # Ages are rechecked against the file itself: a write through mmap, say, raises no event
+        now, now_wall = time.monotonic(), time.time()
+        due = []
+        while self.candidates and len(due) < limit:
+            path, changed = next(iter(self.candidates.items()))
+            if now - changed < self.min_age:
+                break
+            del self.candidates[path]
+            try:
+                age = now_wall - os.lstat(path).st_mtime
+            except OSError:
+                continue  # Already gone
+            if age < self.min_age:
+                self._touch(path, now)  # Written behind our back; counting from now keeps the order intact
+            else:
+                due.append(path)
+        return due
+
+    def _next_due(self, now):
+        # Seconds until the oldest candidate is due (0 if it already is), or None if there are none
+        if not self.candidates:
+            return None
+        return max(0.0, self.min_age - (now - next(iter(self.candidates.values()))))
+
+    def stop(self):
+        self.stopping.set()
+
+    def run(self):
+        """Watch until stop() is called."""
+        for root in self.roots:
+            logging.info(f"Watching {root}: {self._add_tree(root)} files already there.")
+        # A tick's worth of tokens, so `rate` is reachable even when no events wake the loop early
+        capacity = max(float(self.batch_size), self.rate * WATCH_TICK)
+        tokens = capacity
+        last = time.monotonic()
+        wait = WATCH_TICK
+        try:
+            while not self.stopping.is_set():
+                self._apply(self.backend.read_events(wait))
+                now = time.monotonic()
+                tokens = min(capacity, tokens + (now - last) * self.rate)
+                last = now
+                while tokens >= 1.0:
+                    due = self._due(min(self.batch_size, int(tokens)))
+                    if not due:
+                        break
+                    tokens -= len(due)
+                    result = delete_paths(due, workers=1, recorder=self.recorder)
+                    self.deleted += result.deleted
+                    for path, _ in result.failed:
+                        self._touch(path, now)  # Locked: it gets another `min_age` before the next attempt
+                next_due = self._next_due(time.monotonic())
+                wait = WATCH_TICK
+                if next_due is not None:
+                    # Wake when the oldest candidate is due and a batch's worth of tokens is back
+                    refill = max(0.0, min(self.batch_size, capacity) - tokens) / self.rate if self.rate else WATCH_TICK
+                    wait = min(WATCH_TICK, max(next_due, refill))
+        finally:
+            self.backend.close()
+            logging.info(f"Stopped watching after deleting {self.deleted} files "
+                         f"({len(self.candidates)} still waiting).")
+
+
+def add_watch_arguments(parser):
+    """Add the watch-mode options to an argparse parser."""
+    group = parser.add_argument_group("watch mode")
+    group.add_argument("--watch", action="store_true",
+                       help="Keep running and delete files from the temp directory as they age, instead of sweeping")
+    group.add_argument("--watch-dir", action="append", default=[], metavar="DIR",
+                       help="Watch this directory too (repeatable)")
+    group.add_argument("--min-age", type=float, default=DEFAULT_MIN_AGE,
+                       help="Seconds a file must go unmodified before it is deleted (default: %(default)s)")
+    group.add_argument("--watch-rate", type=float, default=DEFAULT_WATCH_RATE,
+                       help="Files deleted per second at most (default: %(default)s)")
+    group.add_argument("--watch-backend", choices=sorted(BACKENDS),
+                       help="Change notification backend (default: inotify on Linux, watchdog elsewhere)")
+    return group
+
+
+def watch_from_args(args, roots, recorder=None):
+    """Run a TempWatcher over `roots` plus --watch-dir until SIGINT or SIGTERM."""
+    watcher = TempWatcher(list(roots) + args.watch_dir, open_backend(args.watch_backend), args.min_age,
+                          rate=args.watch_rate, recorder=recorder)
+    signal.signal(signal.SIGTERM, lambda signum, frame: watcher.stop())
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    return watcher
@@ -0,0 +1,234 @@
+import argparse
+import mmap
+import os
+import socket
+import struct
+import threading
+import time
+from collections import Counter, namedtuple
+
+DEFAULT_JOURNAL_SIZE = 65536  # Connections remembered per process (32 bytes each)
+
+# Why a connection ended; stored as the index into this tuple
+SERVED = "served"
+REJECTED = "rejected"  # Turned away by admission control
+DROPPED = "dropped"  # Closed before being served: failed handshake or full handshake queue
+ERROR = "error"
+OUTCOMES = (SERVED, REJECTED, DROPPED, ERROR)
+
+# Fixed-size record: wall-clock start, duration in seconds, port, peer address
+# (IPv4 stored IPv4-mapped in 16 bytes), TLS flag and outcome index.
+_RECORD = struct.Struct("=dfH16sBB")
+_HEADER = struct.Struct("=8sIIQ")  # Magic, record size, capacity, records written so far
+_MAGIC = b"CONNJRNL"
+_V4_MAPPED = b"\0" * 10 + b"\xff\xff"
+_NO_ADDRESS = b"\0" * 16
+
+Connection = namedtuple("Connection", ["timestamp", "duration", "port", "address", "tls", "outcome"])
+
+
+def _pack_address(address):
+    host = address[0] if isinstance(address, tuple) and address else None
+    try:
+        if len(address) == 2:
+            return _V4_MAPPED + socket.inet_pton(socket.AF_INET, host)
+        return socket.inet_pton(socket.AF_INET6, host)
+    except (OSError, TypeError, ValueError):
+        return _NO_ADDRESS  # Unix sockets and the like
+
+
+def _unpack_address(packed):
+    if packed.startswith(_V4_MAPPED):
+        return socket.inet_ntop(socket.AF_INET, packed[12:])
+    return socket.inet_ntop(socket.AF_INET6, packed)
+
+
+class ConnectionJournal:
+    """Fixed-size ring of connection records in one preallocated buffer.
+
+    Each record is a 32-byte struct, so memory is capped at 32 * `capacity`
+    bytes no matter how many connections arrive; the oldest records are
+    overwritten first. With `path` the buffer is a memory-mapped file that
+    survives the process and can be queried from another one (see main()).
+    Queries walk the packed records directly rather than any log text.
+    """
+
+    def __init__(self, capacity=DEFAULT_JOURNAL_SIZE, path=None, readonly=False):
+        self.lock = threading.Lock()
+        self.path = path
+        self.readonly = readonly
+        self.file = None
+        size = _HEADER.size + capacity * _RECORD.size
+        if path is None:
+            self.buffer = bytearray(size)
+            self.capacity, self.written = capacity, 0
+        else:
+            self._map(path, size, readonly)
+        if not readonly:
+            _HEADER.pack_into(self.buffer, 0, _MAGIC, _RECORD.size, self.capacity, self.written)
+
+    def _map(self, path, size, readonly):
+        self.file = open(path, "rb" if readonly else "a+b")
+        existing = os.fstat(self.file.fileno()).st_size
+        header = None
+        if existing >= _HEADER.size:
+            self.file.seek(0)
+            header = _HEADER.unpack(self.file.read(_HEADER.size))
+        if readonly:
+            if header is None or header[:2] != (_MAGIC, _RECORD.size):
+                raise ValueError(f"{path} is not a connection journal")
+            self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.capacity, self.written = header[2], header[3]
+            return
+        if header is not None and header[:2] == (_MAGIC, _RECORD.size) and existing == size:
+            self.written = header[3]  # Same layout: keep appending to what an earlier run left
+        else:
+            self.file.truncate(0)
+            self.written = 0
+        self.file.truncate(size)
+        self.buffer = mmap.mmap(self.file.fileno(), size)
+        self.capacity = (size - _HEADER.size) // _RECORD.size
+
+    def record(self, port, address, tls, outcome, duration=0.0, started=None):
+        """Append one connection; `started` is a time.time() value (default: now)."""
+        if started is None:
+            started = time.time()
+        packed_address = _pack_address(address)
+        with self.lock:
+            offset = _HEADER.size + (self.written % self.capacity) * _RECORD.size
+            _RECORD.pack_into(self.buffer, offset, started, duration, port, packed_address, bool(tls),
+                              OUTCOMES.index(outcome))
+            self.written += 1
+            _HEADER.pack_into(self.buffer, 0, _MAGIC, _RECORD.size, self.capacity, self.written)
+
+    def _raw(self):
+        # Copy the live part of the ring under the lock, oldest record first
+        with self.lock:
+            if self.readonly:
+                self.written = _HEADER.unpack_from(self.buffer)[3]  # The writing process may still be running
+            count = min(self.written, self.capacity)
+            start = self.written % self.capacity if self.written > self.capacity else 0
+            split = _HEADER.size + start * _RECORD.size
+            end = _HEADER.size + count * _RECORD.size
+            if start:
+                return bytes(self.buffer[split:end]) + bytes(self.buffer[_HEADER.size:split])
+            return bytes(self.buffer[_HEADER.size:end])
+
+    def _select(self, since=None, until=None, port=None, outcome=None):
+        outcome_index = None if outcome is None else OUTCOMES.index(outcome)
+        for started, duration, record_port, address, tls, record_outcome in _RECORD.iter_unpack(self._raw()):
+            if since is not None and started < since or until is not None and started >= until:
+                continue
+            if port is not None and record_port != port:
+                continue
+            if outcome_index is not None and record_outcome != outcome_index:
+                continue
+            yield started, duration, record_port, address, tls, record_outcome
+
+    def records(self, since=None, until=None, port=None, outcome=None):
+        """Matching connections as Connection tuples, oldest first."""
+        return [Connection(started, duration, record_port, _unpack_address(address), bool(tls), OUTCOMES[index])
+                for started, duration, record_port, address, tls, index in self._select(since, until, port, outcome)]
+
+    def count(self, since=None, until=None, port=None, outcome=None):
+        """Connections started in [since, until) (time.time() values), optionally for one port or outcome."""
+        return sum(1 for _ in self._select(since, until, port, outcome))
+
+    def top_ports(self, n=10, since=None, outcome=None):
+        """[(port, connections), ...] for the `n` busiest ports."""
+        return Counter(record[2] for record in self._select(since, outcome=outcome)).most_common(n)
+
+    def top_sources(self, n=10, since=None, port=None, outcome=None):
+        """[(address, connections), ...] for the `n` most frequent peers."""
+        counts = Counter(record[3] for record in self._select(since, port=port, outcome=outcome))
+        return [(_unpack_address(address), total) for address, total in counts.most_common(n)]
+
+    def outcomes(self, since=None, port=None):
+        """{outcome: connections} over the matching records."""
+        counts = Counter(record[5] for record in self._select(since, port=port))
+        return {OUTCOMES[index]: total for index, total in counts.items()}
+
+    def timeline(self, interval=60.0, since=None, port=None, outcome=None):
+        """{window start: connections} in `interval`-second windows, oldest first."""
+        counts = Counter(record[0] // interval * interval for record in self._select(since, port=port,
+                                                                                   outcome=outcome))
+        return dict(sorted(counts.items()))
+
+    def stats(self):
+        with self.lock:
+            written = self.written
+        return {"journal_records": min(written, self.capacity), "journal_overwritten": max(0, written - self.capacity)}
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.buffer.close()
+                self.file.close()
+                self.file = None
+
+
+def open_journal(capacity, path=None, worker_id=None):
+    """Build a journal, or None when `capacity` is 0.
+
+    Worker processes each get their own file (`path`.<worker_id>), since the
+    ring is only locked within one process.
+    """
+    if not capacity:
+        return None
+    if path is not None and worker_id is not None:
+        path = f"{path}.{worker_id}"
+    return ConnectionJournal(capacity, path)
+
+
+def add_journal_arguments(parser):
+    """Add the connection-journal options shared by the listener scripts to an argparse parser."""
+    group = parser.add_argument_group("connection journal")
+    group.add_argument("--journal-size", type=int, default=DEFAULT_JOURNAL_SIZE,
+                       help=f"Connections remembered in memory, {_RECORD.size} bytes each (0: no journal)")
+    group.add_argument("--journal-file",
+                       help="Keep the journal in this memory-mapped file (one per worker: FILE.<worker>) "
+                            "so it can be queried with connection_journal.py")
+    return group
+
+
+def journal_from_args(args, worker_id=None):
+    return open_journal(args.journal_size, args.journal_file, worker_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query connection journals written with --journal-file.")
+    parser.add_argument("files", nargs="+", help="Journal files (e.g. every worker's)")
+    parser.add_argument("--since", type=float, help="Only connections from the last SINCE seconds")
+    parser.add_argument("--port", type=int, help="Only connections to this port")
+    parser.add_argument("--top", type=int, default=10, help="Ports and sources to list")
+    parser.add_argument("--interval", type=float, default=60.0, help="Window length for the timeline, in seconds")
+    args = parser.parse_args()
+
+    since = time.time() - args.since if args.since else None
+    ports, sources, outcomes, timeline = Counter(), Counter(), Counter(), Counter()
+    for path in args.files:
+        journal = ConnectionJournal(path=path, readonly=True)
+        try:
+            if args.port is None:
+                ports.update(dict(journal.top_ports(None, since)))
+            sources.update(dict(journal.top_sources(None, since, args.port)))
+            outcomes.update(journal.outcomes(since, args.port))
+            timeline.update(journal.timeline(args.interval, since, args.port))
+        finally:
+            journal.close()
+
+    print(f"Connections: {sum(outcomes.values())} ({', '.join(f'{k}: {v}' for k, v in outcomes.items()) or '-'})")
+    if ports:
+        print("Top ports:")
+        for port, total in ports.most_common(args.top):
+            print(f"  {port:>5}  {total}")
+    print("Top sources:")
+    for address, total in sources.most_common(args.top):
+        print(f"  {address:<39}  {total}")
+    print(f"Connections per {args.interval:g}s:")
+    for window in sorted(timeline):
+        print(f"  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(window))}  {timeline[window]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import queue
+import select
+import ssl
+import threading
+import time
+
+from listener_logging import connection_log
+from listener_metrics import metrics
+
+DEFAULT_HANDSHAKE_WORKERS = 4
+DEFAULT_HANDSHAKE_QUEUE = 128  # Accepted sockets allowed to wait for a handshake worker
+DEFAULT_HANDSHAKE_TIMEOUT = 5.0  # Seconds for the whole handshake, not per read
+REJECT_LOG_INTERVAL = 10.0  # Seconds between summaries of clients dropped on a full queue
+
+
+def _wait_for_socket(sock, want_write, timeout):
+    """Wait until `sock` is readable/writable; poll() avoids select()'s 1024-descriptor limit."""
+    if hasattr(select, "poll"):
+        poller = select.poll()
+        poller.register(sock, select.POLLOUT if want_write else select.POLLIN)
+        return bool(poller.poll(timeout * 1000))
+    if want_write:
+        return bool(select.select([], [sock], [], timeout)[1])
+    return bool(select.select([sock], [], [], timeout)[0])
+
+
+class HandshakePool:
+    """Bounded pool of threads that run server-side TLS handshakes for accepted plain TCP sockets.
+
+    The accept loop only calls submit(); a full queue rejects the client instead
+    of blocking the port, and rejects are logged as one summary per
+    REJECT_LOG_INTERVAL rather than a line per client. Finished handshakes are passed to
+    ``on_ready(tls_socket, address, port)`` on the worker thread; clients that
+    are closed instead trigger the optional ``on_dropped()``.
+    """
+
+    def __init__(self, workers=DEFAULT_HANDSHAKE_WORKERS, max_queue=DEFAULT_HANDSHAKE_QUEUE,
+                 timeout=DEFAULT_HANDSHAKE_TIMEOUT):
+        self.timeout = timeout
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.lock = threading.Lock()
+        self.counters = {
+            "submitted": 0,
+            "rejected": 0,  # Queue was full
+            "completed": 0,
+            "failed": 0,
+            "timed_out": 0,
+            "peak_queue_depth": 0,
+            "queue_wait_seconds": 0.0,
+            "handshake_seconds": 0.0,
+            "max_handshake_seconds": 0.0,
+        }
+        self.unlogged_rejects = 0
+        self.last_reject_log = 0.0
+        self.threads = []
+        for index in range(workers):
+            thread = threading.Thread(target=self._worker, name=f"handshake-{index}", daemon=True)
+            self.threads.append(thread)
+            thread.start()
+
+    def submit(self, client_socket, address, port, ssl_context, on_ready, on_dropped=None):
+        """Queue a handshake. Returns False (and closes the socket) if the queue is full."""
+        try:
+            self.queue.put_nowait((client_socket, address, port, ssl_context, on_ready, on_dropped,
+                                   time.monotonic()))
+        except queue.Full:
+            now = time.monotonic()
+            with self.lock:
+                self.counters["rejected"] += 1
+                self.unlogged_rejects += 1
+                dropped = 0
+                if now - self.last_reject_log >= REJECT_LOG_INTERVAL:
+                    dropped, self.unlogged_rejects, self.last_reject_log = self.unlogged_rejects, 0, now
+            if dropped:
+                connection_log.warning("Handshake queue full; dropped %s connections since the last report "
+                                       "(latest from %s on port %s)", dropped, address, port)
+            client_socket.close()
+            if on_dropped is not None:
+                on_dropped()
+            return False
+        depth = self.queue.qsize()
+        with self.lock:
+            self.counters["submitted"] += 1
+            if depth > self.counters["peak_queue_depth"]:
+                self.counters["peak_queue_depth"] = depth
+        return True
+
+    def stats(self):
+        """Snapshot of the counters plus the current queue depth and mean handshake latency."""
+        with self.lock:
+            snapshot = dict(self.counters)
+        snapshot["queue_depth"] = self.queue.qsize()
+        done = snapshot["completed"] + snapshot["failed"] + snapshot["timed_out"]
+        snapshot["mean_handshake_seconds"] = snapshot["handshake_seconds"] / done if done else 0.0
+        return snapshot
+
+    def _handshake(self, client_socket, ssl_context):
+        client_socket.setblocking(False)
+        tls_socket = ssl_context.wrap_socket(client_socket, server_side=True, do_handshake_on_connect=False)
+        deadline = time.monotonic() + self.timeout
+        try:
+            while True:
+                try:
+                    tls_socket.do_handshake()
+                    break
+                except ssl.SSLWantReadError:
+                    want_write = False
+                except ssl.SSLWantWriteError:
+                    want_write = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not _wait_for_socket(tls_socket, want_write, remaining):
+                    raise TimeoutError("TLS handshake timed out")
+        except Exception:
+            tls_socket.close()
+            raise
+        tls_socket.setblocking(True)
+        return tls_socket
+
+    def _worker(self):
+        while True:
+            client_socket, address, port, ssl_context, on_ready, on_dropped, queued_at = self.queue.get()
+            started = time.monotonic()
+            outcome = "completed"
+            tls_socket = None
+            try:
+                tls_socket = self._handshake(client_socket, ssl_context)
+            except TimeoutError:
+                outcome = "timed_out"
+                connection_log.warning("SSL handshake timed out on port %s from %s", port, address)
+            except ssl.SSLError as ssl_error:
+                outcome = "failed"
+                connection_log.error("SSL handshake error on port %s: %s", port, ssl_error)
+            except OSError as e:
+                outcome = "failed"
+                connection_log.error("General error on port %s: %s", port, e)
+            elapsed = time.monotonic() - started
+            with self.lock:
+                self.counters[outcome] += 1
+                self.counters["queue_wait_seconds"] += started - queued_at
+                self.counters["handshake_seconds"] += elapsed
+                if elapsed > self.counters["max_handshake_seconds"]:
+                    self.counters["max_handshake_seconds"] = elapsed
+            if outcome == "completed":
+                metrics.observe("handshake", port, elapsed)
+            else:
+                metrics.inc("handshake_failures", port)
+
+            if tls_socket is None:
+                client_socket.close()
+                if on_dropped is not None:
+                    on_dropped()
+                continue
+            try:
+                on_ready(tls_socket, address, port)
+            except Exception as e:
+                connection_log.error("Error handling client on port %s: %s", port, e)
+                tls_socket.close()
+                if on_dropped is not None:
+                    on_dropped()
@@ -0,0 +1,148 @@
+from collections import namedtuple
+
+MAX_HEAD_BYTES = 16384  # Request line + headers
+MAX_HEADERS = 100
+MAX_BODY_BYTES = 1024 * 1024  # Bodies are skipped, but we refuse to read absurd ones
+BUFFER_SIZE = 2 * MAX_HEAD_BYTES  # Per connection, reused for every request on it
+
+# headers maps lower-cased header names to values, both as bytes
+Request = namedtuple("Request", ["method", "path", "version", "headers", "content_length", "keep_alive"])
+
+_REASONS = {
+    400: b"Bad Request",
+    411: b"Length Required",
+    413: b"Payload Too Large",
+    431: b"Request Header Fields Too Large",
+}
+
+
+def _error_response(status):
+    reason = _REASONS[status]
+    return (
+        b"HTTP/1.1 %d %s\r\n"
+        b"Content-Type: text/plain\r\n"
+        b"Content-Length: %d\r\n"
+        b"Connection: close\r\n"
+        b"\r\n"
+        b"%s" % (status, reason, len(reason), reason)
+    )
+
+
+ERROR_RESPONSES = {status: _error_response(status) for status in _REASONS}
+
+
+class RequestError(Exception):
+    """A request we refuse to parse; `response` is the complete reply to send before closing."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.response = ERROR_RESPONSES[status]
+
+
+def parse_head(head):
+    """Parse a request head (without the blank line) into a Request."""
+    lines = head.split(b"\r\n")
+    parts = lines[0].split(b" ")
+    if len(parts) != 3 or not parts[2].startswith(b"HTTP/1."):
+        raise RequestError(400, "Malformed request line")
+    if len(lines) - 1 > MAX_HEADERS:
+        raise RequestError(431, "Too many headers")
+
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(b":")
+        if not sep or not name or name != name.strip():
+            raise RequestError(400, "Malformed header line")
+        headers[name.lower()] = value.strip()
+
+    if b"chunked" in headers.get(b"transfer-encoding", b"").lower():
+        raise RequestError(411, "Chunked request bodies are not supported")
+    try:
+        content_length = int(headers.get(b"content-length", b"0"))
+    except ValueError:
+        raise RequestError(400, "Invalid Content-Length")
+    if content_length < 0:
+        raise RequestError(400, "Invalid Content-Length")
+    if content_length > MAX_BODY_BYTES:
+        raise RequestError(413, "Request body too large")
+
+    version = parts[2]
+    connection = headers.get(b"connection", b"").lower()
+    if version == b"HTTP/1.1":
+        keep_alive = b"close" not in connection
+    else:
+        keep_alive = b"keep-alive" in connection
+    return Request(parts[0].decode("latin-1"), parts[1].decode("latin-1"), version.decode("latin-1"),
+                   headers, content_length, keep_alive)
+
+
+class RequestParser:
+    """Incremental HTTP/1.x request parser over one reusable receive buffer.
+
+    Data is received straight into a preallocated bytearray (recv_into() for
+    sockets, feed() for asyncio streams). The terminator search resumes where
+    the previous one stopped, and consumed bytes are only compacted away when
+    the tail of the buffer runs out. Request bodies are skipped.
+    """
+
+    def __init__(self, buffer_size=BUFFER_SIZE, max_head_bytes=MAX_HEAD_BYTES):
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.max_head_bytes = max_head_bytes
+        self.start = 0  # First unconsumed byte
+        self.end = 0  # End of received data
+        self.scanned = 0  # Bytes after `start` already searched for the blank line
+        self.discard = 0  # Body bytes of the previous request still to skip
+
+    def room(self):
+        """Compact if needed and return how many bytes can be received next."""
+        if self.start == self.end:
+            self.start = self.end = 0
+        elif self.end == len(self.buffer) and self.start:
+            pending = self.end - self.start
+            self.buffer[:pending] = self.buffer[self.start:self.end]
+            self.start, self.end = 0, pending
+        return len(self.buffer) - self.end
+
+    def recv_into(self, sock):
+        """Receive from a blocking socket into the buffer; returns the byte count (0 on EOF)."""
+        room = self.room()
+        received = sock.recv_into(self.view[self.end:self.end + room])
+        self.end += received
+        return received
+
+    def feed(self, data):
+        """Copy bytes from a stream read of at most room() bytes into the buffer."""
+        self.room()
+        size = len(data)
+        self.view[self.end:self.end + size] = data
+        self.end += size
+
+    def next_request(self):
+        """Return the next complete Request, or None if more data is needed."""
+        if self.discard:
+            skipped = min(self.discard, self.end - self.start)
+            self.start += skipped
+            self.discard -= skipped
+            if self.discard:
+                return None
+
+        search_from = self.start + max(self.scanned - 3, 0)
+        blank_line = self.buffer.find(b"\r\n\r\n", search_from, self.end)
+        if blank_line < 0:
+            self.scanned = self.end - self.start
+            if self.scanned > self.max_head_bytes:
+                raise RequestError(431, "Request head too large")
+            return None
+        if blank_line - self.start > self.max_head_bytes:
+            raise RequestError(431, "Request head too large")
+
+        request = parse_head(bytes(self.view[self.start:blank_line]))
+        self.start = blank_line + 4
+        self.scanned = 0
+        self.discard = request.content_length
+        skipped = min(self.discard, self.end - self.start)
+        self.start += skipped
+        self.discard -= skipped
+        return request
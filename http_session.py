@@ -0,0 +1,174 @@
+import asyncio
+import socket
+import time
+
+from http_parser import RequestError, RequestParser
+from lifecycle import shutdown
+from listener_logging import connection_log
+from listener_metrics import metrics
+from response_cache import FileResponse
+
+DEFAULT_IDLE_TIMEOUT = 5.0  # Seconds a kept-alive connection may sit idle between requests
+DEFAULT_MAX_REQUESTS = 100  # Requests served on one connection before it is closed
+
+SSL_RESPONSE = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: text/plain\r\n"
+    b"Content-Length: 20\r\n"
+    b"\r\n"
+    b"Hello from SSL Port!"
+)
+PLAIN_RESPONSE = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: text/plain\r\n"
+    b"Content-Length: 24\r\n"
+    b"\r\n"
+    b"Hello from Non-SSL Port!"
+)
+
+MAX_CONNECTION_VARIANTS = 4096
+
+_connection_variants = {}  # (response, keep_alive) -> response with a Connection header
+
+
+def with_connection_header(response, keep_alive):
+    """Return `response` with a Connection header added; variants are built once and reused."""
+    if isinstance(response, FileResponse):
+        return response._replace(header=with_connection_header(response.header, keep_alive))
+    key = (response, keep_alive)
+    variant = _connection_variants.get(key)
+    if variant is None:
+        header = b"\r\nConnection: keep-alive\r\n\r\n" if keep_alive else b"\r\nConnection: close\r\n\r\n"
+        variant = response.replace(b"\r\n\r\n", header, 1)
+        if len(_connection_variants) >= MAX_CONNECTION_VARIANTS:
+            _connection_variants.clear()  # Reloaded files leave stale variants behind
+        _connection_variants[key] = variant
+    return variant
+
+
+def build_replies(parser, pick_response, port, served, max_requests):
+    """Build the responses for every complete (possibly pipelined) request in `parser`.
+
+    Returns ``(parts, served, keep_open)``. Consecutive in-memory replies are
+    joined so they go out in one write; FileResponse parts are sent with
+    sendfile. A malformed request gets its error response and closes the
+    connection.
+    """
+    parts = []
+    replies = []
+    keep_open = True
+    while keep_open:
+        try:
+            request = parser.next_request()
+        except RequestError as e:
+            connection_log.warning("Bad request on port %s: %s", port, e)
+            metrics.inc("request_errors", port)
+            replies.append(e.response)
+            keep_open = False
+            break
+        if request is None:
+            break
+        served += 1
+        keep_open = served < max_requests and request.keep_alive
+        response = with_connection_header(pick_response(request), keep_open)
+        if isinstance(response, FileResponse):
+            replies.append(response.header)
+            parts.append(b"".join(replies))
+            parts.append(response)
+            replies = []
+        else:
+            replies.append(response)
+    if replies:
+        parts.append(b"".join(replies))
+    return parts, served, keep_open
+
+
+def record_batch(port, parts, requests, started):
+    """Account a written batch: bytes sent, requests and per-request service time."""
+    sent = sum(part.size if isinstance(part, FileResponse) else len(part) for part in parts)
+    metrics.inc("bytes_sent", port, sent)
+    if requests:
+        metrics.inc("requests", port, requests)
+        elapsed = time.perf_counter() - started
+        for _ in range(requests):
+            metrics.observe("request", port, elapsed)
+
+
+def send_parts(client_socket, parts):
+    for part in parts:
+        if isinstance(part, FileResponse):
+            with open(part.path, "rb") as file:
+                client_socket.sendfile(file, 0, part.size)  # Zero-copy on plain sockets
+        else:
+            client_socket.sendall(part)
+
+
+async def send_parts_async(writer, parts):
+    for part in parts:
+        if isinstance(part, FileResponse):
+            await writer.drain()
+            with open(part.path, "rb") as file:
+                await asyncio.get_running_loop().sendfile(writer.transport, file, 0, part.size)
+        else:
+            writer.write(part)
+    await writer.drain()
+
+
+def _request_limit(served, max_requests):
+    # While draining, answer what the client already sent and then close
+    return served + 1 if shutdown.stopping.is_set() else max_requests
+
+
+def serve_connection(client_socket, port, pick_response, idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                     max_requests=DEFAULT_MAX_REQUESTS):
+    """Serve requests on a blocking socket until the client closes, idles out or hits max_requests.
+
+    ``pick_response(request)`` returns the response bytes for a parsed
+    Request. The socket is always closed. Returns the number of requests served.
+    """
+    client_socket.settimeout(idle_timeout)
+    parser = RequestParser()
+    served = 0
+    try:
+        while served < max_requests:
+            try:
+                if not parser.recv_into(client_socket):
+                    break
+            except socket.timeout:
+                break  # Idle connection
+            started = time.perf_counter()
+            parts, batch_served, keep_open = build_replies(parser, pick_response, port, served,
+                                                           _request_limit(served, max_requests))
+            send_parts(client_socket, parts)
+            record_batch(port, parts, batch_served - served, started)
+            served = batch_served
+            if not keep_open:
+                break
+    finally:
+        client_socket.close()
+    return served
+
+
+async def serve_connection_async(reader, writer, port, pick_response, idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                                 max_requests=DEFAULT_MAX_REQUESTS):
+    """asyncio counterpart of serve_connection(); the caller closes the writer."""
+    parser = RequestParser()
+    served = 0
+    while served < max_requests:
+        try:
+            data = await asyncio.wait_for(reader.read(parser.room()), idle_timeout)
+        except asyncio.TimeoutError:
+            break  # Idle connection
+        if not data:
+            break
+        parser.feed(data)
+        started = time.perf_counter()
+        parts, batch_served, keep_open = build_replies(parser, pick_response, port, served,
+                                                       _request_limit(served, max_requests))
+        if parts:
+            await send_parts_async(writer, parts)
+        record_batch(port, parts, batch_served - served, started)
+        served = batch_served
+        if not keep_open:
+            break
+    return served
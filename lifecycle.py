@@ -0,0 +1,119 @@
+import logging
+import os
+import signal
+import threading
+import time
+
+import listener_logging
+
+DEFAULT_DRAIN_TIMEOUT = 30.0  # Seconds open connections get to finish after a graceful stop
+STOP_POLL_INTERVAL = 0.5  # How often accept loops look at the stop flag
+
+
+class GracefulShutdown:
+    """Process-wide stop flag for a graceful shutdown.
+
+    request_stop() (SIGTERM once install() has run) sets `stopping` and runs
+    the registered callbacks on a helper thread: accept loops stop and close
+    their sockets, kept-alive connections are closed after their current
+    request, and the caller then waits for open connections to drain. A
+    second SIGTERM exits immediately.
+    """
+
+    def __init__(self):
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.callbacks = []
+
+    def on_stop(self, callback):
+        """Run `callback()` when a stop is requested (right away if one already was)."""
+        with self.lock:
+            if not self.stopping.is_set():
+                self.callbacks.append(callback)
+                return
+        callback()
+
+    def request_stop(self):
+        with self.lock:
+            if self.stopping.is_set():
+                return
+            self.stopping.set()
+            callbacks, self.callbacks = self.callbacks, []
+        logging.info("Graceful shutdown requested; no longer accepting connections.")
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logging.error(f"Error while stopping: {e}")
+
+    def install(self):
+        """Make SIGTERM request a graceful stop; a second SIGTERM forces the exit."""
+        def handle_term(signum, frame):
+            if self.stopping.is_set():
+                logging.warning("Second SIGTERM; exiting without waiting for open connections.")
+                exit_now(1)
+            threading.Thread(target=self.request_stop, name="graceful-stop", daemon=True).start()
+
+        signal.signal(signal.SIGTERM, handle_term)
+
+
+shutdown = GracefulShutdown()  # Process-wide instance used by the listeners
+
+
+def on_signal(name, callback):
+    """Run `callback()` on a helper thread whenever signal `name` (e.g. "SIGHUP") arrives.
+
+    Returns False where the platform has no such signal (SIGHUP on Windows).
+    """
+    signum = getattr(signal, name, None)
+    if signum is None:
+        return False
+
+    def handle(signum, frame):
+        threading.Thread(target=callback, name=f"{name.lower()}-handler", daemon=True).start()
+
+    signal.signal(signum, handle)
+    return True
+
+
+def join_threads(threads):
+    """Join `threads` in short slices so the main thread keeps running signal handlers.
+
+    CPython only runs a handler on the main thread, and a signal the kernel
+    delivers to another thread does not interrupt an untimed join().
+    """
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(STOP_POLL_INTERVAL)
+
+
+def exit_now(code=0):
+    """Flush the log queue and exit without joining threads.
+
+    Client threads may sit in recv() for a whole idle timeout, and a normal
+    interpreter exit would wait for them.
+    """
+    listener_logging.stop_logging()
+    os._exit(code)
+
+
+def wait_for_drain(tracker, timeout):
+    """Wait up to `timeout` seconds for tracker.active to reach zero; returns the connections left."""
+    started = time.monotonic()
+    remaining = tracker.wait_idle(timeout)
+    if remaining:
+        logging.warning(f"{remaining} connections still open after {timeout:.0f}s drain; closing them.")
+    else:
+        logging.info(f"All connections drained in {time.monotonic() - started:.1f}s.")
+    return remaining
+
+
+def add_lifecycle_arguments(parser):
+    """Add the reload and graceful-shutdown options shared by the listener scripts to an argparse parser."""
+    group = parser.add_argument_group("reload and shutdown")
+    group.add_argument("--reload-interval", type=float, default=0.0,
+                       help="Seconds between checks of the cert/key files for changes (0: only reload on SIGHUP)")
+    group.add_argument("--drain-timeout", type=float,
+                       help="Make SIGTERM stop accepting and give open connections this many seconds to finish "
+                            f"(e.g. {DEFAULT_DRAIN_TIMEOUT:.0f}); without it SIGTERM exits at once")
+    return group
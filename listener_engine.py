@@ -0,0 +1,207 @@
+import logging
+import selectors
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from connection_journal import DROPPED, ERROR, REJECTED, SERVED
+from handshake_pool import HandshakePool
+from lifecycle import join_threads
+from listener_logging import connection_log
+from listener_metrics import metrics
+from socket_tuning import (DEFAULT_ACCEPT_BATCH, BacklogMonitor, SocketOptions, accept_pending, open_listening_socket,
+                           tune_client_socket)
+
+try:
+    import resource  # Not available on Windows
+except ImportError:
+    resource = None
+
+DEFAULT_WORKERS = 8  # Threads that run client handlers
+
+# select() on Windows is capped at 512 sockets per call, so ports are spread
+# over as many selector loops as needed there; epoll/kqueue have no such cap.
+MAX_SOCKETS_PER_LOOP = 500 if selectors.DefaultSelector is selectors.SelectSelector else None
+
+
+def raise_fd_limit(wanted):
+    """Raise the soft open-file limit towards `wanted` where the platform allows it."""
+    if resource is None:
+        return
+    try:
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        target = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+        if target > soft:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+    except (ValueError, OSError) as e:
+        logging.warning(f"Could not raise open-file limit to {wanted}: {e}")
+
+
+class SelectorLoop:
+    """One thread owning a selector and the listening sockets registered with it."""
+
+    def __init__(self, engine, index):
+        self.engine = engine
+        self.selector = selectors.DefaultSelector()
+        self.count = 0
+        self.accepted = 0  # Only written by this loop's thread
+        self.thread = threading.Thread(target=self.run, name=f"listener-loop-{index}", daemon=True)
+
+    def is_full(self):
+        return MAX_SOCKETS_PER_LOOP is not None and self.count >= MAX_SOCKETS_PER_LOOP
+
+    def register(self, server_socket, port, ssl_context):
+        self.selector.register(server_socket, selectors.EVENT_READ, (port, ssl_context))
+        self.count += 1
+
+    def run(self):
+        while not self.engine.stopping.is_set():
+            try:
+                events = self.selector.select(timeout=self.engine.poll_interval)
+            except OSError as e:
+                logging.error(f"Selector error: {e}")
+                continue
+            for key, _ in events:
+                port, ssl_context = key.data
+                self.engine.backlog_monitor.check(key.fileobj, port)
+                # Drain what is queued rather than one client per wakeup, so bursts
+                # empty the accept queue before the kernel starts dropping SYNs.
+                try:
+                    batch = accept_pending(key.fileobj, self.engine.accept_batch)
+                except OSError as e:
+                    connection_log.error("General error on port %s: %s", port, e)
+                    continue
+                if not batch:
+                    continue  # Another waiter took the connections
+                self.engine.backlog_monitor.record_batch(len(batch))
+                self.accepted += len(batch)
+                metrics.inc("accepts", port, len(batch))
+                admission = self.engine.admission
+                for client_socket, address in batch:
+                    if admission is not None and not admission.admit_socket(client_socket, address, port):
+                        if self.engine.journal is not None:
+                            self.engine.journal.record(port, address, bool(ssl_context), REJECTED)
+                        continue  # Reset before any TLS work is spent on it
+                    tune_client_socket(client_socket, self.engine.socket_options)
+                    self.engine.dispatch(client_socket, address, port, ssl_context)
+        self.selector.close()
+
+
+class ListenerEngine:
+    """Multiplex many listening ports over a few selector threads.
+
+    The loops only do plain TCP accepts. Clients on SSL ports go through a
+    bounded HandshakePool first; every client then runs
+    ``handler(client_socket, address, port)`` on a fixed worker pool.  The
+    handler owns the client socket and must close it. An optional
+    AdmissionControl screens clients straight after accept(), and an optional
+    ConnectionJournal records how each connection ended.
+    """
+
+    def __init__(self, handler, workers=DEFAULT_WORKERS, socket_options=None, poll_interval=0.5,
+                 handshake_pool=None, reuse_port=False, accept_batch=DEFAULT_ACCEPT_BATCH, admission=None,
+                 journal=None):
+        self.handler = handler
+        self.admission = admission
+        self.journal = journal
+        self.socket_options = socket_options or SocketOptions()
+        self.accept_batch = accept_batch
+        self.backlog_monitor = BacklogMonitor()
+        self.reuse_port = reuse_port
+        self.poll_interval = poll_interval
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="listener-worker")
+        self.handshake_pool = handshake_pool or HandshakePool()
+        self.loops = []
+        self.sockets = {}
+        self.stopping = threading.Event()
+
+    def add_port(self, port, ssl_context=None):
+        """Bind `port` and register it with a selector loop. Returns False if binding failed."""
+        try:
+            server_socket = open_listening_socket(port, self.socket_options, self.reuse_port)
+        except OSError as e:
+            logging.error(f"Error on port {port}: {e}")
+            return False
+        if not self.loops or self.loops[-1].is_full():
+            self.loops.append(SelectorLoop(self, len(self.loops)))
+        self.loops[-1].register(server_socket, port, ssl_context)
+        self.sockets[port] = server_socket
+        return True
+
+    def dispatch(self, client_socket, address, port, ssl_context):
+        if ssl_context:
+            self.handshake_pool.submit(client_socket, address, port, ssl_context, self.submit_client,
+                                       on_dropped=partial(self._dropped, address, port))
+        else:
+            client_socket.setblocking(True)
+            self.submit_client(client_socket, address, port)
+
+    def submit_client(self, client_socket, address, port):
+        try:
+            self.executor.submit(self._serve_client, client_socket, address, port)
+        except RuntimeError:
+            client_socket.close()  # Executor already shut down
+            self._dropped(address, port, isinstance(client_socket, ssl.SSLSocket))
+
+    def _serve_client(self, client_socket, address, port):
+        started, began = time.time(), time.monotonic()
+        outcome = SERVED
+        try:
+            self.handler(client_socket, address, port)
+        except Exception as e:
+            outcome = ERROR
+            connection_log.error("Error handling client on port %s: %s", port, e)
+            client_socket.close()
+        finally:
+            self._release()
+            if self.journal is not None:
+                self.journal.record(port, address, isinstance(client_socket, ssl.SSLSocket), outcome,
+                                    time.monotonic() - began, started)
+
+    def _dropped(self, address, port, tls=True):
+        # An admitted client closed before its handler ran
+        self._release()
+        if self.journal is not None:
+            self.journal.record(port, address, tls, DROPPED)
+
+    def _release(self):
+        if self.admission is not None:
+            self.admission.release()
+
+    def stats(self):
+        snapshot = self.handshake_pool.stats()
+        snapshot.update(self.backlog_monitor.stats())
+        if self.admission is not None:
+            snapshot.update(self.admission.stats())
+        if self.journal is not None:
+            snapshot.update(self.journal.stats())
+        snapshot["accepted"] = sum(loop.accepted for loop in self.loops)
+        snapshot["ports"] = len(self.sockets)
+        return snapshot
+
+    def start(self):
+        for loop in self.loops:
+            loop.thread.start()
+
+    def serve_forever(self):
+        """Run the selector loops until stop() is called or the main thread is interrupted."""
+        self.start()
+        try:
+            join_threads([loop.thread for loop in self.loops])
+        finally:
+            self.close()
+
+    def stop(self):
+        self.stopping.set()
+
+    def close(self):
+        self.stopping.set()
+        for loop in self.loops:
+            if loop.thread.is_alive() and loop.thread is not threading.current_thread():
+                loop.thread.join()
+        for server_socket in self.sockets.values():
+            server_socket.close()
+        self.sockets.clear()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,143 @@
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+
+DEFAULT_QUEUE_SIZE = 10000
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+# Per-connection events go through this logger so they can be sampled; log
+# with %-style arguments so formatting happens on the listener thread.
+connection_log = logging.getLogger("listener.connection")
+
+_counters = {"dropped": 0, "sampled_out": 0}
+_counters_lock = threading.Lock()
+_listener = None
+_options = None
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One compact JSON object per record."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, separators=(",", ":"), default=str)
+
+
+class ConnectionSampler(logging.Filter):
+    """Pass one in `every` per-connection record below WARNING; everything else always passes."""
+
+    def __init__(self, every):
+        super().__init__()
+        self.every = every
+        self.counter = itertools.count()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not record.name.startswith(connection_log.name):
+            return True
+        if next(self.counter) % self.every == 0:
+            return True
+        with _counters_lock:
+            _counters["sampled_out"] += 1
+        return False
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks the caller for records below ERROR and counts what it drops.
+
+    ERROR and above are never dropped: when the queue is full they are
+    written straight to `fallback` (the listener's output handler), or wait
+    for room if there is none.
+    """
+
+    def __init__(self, queue, fallback=None):
+        super().__init__(queue)
+        self.fallback = fallback
+
+    def prepare(self, record):
+        # The queue stays in-process, so skip QueueHandler's eager formatting
+        # and let the listener thread call getMessage().
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno < logging.ERROR:
+                with _counters_lock:
+                    _counters["dropped"] += 1
+            elif self.fallback is not None:
+                self.fallback.handle(record)  # Out of order with what is still queued, but delivered
+            else:
+                self.queue.put(record)
+
+
+def setup_logging(level=logging.INFO, json_lines=False, sample_every=1, queue_size=DEFAULT_QUEUE_SIZE,
+                  stream=None):
+    """Route all logging through a bounded queue drained by a background QueueListener.
+
+    `sample_every` > 1 keeps one in N per-connection INFO/DEBUG records;
+    warnings and errors are never sampled. Safe to call again to reconfigure.
+    """
+    global _listener, _options
+    if _listener is not None:
+        _listener.stop()
+    _options = dict(level=level, json_lines=json_lines, sample_every=sample_every, queue_size=queue_size,
+                    stream=stream)
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonLinesFormatter() if json_lines else logging.Formatter(LOG_FORMAT))
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = NonBlockingQueueHandler(log_queue, fallback=output)
+    if sample_every > 1:
+        queue_handler.addFilter(ConnectionSampler(sample_every))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def stats():
+    with _counters_lock:
+        return {"log_dropped": _counters["dropped"], "log_sampled_out": _counters["sampled_out"]}
+
+
+def _restart_in_child():
+    # The listener thread does not survive fork(); give the child its own
+    global _listener, _counters_lock
+    _counters_lock = threading.Lock()
+    if _options is not None:
+        _listener = None
+        _counters["dropped"] = _counters["sampled_out"] = 0
+        setup_logging(**_options)
+
+
+atexit.register(stop_logging)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_in_child)
@@ -0,0 +1,157 @@
+import logging
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds; the implicit last bucket is +Inf
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PREFIX = "listener_"
+STAT_PREFIX = "listener_stat_"  # Plain stats keys, kept apart from the metric families above
+# Plain stats that are levels rather than running totals, named as worker_supervisor.merge_stats() expects
+GAUGE_STATS = {"ports", "queue_depth", "active_connections", "tracked_sources", "session_cache_number"}
+GAUGE_STAT_PREFIXES = ("peak_", "max_", "mean_")
+
+
+class _Shard:
+    """Counters and histograms written by exactly one thread."""
+
+    __slots__ = ("counters", "histograms")
+
+    def __init__(self):
+        self.counters = {}  # (name, port) -> int
+        self.histograms = {}  # (name, port) -> [bucket counts..., +Inf count, sum]
+
+
+class ListenerMetrics:
+    """Per-port counters and fixed-bucket latency histograms.
+
+    Every thread writes to its own shard, so recording takes no lock; a
+    scrape sums the shards. Reads may be a few increments behind, which is
+    fine for monitoring.
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+        self.shards = []
+        self.lock = threading.Lock()  # Only taken when a thread creates its shard
+
+    def _shard(self):
+        shard = getattr(self.local, "shard", None)
+        if shard is None:
+            shard = _Shard()
+            self.local.shard = shard
+            with self.lock:
+                self.shards.append(shard)
+        return shard
+
+    def inc(self, name, port, amount=1):
+        counters = self._shard().counters
+        key = (name, port)
+        counters[key] = counters.get(key, 0) + amount
+
+    def observe(self, name, port, seconds):
+        histograms = self._shard().histograms
+        key = (name, port)
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+        histogram[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        histogram[-1] += seconds
+
+    def snapshot(self):
+        """Flatten everything into {'series{labels}': value}, which merges across workers by summing."""
+        with self.lock:
+            shards = list(self.shards)
+        flat = {}
+        for shard in shards:
+            for (name, port), value in list(shard.counters.items()):
+                series = f'{PREFIX}{name}_total{{port="{port}"}}'
+                flat[series] = flat.get(series, 0) + value
+            for (name, port), histogram in list(shard.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), histogram):
+                    cumulative += count
+                    series = f'{PREFIX}{name}_seconds_bucket{{port="{port}",le="{bound}"}}'
+                    flat[series] = flat.get(series, 0) + cumulative
+                for suffix, value in (("count", cumulative), ("sum", histogram[-1])):
+                    series = f'{PREFIX}{name}_seconds_{suffix}{{port="{port}"}}'
+                    flat[series] = flat.get(series, 0) + value
+        return flat
+
+
+metrics = ListenerMetrics()  # Process-wide instance used by the listeners
+
+
+def _family(series):
+    name = series.split("{", 1)[0]
+    for suffix in ("_bucket", "_count", "_sum"):
+        if name.endswith(suffix) and "_seconds" in name:
+            return name[: -len(suffix)], "histogram"
+    return name, "counter" if name.endswith("_total") else "gauge"
+
+
+def _stat_family(key):
+    if key in GAUGE_STATS or key.startswith(GAUGE_STAT_PREFIXES) or key.endswith("_rate"):
+        return STAT_PREFIX + key, "gauge"
+    return f"{STAT_PREFIX}{key}_total", "counter"
+
+
+def render_prometheus(flat):
+    """Render a flat {series: value} dict in the Prometheus text exposition format.
+
+    Plain stats keys without labels (e.g. handshake pool counters) are exported
+    under listener_stat_, so a stat such as handshake_seconds cannot take the
+    name of a histogram family: running totals as counters
+    (listener_stat_<key>_total), levels such as queue_depth or max_* as gauges.
+    """
+    families = {}
+    for key, value in flat.items():
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            continue
+        if key.startswith(PREFIX):
+            series = key
+            name, kind = _family(series)
+        else:
+            series, kind = _stat_family(key)
+            name = series
+        family = families.setdefault(name, (kind, []))
+        if family[0] != kind:
+            raise ValueError(f"{series} ({kind}) clashes with the {family[0]} family {name}")
+        family[1].append((series, value))
+    # A histogram also owns the _bucket/_count/_sum names under its family name
+    taken = {name + suffix for name, (kind, _) in families.items() if kind == "histogram"
+             for suffix in ("_bucket", "_count", "_sum")}
+    for name, (kind, _) in families.items():
+        if name in taken:
+            raise ValueError(f"{kind} {name} clashes with a histogram family")
+    lines = []
+    for name in sorted(families):
+        kind, samples = families[name]
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(f"{series} {value}" for series, value in samples)
+    return "\n".join(lines) + "\n"
+
+
+def start_admin_server(collect, port, host="127.0.0.1"):
+    """Serve render_prometheus(collect()) at /metrics on a background thread."""
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus(collect()).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Scrapes are not worth a log line each
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="metrics-admin", daemon=True)
+    thread.start()
+    logging.info(f"Metrics available at http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,399 @@
+import argparse
+import asyncio
+import contextlib
+import errno
+import json
+import logging
+import os
+import socket
+import ssl
+import sys
+import time
+from collections import namedtuple
+
+from admission import close_now
+from listener_engine import raise_fd_limit
+
+DEFAULT_SCAN_PORTS = "1-65535"
+DEFAULT_SCAN_CONCURRENCY = 1000  # Probes in flight at once
+DEFAULT_SCAN_HANDSHAKES = 64  # TLS probes in flight at once; below a listener's handshake queue (128)
+DEFAULT_PROBE_TIMEOUT = 1.0  # Seconds for the connect, and again for the TLS handshake
+DEFAULT_PROBE_RETRIES = 1  # Extra attempts after a timeout or a local resource error
+DEFAULT_SCAN_RATE = 20000.0  # Starting (and highest) probes per second
+MIN_SCAN_RATE = 50.0
+
+OPEN = "open"
+CLOSED = "closed"  # Refused: nothing listening
+TIMEOUT = "timeout"  # No answer; filtered, or the listener is not accepting
+TLS_ERROR = "tls_error"  # TCP connect worked but the TLS handshake did not
+ERROR = "error"
+
+# Local resource shortages: back off instead of reporting the port
+_CONGESTION_ERRNOS = {errno.EMFILE, errno.ENFILE, errno.ENOBUFS, errno.EAGAIN, errno.EADDRNOTAVAIL}
+_IN_PROGRESS = {errno.EINPROGRESS, errno.EWOULDBLOCK}
+# A handshake cut off by the server: a listener sheds clients it has no room to handshake this way
+_HANDSHAKE_DROPS = (ConnectionResetError, ConnectionAbortedError, BrokenPipeError, ssl.SSLEOFError)
+
+ProbeResult = namedtuple("ProbeResult", ["port", "state", "attempts", "connect_seconds", "handshake_seconds",
+                                         "detail"])
+
+
+def parse_port_spec(value):
+    """Parse "1-1024,8443" into a sorted list of unique ports."""
+    ports = set()
+    try:
+        for part in value.split(","):
+            part = part.strip()
+            if not part:
+                continue
+            first, _, last = part.partition("-")
+            ports.update(range(int(first), int(last or first) + 1))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid port specification: {value!r}")
+    if any(port < 1 or port > 65535 for port in ports):
+        raise argparse.ArgumentTypeError(f"ports must be within 1-65535: {value!r}")
+    return sorted(ports)
+
+
+def format_port_ranges(ports):
+    """Compress sorted ports into "1-3,7" form."""
+    ranges = []
+    for port in ports:
+        if ranges and ranges[-1][1] == port - 1:
+            ranges[-1][1] = port
+        else:
+            ranges.append([port, port])
+    return ",".join(str(first) if first == last else f"{first}-{last}" for first, last in ranges)
+
+
+class AdaptiveLimiter:
+    """Concurrency window plus optional token bucket, both backing off on congestion.
+
+    Up to `window` probes run at once, started at no more than `rate` per
+    second (0: no rate limit). congestion() halves both, at most once per
+    `cooldown` seconds; every answered probe wins a little back, in the
+    additive-increase/multiplicative-decrease manner of TCP.
+    """
+
+    def __init__(self, window, rate=0.0, min_rate=MIN_SCAN_RATE, cooldown=0.2):
+        self.max_window = self.window = window
+        self.max_rate = self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.burst = max(1.0, min(window, rate / 10))
+        self.cooldown = cooldown
+        self.tokens = self.burst
+        self.in_flight = 0
+        self.freed = asyncio.Event()
+        self.updated = self.last_cut = time.monotonic()
+        self.cuts = 0
+
+    async def acquire(self):
+        while self.in_flight >= self.window:
+            self.freed.clear()
+            await self.freed.wait()
+        self.in_flight += 1
+        while self.rate:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return
+            await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+    def release(self):
+        self.in_flight -= 1
+        self.freed.set()
+
+    def answered(self):
+        if self.window < self.max_window:
+            self.window = min(self.max_window, self.window + 1 / self.window)
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 1000)
+
+    def congestion(self):
+        now = time.monotonic()
+        if now - self.last_cut < self.cooldown:
+            return
+        self.last_cut = now
+        self.window = max(1.0, self.window / 2)
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.cuts += 1
+        logging.debug(f"Scan congestion; now {self.window:.0f} probes in flight at {self.rate:.0f}/s")
+
+
+class PortScanner:
+    """Asyncio TCP connect scanner with bounded concurrency.
+
+    `concurrency` probe tasks share one port iterator, so memory does not
+    grow with the range. A probe that times out or hits a local resource
+    limit is retried up to `retries` times; resource errors, and a retry that
+    gets an answer after a timeout, count as congestion and shrink the
+    number of probes in flight and their rate. With `tls_context` every open
+    port also gets a TLS handshake; one that times out or is reset is
+    retried like a connect that timed out. A listener queues each client it
+    accepts for its handshake, so TLS probes hold a handshake slot from the
+    connect on: at most `handshakes` of them run at once, whatever
+    `concurrency` says, and a sweep of filtered ports is slower by the same
+    factor. Connections are closed with an RST, so a full sweep leaves no
+    TIME_WAIT entries behind.
+    """
+
+    def __init__(self, host, concurrency=DEFAULT_SCAN_CONCURRENCY, timeout=DEFAULT_PROBE_TIMEOUT,
+                 retries=DEFAULT_PROBE_RETRIES, rate=DEFAULT_SCAN_RATE, tls_context=None, server_hostname=None,
+                 handshakes=DEFAULT_SCAN_HANDSHAKES):
+        self.host = host
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.limiter = AdaptiveLimiter(concurrency, rate)
+        self.tls_context = tls_context
+        self.server_hostname = server_hostname or host
+        self.handshake_slots = asyncio.Semaphore(handshakes) if tls_context is not None else contextlib.nullcontext()
+        self.family = self.address = None
+
+    def _resolve(self):
+        family, _, _, _, address = socket.getaddrinfo(self.host, None, type=socket.SOCK_STREAM)[0]
+        self.family, self.address = family, address[0]
+
+    async def _connect(self, port):
+        loop = asyncio.get_running_loop()
+        sock = socket.socket(self.family, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        try:
+            if not isinstance(loop, asyncio.SelectorEventLoop):
+                await asyncio.wait_for(loop.sock_connect(sock, (self.address, port)), self.timeout)
+                return sock
+            # Selector loops: connect_ex() plus one writer callback and one timer, without the
+            # task wait_for() would wrap around sock_connect() for every probe
+            error = sock.connect_ex((self.address, port))
+            if error in _IN_PROGRESS:
+                await self._writable(loop, sock)
+                error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if error:
+                raise OSError(error, os.strerror(error))  # Becomes ConnectionRefusedError etc.
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    async def _writable(self, loop, sock):
+        waiter = loop.create_future()
+
+        def ready():
+            if not waiter.done():
+                waiter.set_result(None)
+
+        def expire():
+            if not waiter.done():
+                waiter.set_exception(asyncio.TimeoutError())
+
+        fileno = sock.fileno()
+        loop.add_writer(fileno, ready)
+        timer = loop.call_later(self.timeout, expire)
+        try:
+            await waiter
+        finally:
+            loop.remove_writer(fileno)
+            timer.cancel()
+
+    async def _handshake(self, sock):
+        _, writer = await asyncio.wait_for(
+            asyncio.open_connection(sock=sock, ssl=self.tls_context, server_hostname=self.server_hostname,
+                                    ssl_handshake_timeout=self.timeout),
+            self.timeout,
+        )
+        ssl_object = writer.get_extra_info("ssl_object")
+        detail = f"{ssl_object.version()} {ssl_object.cipher()[0]}"
+        writer.transport.abort()
+        return detail
+
+    async def _attempt(self, port):
+        # One try; returns (state, connect seconds, handshake seconds, detail)
+        started = time.monotonic()
+        try:
+            sock = await self._connect(port)
+        except asyncio.TimeoutError:
+            return TIMEOUT, self.timeout, None, None
+        except ConnectionRefusedError:
+            return CLOSED, time.monotonic() - started, None, None
+        except OSError as e:
+            return ERROR, time.monotonic() - started, None, e
+        connected = time.monotonic()
+        if self.tls_context is None:
+            close_now(sock)
+            return OPEN, connected - started, None, None
+        try:
+            detail = await self._handshake(sock)
+        except (asyncio.TimeoutError, *_HANDSHAKE_DROPS) as e:
+            close_now(sock)
+            return TLS_ERROR, connected - started, time.monotonic() - connected, e  # probe() retries these
+        except OSError as e:
+            close_now(sock)
+            return TLS_ERROR, connected - started, time.monotonic() - connected, str(e) or type(e).__name__
+        return OPEN, connected - started, time.monotonic() - connected, detail
+
+    async def probe(self, port):
+        """Probe one port, retrying timeouts, dropped handshakes and local resource errors."""
+        retried_lost = False
+        for attempt in range(1, self.retries + 2):
+            async with self.handshake_slots:  # Connect included: an accepted client waits in the listener's queue
+                await self.limiter.acquire()
+                try:
+                    state, connect_seconds, handshake_seconds, detail = await self._attempt(port)
+                finally:
+                    self.limiter.release()
+            congested = state == ERROR and detail.errno in _CONGESTION_ERRNOS
+            # _attempt() leaves the exception as the detail only for handshakes worth retrying. Like a timeout,
+            # a reset is not congestion by itself: a service that does not speak TLS may close on every try.
+            dropped = state == TLS_ERROR and isinstance(detail, Exception)
+            if congested:
+                self.limiter.congestion()
+                await asyncio.sleep(self.limiter.cooldown * attempt)  # Let the probes in flight finish
+            elif state != TIMEOUT and not dropped:
+                if retried_lost:
+                    self.limiter.congestion()  # The first try was lost to load, not to a filter
+                else:
+                    self.limiter.answered()
+                break
+            elif dropped and attempt <= self.retries:
+                await asyncio.sleep(self.limiter.cooldown * attempt)  # Give a shedding listener a moment
+            retried_lost = state == TIMEOUT or dropped
+        if isinstance(detail, Exception):
+            detail = getattr(detail, "strerror", None) or str(detail) or type(detail).__name__
+        return ProbeResult(port, state, attempt, connect_seconds, handshake_seconds, detail)
+
+    async def scan(self, ports):
+        """Probe `ports`, yielding a ProbeResult as each probe finishes (not in port order)."""
+        self._resolve()
+        raise_fd_limit(self.concurrency + 256)
+        pending = iter(ports)
+        results = asyncio.Queue(maxsize=self.concurrency)  # Backpressure when the consumer is slow
+
+        async def worker():
+            try:
+                for port in pending:
+                    await results.put(await self.probe(port))
+            finally:
+                await results.put(None)
+
+        workers = [asyncio.create_task(worker()) for _ in range(max(1, min(self.concurrency, len(ports))))]
+        running = len(workers)
+        try:
+            while running:
+                result = await results.get()
+                if result is None:
+                    running -= 1
+                else:
+                    yield result
+        finally:
+            for task in workers:
+                task.cancel()
+
+    def stats(self):
+        return {"final_window": round(self.limiter.window), "final_rate": round(self.limiter.rate),
+                "congestion_cuts": self.limiter.cuts}
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def _format_result(result):
+    line = f"{result.port}/tcp {result.state} connect={result.connect_seconds * 1000:.1f}ms"
+    if result.handshake_seconds is not None:
+        line += f" handshake={result.handshake_seconds * 1000:.1f}ms"
+    if result.attempts > 1:
+        line += f" attempts={result.attempts}"
+    if result.detail:
+        line += f" ({result.detail})"
+    return line
+
+
+async def run_scan(scanner, ports, show_all=False, json_lines=False, output=None):
+    """Stream results to `output` as they arrive and return a summary dict."""
+    output = output or sys.stdout
+    started = time.monotonic()
+    counts = {state: 0 for state in (OPEN, CLOSED, TIMEOUT, TLS_ERROR, ERROR)}
+    open_ports, connect_times, handshake_times = [], [], []
+    async for result in scanner.scan(ports):
+        counts[result.state] += 1
+        if result.state in (OPEN, TLS_ERROR):
+            connect_times.append(result.connect_seconds)
+        if result.state == OPEN:
+            open_ports.append(result.port)
+            if result.handshake_seconds is not None:
+                handshake_times.append(result.handshake_seconds)
+        if show_all or result.state not in (CLOSED, TIMEOUT):
+            if json_lines:
+                output.write(json.dumps(result._asdict(), separators=(",", ":"), default=str) + "\n")
+            else:
+                output.write(_format_result(result) + "\n")
+            output.flush()
+    elapsed = time.monotonic() - started
+    connect_times.sort()
+    handshake_times.sort()
+    summary = {"ports": len(ports), "seconds": round(elapsed, 3),
+               "probes_per_second": round(len(ports) / elapsed) if elapsed else 0, **counts,
+               "connect_p50_ms": round(_percentile(connect_times, 0.5) * 1000, 3),
+               "connect_p99_ms": round(_percentile(connect_times, 0.99) * 1000, 3)}
+    if handshake_times:
+        summary["handshake_p50_ms"] = round(_percentile(handshake_times, 0.5) * 1000, 3)
+        summary["handshake_p99_ms"] = round(_percentile(handshake_times, 0.99) * 1000, 3)
+    summary.update(scanner.stats())
+    summary["open_ports"] = sorted(open_ports)
+    return summary
+
+
+def add_scan_arguments(parser):
+    """Add the connect-scanner options to an argparse parser."""
+    group = parser.add_argument_group("scanner")
+    group.add_argument("--scan", metavar="HOST", help="Probe HOST's ports instead of listening")
+    group.add_argument("--scan-ports", type=parse_port_spec, default=DEFAULT_SCAN_PORTS,
+                       help=f"Ports to probe, e.g. 1-1024,8443 (default: {DEFAULT_SCAN_PORTS})")
+    group.add_argument("--scan-tls", action="store_true", help="Also run a TLS handshake on every open port")
+    group.add_argument("--scan-verify", action="store_true",
+                       help="Verify the certificates seen with --scan-tls against the system CA store")
+    group.add_argument("--scan-concurrency", type=int, default=DEFAULT_SCAN_CONCURRENCY,
+                       help="Probes in flight at once (with --scan-tls, --scan-handshakes applies when lower)")
+    group.add_argument("--scan-handshakes", type=int, default=DEFAULT_SCAN_HANDSHAKES,
+                       help="Probes in flight at once with --scan-tls, connect included, overriding a larger "
+                            "--scan-concurrency; keep it below the listener's handshake queue")
+    group.add_argument("--scan-timeout", type=float, default=DEFAULT_PROBE_TIMEOUT,
+                       help="Seconds allowed for each connect and each TLS handshake")
+    group.add_argument("--scan-retries", type=int, default=DEFAULT_PROBE_RETRIES,
+                       help="Extra attempts for ports that time out or hit a local resource limit")
+    group.add_argument("--scan-rate", type=float, default=DEFAULT_SCAN_RATE,
+                       help="Starting probes per second; lowered on congestion (0: no rate limit)")
+    group.add_argument("--scan-all", action="store_true", help="Also print closed and timed-out ports")
+    group.add_argument("--scan-json", action="store_true", help="Print results as JSON lines")
+    group.add_argument("--scan-expect-open", action="store_true",
+                       help="Exit with status 1 unless every scanned port is open (checks a listener fleet)")
+    return group
+
+
+def scan_from_args(args):
+    """Run the scan described by parsed arguments; returns the process exit status."""
+    tls_context = None
+    if args.scan_tls:
+        tls_context = ssl.create_default_context()
+        if not args.scan_verify:
+            tls_context.check_hostname = False
+            tls_context.verify_mode = ssl.CERT_NONE
+    scanner = PortScanner(args.scan, concurrency=args.scan_concurrency, timeout=args.scan_timeout,
+                          retries=args.scan_retries, rate=args.scan_rate, tls_context=tls_context,
+                          handshakes=args.scan_handshakes)
+    ports = args.scan_ports
+    summary = asyncio.run(run_scan(scanner, ports, show_all=args.scan_all, json_lines=args.scan_json))
+    open_ports = summary.pop("open_ports")
+    logging.info(f"Scan of {args.scan}: {summary}")
+    if open_ports:
+        logging.info(f"Open: {format_port_ranges(open_ports)}")
+    if args.scan_expect_open:
+        missing = sorted(set(ports) - set(open_ports))
+        if missing:
+            logging.error(f"Not open: {format_port_ranges(missing)}")
+            return 1
+    return 0
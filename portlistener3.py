@@ -1,53 +1,148 @@
-import socket
+import argparse
 import ssl
-import threading
+
+import listener_logging
+import worker_supervisor
+from admission import add_admission_arguments, admission_from_args
+from connection_journal import add_journal_arguments, open_journal
+from handshake_pool import (DEFAULT_HANDSHAKE_QUEUE, DEFAULT_HANDSHAKE_TIMEOUT, DEFAULT_HANDSHAKE_WORKERS,
+                            HandshakePool)
+from listener_engine import DEFAULT_WORKERS, ListenerEngine, raise_fd_limit
+from lifecycle import add_lifecycle_arguments, exit_now, on_signal, shutdown, wait_for_drain
+from listener_logging import connection_log
+from socket_tuning import DEFAULT_ACCEPT_BATCH, add_socket_arguments, socket_options_from_args
+from tls_config import ReloadableContext
+
+
+def handle_secure_connection(client_socket, address, port):
+    connection_log.info("Secure connection received on port %s from %s", port, address)
+    client_socket.close()
 
 
 def listen_on_port(port, ssl_context):
-    try:
-        # Create a socket object
-        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        server_socket.bind(("", port))  # Bind to all interfaces
-        server_socket.listen(5)
-        print(f"Listening with SSL on port {port}...")
+    # Single-port convenience wrapper around the multiplexed engine
+    start_listeners([port], ssl_context, handler_threads=1)
+
 
-        # Wrap the socket with SSL
-        secure_socket = ssl_context.wrap_socket(server_socket, server_side=True)
+def start_listeners(port_range, ssl_context, handler_threads=DEFAULT_WORKERS, workers=1, socket_options=None,
+                    accept_batch=DEFAULT_ACCEPT_BATCH, admission=None, drain_timeout=None, reload_interval=0.0,
+                    journal_size=0, journal_file=None, handshake_workers=DEFAULT_HANDSHAKE_WORKERS,
+                    handshake_queue=DEFAULT_HANDSHAKE_QUEUE, handshake_timeout=DEFAULT_HANDSHAKE_TIMEOUT,
+                    stats_interval=worker_supervisor.DEFAULT_STATS_INTERVAL):
+    # Several processes can share the ports through SO_REUSEPORT to use more than one core;
+    # each worker then applies the admission limits to its own share of the clients
+    options = (handler_threads, socket_options, accept_batch, admission, drain_timeout, reload_interval, journal_size,
+               journal_file, handshake_workers, handshake_queue, handshake_timeout, stats_interval)
+    if workers > 1:
+        worker_supervisor.run_workers(workers, _worker_main, args=(port_range, ssl_context, *options),
+                                      stats_interval=stats_interval, forward_signals=("SIGHUP",),
+                                      drain_timeout=drain_timeout)
+        return
+    _serve(port_range, ssl_context, *options)
 
-        while True:
-            client_socket, address = secure_socket.accept()
-            print(f"Secure connection received on port {port} from {address}")
-            client_socket.close()
 
-    except Exception as e:
-        print(f"Error on port {port}: {e}")
+def _worker_main(worker_id, stats_queue, port_range, ssl_context, *options):
+    _serve(port_range, ssl_context, *options, reuse_port=True, stats_queue=stats_queue, worker_id=worker_id)
 
 
-def start_listeners(port_range, ssl_context):
-    threads = []
+def _build_context(cert_file, key_file):
+    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ssl_context.load_cert_chain(certfile=cert_file, keyfile=key_file)
+    return ssl_context
+
+
+def _serve(port_range, ssl_context, handler_threads, socket_options=None, accept_batch=DEFAULT_ACCEPT_BATCH,
+           admission=None, drain_timeout=None, reload_interval=0.0, journal_size=0, journal_file=None,
+           handshake_workers=DEFAULT_HANDSHAKE_WORKERS, handshake_queue=DEFAULT_HANDSHAKE_QUEUE,
+           handshake_timeout=DEFAULT_HANDSHAKE_TIMEOUT, stats_interval=worker_supervisor.DEFAULT_STATS_INTERVAL,
+           reuse_port=False, stats_queue=None, worker_id=0):
+    # One selector loop owns every bound socket; `handshake_workers` threads do the
+    # TLS handshakes, so memory grows with active clients rather than ports.
+    raise_fd_limit(len(port_range) + 1024)
+    # Each process keeps its own journal (and file) and handshake pool, created here rather than before the fork
+    journal = open_journal(journal_size, journal_file, worker_id if stats_queue is not None else None)
+    handshake_pool = HandshakePool(workers=handshake_workers, max_queue=handshake_queue, timeout=handshake_timeout)
+    engine = ListenerEngine(handle_secure_connection, workers=handler_threads, socket_options=socket_options,
+                            handshake_pool=handshake_pool, reuse_port=reuse_port, accept_batch=accept_batch,
+                            admission=admission, journal=journal)
     for port in port_range:
-        thread = threading.Thread(target=listen_on_port, args=(port, ssl_context))
-        thread.daemon = True  # This closes the thread when the program exits
-        threads.append(thread)
-        thread.start()
+        if engine.add_port(port, ssl_context):
+            print(f"Listening with SSL on port {port}...")
+
+    # A certificate reload swaps the context for new handshakes without rebinding any port
+    reloadable = isinstance(ssl_context, ReloadableContext)
+    if reloadable:
+        on_signal("SIGHUP", ssl_context.reload)
+        if reload_interval:
+            ssl_context.watch(reload_interval)
+    if drain_timeout is not None:
+        shutdown.install()
+        shutdown.on_stop(engine.stop)
+
+    def collect():
+        snapshot = {**engine.stats(), **listener_logging.stats()}
+        if reloadable:
+            snapshot.update(ssl_context.stats())
+        return snapshot
+
+    # Workers report to the supervisor; a single process logs its own handshake queue and latency counters
+    if stats_queue is not None:
+        worker_supervisor.start_stats_reporter(stats_queue, worker_id, collect, stats_interval)
+    else:
+        worker_supervisor.start_stats_logger(collect, stats_interval)
 
     # Keep the main thread running
-    for thread in threads:
-        thread.join()
+    engine.serve_forever()
+    if drain_timeout is not None and wait_for_drain(admission, drain_timeout):
+        exit_now()  # Do not wait on handler threads still holding connections
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Accept TLS connections on a range of ports.")
+    parser.add_argument("--cert", default="C:/nginx-1.27.4/conf/Mohamed.crt", help="SSL certificate path")
+    parser.add_argument("--key", default="C:/nginx-1.27.4/conf/Mohamed.key", help="SSL private key path")
+    parser.add_argument("--first-port", type=int, default=1, help="First port of the range to listen on")
+    parser.add_argument("--last-port", type=int, default=65534, help="Last port of the range (inclusive)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes sharing the ports via SO_REUSEPORT (Linux); 1 serves in-process")
+    parser.add_argument("--handler-threads", type=int, default=DEFAULT_WORKERS,
+                        help="Threads running connection handlers after the TLS handshake")
+    parser.add_argument("--handshake-workers", type=int, default=DEFAULT_HANDSHAKE_WORKERS,
+                        help="Threads running TLS handshakes")
+    parser.add_argument("--handshake-queue", type=int, default=DEFAULT_HANDSHAKE_QUEUE,
+                        help="Accepted clients allowed to wait for a handshake worker")
+    parser.add_argument("--handshake-timeout", type=float, default=DEFAULT_HANDSHAKE_TIMEOUT,
+                        help="Seconds allowed for a complete TLS handshake")
+    parser.add_argument("--stats-interval", type=float, default=worker_supervisor.DEFAULT_STATS_INTERVAL,
+                        help="Seconds between stats reports (summed across workers when --workers > 1)")
+    add_socket_arguments(parser)
+    add_admission_arguments(parser)
+    add_lifecycle_arguments(parser)
+    add_journal_arguments(parser)
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
+    args = parse_args()
+
+    # Log through a background queue so per-connection records stay off the accept path
+    listener_logging.setup_logging()
+
     # Define the path to your SSL certificate and key files
-    ssl_cert_file = "C:/nginx-1.27.4/conf/Mohamed.crt"
-    ssl_key_file = "C:/nginx-1.27.4/conf/Mohamed.key"
+    ssl_cert_file = args.cert
+    ssl_key_file = args.key
 
     # Define the range of ports you want to monitor
-    port_range = range(1, 65535)  # Example: Change this to the range you need
+    port_range = range(args.first_port, args.last_port + 1)
 
-    # Create a SSL context
-    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-    ssl_context.load_cert_chain(certfile=ssl_cert_file, keyfile=ssl_key_file)
+    # Create a SSL context; SIGHUP (or --reload-interval) rebuilds it from the same files
+    ssl_context = ReloadableContext(ssl_cert_file, ssl_key_file, build=_build_context)
 
     # Start listening on ports with SSL
-    start_listeners(port_range, ssl_context)
+    start_listeners(port_range, ssl_context, handler_threads=args.handler_threads, workers=args.workers,
+                    socket_options=socket_options_from_args(args), accept_batch=args.accept_batch,
+                    admission=admission_from_args(args, track=args.drain_timeout is not None),
+                    drain_timeout=args.drain_timeout, reload_interval=args.reload_interval,
+                    journal_size=args.journal_size, journal_file=args.journal_file,
+                    handshake_workers=args.handshake_workers, handshake_queue=args.handshake_queue,
+                    handshake_timeout=args.handshake_timeout, stats_interval=args.stats_interval)
@@ -1,109 +1,389 @@
+import argparse
+import selectors
 import socket
 import ssl
 import threading
+import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-)
+import async_listener
+import listener_logging
+import listener_metrics
+import worker_supervisor
+from admission import add_admission_arguments, admission_from_args
+from connection_journal import DROPPED, ERROR, REJECTED, SERVED, add_journal_arguments, journal_from_args
+from handshake_pool import (DEFAULT_HANDSHAKE_QUEUE, DEFAULT_HANDSHAKE_TIMEOUT, DEFAULT_HANDSHAKE_WORKERS,
+                            HandshakePool)
+from http_session import (DEFAULT_IDLE_TIMEOUT, DEFAULT_MAX_REQUESTS, PLAIN_RESPONSE, SSL_RESPONSE,
+                          serve_connection)
+from lifecycle import (STOP_POLL_INTERVAL, add_lifecycle_arguments, exit_now, join_threads, on_signal, shutdown,
+                       wait_for_drain)
+from listener_logging import DEFAULT_QUEUE_SIZE, connection_log
+from listener_metrics import metrics
+from port_probe import add_scan_arguments, scan_from_args
+from response_cache import SENDFILE_THRESHOLD, ResponseCache
+from socket_tuning import (DEFAULT_ACCEPT_BATCH, BacklogMonitor, SocketOptions, accept_pending, add_socket_arguments,
+                           open_listening_socket, socket_options_from_args, tune_client_socket)
+from tls_config import (DEFAULT_ECDH_CURVE, DEFAULT_NUM_TICKETS, ReloadableContext, ResumptionStats,
+                        add_resumption_rate, build_server_context)
+
+# Connection counters for threads mode, shared by every port thread
+stats_lock = threading.Lock()
+connection_stats = {"connections": 0, "requests": 0, "client_errors": 0}
+
+
+# Request/response handling for one accepted (and, for SSL ports, handshaken) client
+def serve_client(client_socket, address, port, idle_timeout=DEFAULT_IDLE_TIMEOUT, max_requests=1,
+                 response_cache=None, resumption=None, admission=None, journal=None):
+    # Cached routes/static files first, then the simple per-port response;
+    # with max_requests > 1 the connection is kept alive
+    started, began = time.time(), time.monotonic()
+    outcome = SERVED
+    is_ssl = isinstance(client_socket, ssl.SSLSocket)
+    if is_ssl and resumption is not None:
+        resumption.record(client_socket)
+    response = SSL_RESPONSE if is_ssl else PLAIN_RESPONSE
+    pick_response = response_cache.picker(response) if response_cache else lambda request: response
+    try:
+        served = serve_connection(client_socket, port, pick_response,
+                                  idle_timeout=idle_timeout, max_requests=max_requests)
+        with stats_lock:
+            connection_stats["requests"] += served
+    except Exception as client_error:
+        outcome = ERROR
+        with stats_lock:
+            connection_stats["client_errors"] += 1
+        metrics.inc("request_errors", port)
+        connection_log.error("Error handling client request on port %s: %s", port, client_error)
+    finally:
+        client_socket.close()
+        if admission is not None:
+            admission.release()
+        if journal is not None:
+            journal.record(port, address, is_ssl, outcome, time.monotonic() - began, started)
+
+
+def client_dropped(address, port, admission=None, journal=None):
+    # An admitted SSL client closed before being served (failed handshake or full handshake queue)
+    if admission is not None:
+        admission.release()
+    if journal is not None:
+        journal.record(port, address, True, DROPPED)
 
 
 # General-purpose listener function with SSL support as optional
-def listen_on_port(port, ssl_context=None):
+def listen_on_port(port, ssl_context=None, handshake_pool=None, reuse_port=False, on_client=serve_client,
+                   socket_options=None, accept_mode="drain", accept_batch=DEFAULT_ACCEPT_BATCH, backlog_monitor=None,
+                   admission=None, stopping=None, journal=None):
+    # With a `stopping` event the loop ends, closing the socket, once it is set
+    socket_options = socket_options or SocketOptions()
+    backlog_monitor = backlog_monitor or BacklogMonitor()
+    server_socket = None
     try:
-        # Create the socket
-        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        server_socket.bind(("", port))  # Bind to all interfaces
-        server_socket.listen(5)
-buildctl --addr unix:///tmp/buildkitd.sock debug workers
+        # Create the socket; with reuse_port, worker processes share the port and
+        # the kernel balances connections between them
+        server_socket = open_listening_socket(port, socket_options, reuse_port, blocking=accept_mode == "blocking")
         if ssl_context:
             logging.info(f"SSL server is securely listening on port {port}...")
-            server_socket = ssl_context.wrap_socket(server_socket, server_side=True)
+            # Handshakes run in the pool so a slow client cannot stall accept()
+            if handshake_pool is None:
+                handshake_pool = HandshakePool()
         else:
             logging.info(f"Non-SSL server is listening on port {port}...")
 
         # Accept connections
-        while True:
-            try:
-                client_socket, address = server_socket.accept()
-                logging.info(f"New connection from {address} on port {port}")
-
-                # Simple HTTP response
+        if accept_mode == "blocking":
+            backlog_monitor.watch({port: server_socket})
+            batches = _accept_one_at_a_time(server_socket, port, stopping)
+        else:
+            batches = _accept_draining(server_socket, port, accept_batch, backlog_monitor, stopping)
+        for batch in batches:
+            with stats_lock:
+                connection_stats["connections"] += len(batch)
+            metrics.inc("accepts", port, len(batch))
+            for client_socket, address in batch:
                 try:
-                    request = client_socket.recv(1024).decode('utf-8')
-                    logging.debug(f"Request received on port {port}: {request}")
-
-                    # Send a basic response
+                    # Admission runs before the handshake so floods are turned away cheaply
+                    if admission is not None and not admission.admit_socket(client_socket, address, port):
+                        if journal is not None:
+                            journal.record(port, address, bool(ssl_context), REJECTED)
+                        continue
+                    connection_log.info("New connection from %s on port %s", address, port)
+                    tune_client_socket(client_socket, socket_options)
                     if ssl_context:
-                        client_socket.sendall(
-                            b"HTTP/1.1 200 OK\r\n"
-                            b"Content-Type: text/plain\r\n"
-                            b"Content-Length: 20\r\n"
-                            b"\r\n"
-                            b"Hello from SSL Port!"
-                        )
+                        handshake_pool.submit(client_socket, address, port, ssl_context, on_client,
+                                              on_dropped=partial(client_dropped, address, port, admission, journal))
                     else:
-                        client_socket.sendall(
-                            b"HTTP/1.1 200 OK\r\n"
-                            b"Content-Type: text/plain\r\n"
-                            b"Content-Length: 21\r\n"
-                            b"\r\n"
-                            b"Hello from Non-SSL Port!"
-                        )
-                except Exception as client_error:
-                    logging.error(f"Error handling client request on port {port}: {client_error}")
-                finally:
-                    client_socket.close()
-
-            except ssl.SSLError as ssl_error:
-                logging.error(f"SSL handshake error on port {port}: {ssl_error}")
-            except Exception as e:
-                logging.error(f"General error on port {port}: {e}")
+                        on_client(client_socket, address, port)
+                except Exception as e:
+                    connection_log.error("General error on port %s: %s", port, e)
 
     except Exception as e:
         logging.critical(f"Critical error on port {port}: {e}")
     finally:
-        server_socket.close()
+        if server_socket is not None:
+            server_socket.close()
         logging.info(f"Server on port {port} has been shut down.")
 
 
+def _accept_one_at_a_time(server_socket, port, stopping=None):
+    # Blocking accept(): one connection per call; wakes up now and then to check `stopping`
+    if stopping is not None:
+        server_socket.settimeout(STOP_POLL_INTERVAL)
+    while stopping is None or not stopping.is_set():
+        try:
+            yield [server_socket.accept()]
+        except socket.timeout:
+            continue
+        except OSError as e:
+            connection_log.error("General error on port %s: %s", port, e)
+
+
+def _accept_draining(server_socket, port, accept_batch, backlog_monitor, stopping=None):
+    # Wait for readiness, then empty the accept queue (up to accept_batch) in one go
+    selector = selectors.DefaultSelector()
+    selector.register(server_socket, selectors.EVENT_READ)
+    timeout = None if stopping is None else STOP_POLL_INTERVAL
+    try:
+        while stopping is None or not stopping.is_set():
+            if not selector.select(timeout):
+                continue
+            backlog_monitor.check(server_socket, port)
+            try:
+                batch = accept_pending(server_socket, accept_batch)
+            except OSError as e:
+                connection_log.error("General error on port %s: %s", port, e)
+                continue
+            if batch:
+                backlog_monitor.record_batch(len(batch))
+                yield batch
+    finally:
+        selector.close()
+
+
+def parse_ports(value):
+    """Parse a comma-separated port list such as "443,8443"; an empty string means none."""
+    try:
+        return [int(port) for port in value.split(",") if port.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid port list: {value!r}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Multi-port SSL/non-SSL listener, or with --scan a TCP connect scanner.")
+    parser.add_argument("--cert", default="C:/nginx-1.27.4/conf/Mohamed.crt", help="SSL certificate path")
+    parser.add_argument("--key", default="C:/nginx-1.27.4/conf/Mohamed.key", help="SSL private key path")
+    parser.add_argument("--ssl-ports", type=parse_ports, default=[443, 8443],
+                        help="Comma-separated ports served with TLS (default: 443,8443)")
+    parser.add_argument("--plain-ports", type=parse_ports, default=[80, 8080],
+                        help="Comma-separated plain HTTP ports (default: 80,8080)")
+    parser.add_argument("--mode", choices=("threads", "asyncio"), default="threads",
+                        help="threads: one blocking thread per port; asyncio: concurrent connections on one event loop")
+    parser.add_argument("--uvloop", action="store_true", help="Use uvloop for asyncio mode when it is installed")
+    parser.add_argument("--handshake-workers", type=int, default=DEFAULT_HANDSHAKE_WORKERS,
+                        help="Threads running TLS handshakes in threads mode")
+    parser.add_argument("--handshake-queue", type=int, default=DEFAULT_HANDSHAKE_QUEUE,
+                        help="Accepted SSL clients allowed to wait for a handshake worker")
+    parser.add_argument("--handshake-timeout", type=float, default=DEFAULT_HANDSHAKE_TIMEOUT,
+                        help="Seconds allowed for a complete TLS handshake")
+    parser.add_argument("--keep-alive", action="store_true",
+                        help="Serve several (including pipelined) requests per connection")
+    parser.add_argument("--idle-timeout", type=float, default=DEFAULT_IDLE_TIMEOUT,
+                        help="Seconds a connection may idle between requests")
+    parser.add_argument("--max-requests", type=int, default=DEFAULT_MAX_REQUESTS,
+                        help="Requests per kept-alive connection before it is closed")
+    parser.add_argument("--routes", help="JSON file mapping request paths to inline bodies or files")
+    parser.add_argument("--static-root", help="Directory whose files are cached and served by path")
+    parser.add_argument("--sendfile-threshold", type=int, default=SENDFILE_THRESHOLD,
+                        help="Files of at least this many bytes are sent with sendfile instead of cached")
+    parser.add_argument("--handler-threads", type=int, default=32,
+                        help="Threads serving client connections in threads mode")
+    parser.add_argument("--no-session-tickets", action="store_true",
+                        help="Disable TLS session tickets (resumption then relies on the server session cache)")
+    parser.add_argument("--num-tickets", type=int, default=DEFAULT_NUM_TICKETS,
+                        help="TLS 1.3 session tickets issued per full handshake")
+    parser.add_argument("--ecdh-curve", default=DEFAULT_ECDH_CURVE,
+                        help="Restrict ECDHE key exchange to this curve (default: OpenSSL's groups, X25519 first)")
+    parser.add_argument("--log-json", action="store_true", help="Write logs as compact JSON lines")
+    parser.add_argument("--log-sample", type=int, default=1,
+                        help="Log one in N per-connection events (errors are always logged)")
+    parser.add_argument("--log-queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="Pending log records kept before routine records are dropped")
+    parser.add_argument("--metrics-port", type=int,
+                        help="Serve Prometheus metrics at http://<metrics-host>:<port>/metrics")
+    parser.add_argument("--metrics-host", default="127.0.0.1", help="Interface for the metrics endpoint")
+    parser.add_argument("--accept-mode", choices=("drain", "blocking"), default="drain",
+                        help="drain: accept every queued connection on each wakeup; blocking: one accept() per call")
+    add_socket_arguments(parser)
+    add_admission_arguments(parser)
+    add_lifecycle_arguments(parser)
+    add_journal_arguments(parser)
+    add_scan_arguments(parser)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes sharing the ports via SO_REUSEPORT (Linux); 1 serves in-process")
+    parser.add_argument("--stats-interval", type=float, default=worker_supervisor.DEFAULT_STATS_INTERVAL,
+                        help="Seconds between stats reports (summed across workers when --workers > 1)")
+    return parser.parse_args()
+
+
+def load_response_cache(args):
+    if not args.routes and not args.static_root:
+        return None
+    response_cache = ResponseCache(static_root=args.static_root, sendfile_threshold=args.sendfile_threshold)
+    if args.routes:
+        response_cache.load_routes(args.routes)
+    return response_cache
+
+
+def report_stats(collect, args, stats_queue, worker_id):
+    # Workers push their stats (metrics included) to the supervisor; a single process reports its own
+    if stats_queue is not None:
+        worker_supervisor.start_stats_reporter(stats_queue, worker_id, lambda: {**collect(), **metrics.snapshot()},
+                                               args.stats_interval)
+        return
+    worker_supervisor.start_stats_logger(collect, args.stats_interval)
+    if args.metrics_port:
+        listener_metrics.start_admin_server(lambda: {**collect(), **metrics.snapshot()}, args.metrics_port,
+                                            args.metrics_host)
+
+
+def run_server(args, ports_to_listen, reuse_port=False, stats_queue=None, worker_id=0):
+    max_requests = args.max_requests if args.keep_alive else 1
+    response_cache = load_response_cache(args)
+    ssl_context = next((context for port, context in ports_to_listen if context), None)
+    resumption = ResumptionStats(ssl_context)
+    socket_options = socket_options_from_args(args)
+    backlog_monitor = BacklogMonitor()
+    draining = args.drain_timeout is not None
+    admission = admission_from_args(args, track=draining)
+    journal = journal_from_args(args, worker_id if stats_queue is not None else None)
+    if draining:
+        shutdown.install()
+    if isinstance(ssl_context, ReloadableContext):
+        # New handshakes pick up a rotated certificate; open connections are untouched
+        on_signal("SIGHUP", ssl_context.reload)
+        if args.reload_interval:
+            ssl_context.watch(args.reload_interval)
+    if args.mode == "asyncio":
+        def collect_async():
+            snapshot = dict(async_listener.stats)
+            snapshot.update(backlog_monitor.stats())
+            if admission is not None:
+                snapshot.update(admission.stats())
+            if journal is not None:
+                snapshot.update(journal.stats())
+            if isinstance(ssl_context, ReloadableContext):
+                snapshot.update(ssl_context.stats())
+            snapshot.update(resumption.stats())
+            snapshot.update(listener_logging.stats())
+            return snapshot
+
+        report_stats(collect_async, args, stats_queue, worker_id)
+        async_listener.run_listeners(ports_to_listen, use_uvloop=args.uvloop,
+                                     handshake_timeout=args.handshake_timeout, reuse_port=reuse_port,
+                                     idle_timeout=args.idle_timeout, max_requests=max_requests,
+                                     response_cache=response_cache, resumption=resumption,
+                                     socket_options=socket_options, backlog_monitor=backlog_monitor,
+                                     admission=admission, drain_timeout=args.drain_timeout, journal=journal)
+        return
+
+    # One handshake pool shared by every SSL port
+    handshake_pool = HandshakePool(workers=args.handshake_workers, max_queue=args.handshake_queue,
+                                   timeout=args.handshake_timeout)
+
+    def collect():
+        with stats_lock:
+            snapshot = dict(connection_stats)
+        snapshot.update(handshake_pool.stats())
+        snapshot.update(backlog_monitor.stats())
+        if admission is not None:
+            snapshot.update(admission.stats())
+        if journal is not None:
+            snapshot.update(journal.stats())
+        if isinstance(ssl_context, ReloadableContext):
+            snapshot.update(ssl_context.stats())
+        snapshot.update(resumption.stats())
+        snapshot.update(listener_logging.stats())
+        return snapshot
+
+    report_stats(collect, args, stats_queue, worker_id)
+
+    # Clients are served off the accept threads so kept-alive connections do not block accept()
+    client_pool = ThreadPoolExecutor(max_workers=args.handler_threads, thread_name_prefix="client")
+    handler = partial(serve_client, idle_timeout=args.idle_timeout, max_requests=max_requests,
+                      response_cache=response_cache, resumption=resumption, admission=admission, journal=journal)
+
+    def on_client(client_socket, address, port):
+        client_pool.submit(handler, client_socket, address, port)
+
+    threads = []
+    for port, context in ports_to_listen:
+        thread = threading.Thread(target=listen_on_port, args=(port, context, handshake_pool, reuse_port, on_client),
+                                  kwargs=dict(socket_options=socket_options, accept_mode=args.accept_mode,
+                                              accept_batch=args.accept_batch, backlog_monitor=backlog_monitor,
+                                              admission=admission, journal=journal,
+                                              stopping=shutdown.stopping if draining else None))
+        thread.daemon = True  # Allow threads to exit when the main program exits
+        threads.append(thread)
+        thread.start()
+
+    # Wait for all threads to complete; after a graceful stop, let open connections finish
+    remaining = 0
+    try:
+        join_threads(threads)
+        if draining:
+            remaining = wait_for_drain(admission, args.drain_timeout)
+    finally:
+        logging.info(f"Final stats: {collect()}")
+    if remaining:
+        exit_now()  # Do not wait on client threads still holding connections
+
+
+def worker_main(worker_id, stats_queue, args, ports_to_listen):
+    run_server(args, ports_to_listen, reuse_port=True, stats_queue=stats_queue, worker_id=worker_id)
+
+
 if __name__ == "__main__":
+    args = parse_args()
+
+    # Configure logging; records are written by a background thread
+    listener_logging.setup_logging(json_lines=args.log_json, sample_every=args.log_sample,
+                                   queue_size=args.log_queue_size)
+
+    # Scanner mode probes another listener instead of starting one
+    if args.scan:
+        status = scan_from_args(args)
+        listener_logging.stop_logging()
+        raise SystemExit(status)
+
     # Define SSL-related paths
-    ssl_cert_file = "C:/nginx-1.27.4/conf/Mohamed.crt"  # Replace with your certificate path
-    ssl_key_file = "C:/nginx-1.27.4/conf/Mohamed.key"  # Replace with your key path
+    ssl_cert_file = args.cert  # Replace the default with your certificate path
+    ssl_key_file = args.key  # Replace the default with your key path
 
     try:
-        # Create the SSL context
-        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-        ssl_context.load_cert_chain(certfile=ssl_cert_file, keyfile=ssl_key_file)
-        ssl_context.options |= ssl.OP_NO_SSLv2  # Disable SSLv2
-        ssl_context.options |= ssl.OP_NO_SSLv3  # Disable SSLv3
-        ssl_context.options |= ssl.OP_NO_TLSv1  # Disable TLSv1
-        ssl_context.options |= ssl.OP_NO_TLSv1_1  # Disable TLSv1.1
-        ssl_context.set_ciphers("HIGH:!aNULL:!MD5")
+        # Create the SSL context (TLS 1.2+, session resumption enabled); it is
+        # rebuilt from the same files on SIGHUP or when they change
+        ssl_context = ReloadableContext(ssl_cert_file, ssl_key_file,
+                                        build=partial(build_server_context,
+                                                      session_tickets=not args.no_session_tickets,
+                                                      num_tickets=args.num_tickets, ecdh_curve=args.ecdh_curve))
         logging.info("SSL context initialized successfully.")
 
         # Start multiple servers
-        ports_to_listen = [
-            (443, ssl_context),  # HTTPS port with SSL
-            (8443, ssl_context),  # Another SSL port (if needed)
-            (80, None),  # HTTP port without SSL
-            (8080, None)  # HTTP alternative port
-        ]
-
-        threads = []
-        for port, context in ports_to_listen:
-            thread = threading.Thread(target=listen_on_port, args=(port, context))
-            thread.daemon = True  # Allow threads to exit when the main program exits
-            threads.append(thread)
-            thread.start()
-
-        # Wait for all threads to complete
-        for thread in threads:
-            thread.join()
+        # HTTPS ports with SSL first, then plain HTTP ports
+        ports_to_listen = [(port, ssl_context) for port in args.ssl_ports]
+        ports_to_listen += [(port, None) for port in args.plain_ports]
+
+        if args.workers > 1:
+            worker_supervisor.run_workers(args.workers, worker_main, args=(args, ports_to_listen),
+                                          stats_interval=args.stats_interval, derive=add_resumption_rate,
+                                          metrics_port=args.metrics_port, metrics_host=args.metrics_host,
+                                          forward_signals=("SIGHUP",), drain_timeout=args.drain_timeout)
+        else:
+            run_server(args, ports_to_listen)
 
     except FileNotFoundError as fnf_error:
         logging.critical(f"SSL certificate or key file not found: {fnf_error}")
@@ -0,0 +1,164 @@
+import json
+import logging
+import mimetypes
+import os
+import threading
+import time
+from collections import namedtuple
+from http import HTTPStatus
+
+SENDFILE_THRESHOLD = 64 * 1024  # Files at least this big are streamed with sendfile instead of cached
+CHECK_INTERVAL = 1.0  # Seconds between mtime checks of a cached file
+
+# Header bytes plus the file region to send after them
+FileResponse = namedtuple("FileResponse", ["header", "path", "size"])
+
+
+def build_header(status, content_type, length):
+    phrase = HTTPStatus(status).phrase
+    return (
+        f"HTTP/1.1 {status} {phrase}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {length}\r\n"
+        f"\r\n"
+    ).encode("latin-1")
+
+
+def content_type_for(path):
+    content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if content_type.startswith("text/"):
+        content_type += "; charset=utf-8"
+    return content_type
+
+
+class _Entry:
+    __slots__ = ("response", "path", "status", "content_type", "mtime", "size", "checked")
+
+    def __init__(self, response, path=None, status=200, content_type=None, mtime=None, size=None):
+        self.response = response  # bytes, or FileResponse for large files
+        self.path = path  # Backing file, if any
+        self.status = status
+        self.content_type = content_type
+        self.mtime = mtime
+        self.size = size
+        self.checked = time.monotonic()
+
+
+class ResponseCache:
+    """Pre-encoded responses keyed by request path.
+
+    Inline routes and files are rendered once into complete header-plus-body
+    bytes. Files at or above `sendfile_threshold` are kept as a FileResponse so
+    the body can be sent with socket.sendfile(). File-backed entries are
+    re-checked at most every `check_interval` seconds and rebuilt when their
+    mtime or size changes.
+    """
+
+    def __init__(self, static_root=None, sendfile_threshold=SENDFILE_THRESHOLD, check_interval=CHECK_INTERVAL):
+        self.static_root = os.path.realpath(static_root) if static_root else None
+        self.sendfile_threshold = sendfile_threshold
+        self.check_interval = check_interval
+        self.entries = {}
+        self.lock = threading.Lock()  # Guards rebuilds; lookups read the dict without it
+        if self.static_root:
+            self.load_static_root()
+
+    def add_body(self, path, body, content_type="text/plain", status=200):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.entries[path] = _Entry(build_header(status, content_type, len(body)) + body, status=status,
+                                    content_type=content_type)
+
+    def add_file(self, path, file_path, content_type=None, status=200):
+        entry = self._load_file(file_path, content_type or content_type_for(file_path), status)
+        if entry is not None:
+            self.entries[path] = entry
+
+    def load_routes(self, config_path):
+        """Load routes from a JSON object mapping request paths to {"body"|"file", "content_type", "status"}."""
+        with open(config_path, encoding="utf-8") as config_file:
+            routes = json.load(config_file)
+        base_dir = os.path.dirname(os.path.abspath(config_path))
+        for path, route in routes.items():
+            status = route.get("status", 200)
+            if "file" in route:
+                self.add_file(path, os.path.join(base_dir, route["file"]), route.get("content_type"), status)
+            else:
+                self.add_body(path, route.get("body", ""), route.get("content_type", "text/plain"), status)
+        logging.info(f"Loaded {len(routes)} routes from {config_path}")
+
+    def load_static_root(self):
+        count = 0
+        for root, dirs, files in os.walk(self.static_root):
+            for name in files:
+                file_path = os.path.join(root, name)
+                url_path = "/" + os.path.relpath(file_path, self.static_root).replace(os.sep, "/")
+                self.add_file(url_path, file_path)
+                count += 1
+        logging.info(f"Cached {count} static files from {self.static_root}")
+
+    def picker(self, default):
+        """Return a pick_response callable that serves cached paths and falls back to `default`."""
+        def pick_response(request):
+            response = self.lookup(request.path)
+            return default if response is None else response
+        return pick_response
+
+    def lookup(self, path):
+        """Return the cached response (bytes or FileResponse) for `path`, or None."""
+        path = path.split("?", 1)[0]
+        entry = self.entries.get(path)
+        if entry is None and self.static_root:
+            entry = self._load_new_static_file(path)
+        if entry is None:
+            return None
+        if entry.path is not None and time.monotonic() - entry.checked >= self.check_interval:
+            entry = self._refresh(path, entry)
+            if entry is None:
+                return None
+        return entry.response
+
+    def _load_file(self, file_path, content_type, status):
+        try:
+            stat_result = os.stat(file_path)
+            if stat_result.st_size >= self.sendfile_threshold:
+                response = FileResponse(build_header(status, content_type, stat_result.st_size), file_path,
+                                        stat_result.st_size)
+            else:
+                with open(file_path, "rb") as file:
+                    body = file.read()
+                response = build_header(status, content_type, len(body)) + body
+        except OSError as e:
+            logging.warning(f"Could not load {file_path}: {e}")
+            return None
+        return _Entry(response, file_path, status, content_type, stat_result.st_mtime_ns, stat_result.st_size)
+
+    def _load_new_static_file(self, path):
+        file_path = os.path.realpath(os.path.join(self.static_root, path.lstrip("/")))
+        if not file_path.startswith(self.static_root + os.sep) or not os.path.isfile(file_path):
+            return None  # Outside the root, or missing
+        with self.lock:
+            entry = self.entries.get(path) or self._load_file(file_path, content_type_for(file_path), 200)
+            if entry is not None:
+                self.entries[path] = entry
+        return entry
+
+    def _refresh(self, path, entry):
+        with self.lock:
+            if self.entries.get(path) is not entry:
+                return self.entries.get(path)  # Another thread already refreshed it
+            entry.checked = time.monotonic()
+            try:
+                stat_result = os.stat(entry.path)
+            except OSError:
+                del self.entries[path]  # File was removed
+                return None
+            if stat_result.st_mtime_ns == entry.mtime and stat_result.st_size == entry.size:
+                return entry
+            fresh = self._load_file(entry.path, entry.content_type, entry.status)
+            if fresh is None:
+                del self.entries[path]
+                return None
+            self.entries[path] = fresh
+            logging.info(f"Reloaded {entry.path}")
+            return fresh
@@ -0,0 +1,177 @@
+import logging
+import socket
+import struct
+import threading
+import time
+from collections import namedtuple
+
+from listener_metrics import metrics
+
+DEFAULT_BACKLOG = socket.SOMAXCONN  # The kernel clamps this to net.core.somaxconn
+DEFAULT_ACCEPT_BATCH = 64  # Connections drained per readiness event before other ports get a turn
+MONITOR_INTERVAL = 0.1  # Seconds between accept-queue samples for listeners that accept on their own
+
+# Options for a listening socket. Buffer sizes of None keep the kernel default;
+# defer_accept is in seconds and only applies on Linux.
+SocketOptions = namedtuple("SocketOptions", ["backlog", "nodelay", "defer_accept", "rcvbuf", "sndbuf"],
+                           defaults=(DEFAULT_BACKLOG, True, 0, None, None))
+
+_TCP_INFO = struct.Struct("=8B6I")  # Up to tcpi_unacked/tcpi_sacked: accept queue length and limit
+
+
+def open_listening_socket(port, options=None, reuse_port=False, blocking=False):
+    """Create a TCP socket bound to all interfaces on `port`, tuned by `options`."""
+    options = options or SocketOptions()
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            # Lets several worker processes bind the same port; the kernel spreads connections
+            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        # Buffer sizes set before listen() are inherited by accepted sockets and
+        # take part in the window scale negotiated during the handshake.
+        if options.rcvbuf:
+            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, options.rcvbuf)
+        if options.sndbuf:
+            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, options.sndbuf)
+        if options.defer_accept:
+            if hasattr(socket, "TCP_DEFER_ACCEPT"):
+                # accept() only reports connections once the client has sent data
+                server_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_DEFER_ACCEPT, options.defer_accept)
+            else:
+                logging.warning("TCP_DEFER_ACCEPT is not supported on this platform; ignoring it.")
+        server_socket.bind(("", port))  # Bind to all interfaces
+        server_socket.listen(options.backlog)
+        server_socket.setblocking(blocking)
+    except OSError:
+        server_socket.close()
+        raise
+    return server_socket
+
+
+def tune_client_socket(client_socket, options):
+    """Apply per-connection options; TCP_NODELAY is not inherited from the listener everywhere."""
+    if options.nodelay:
+        try:
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError:
+            pass  # Client already gone; the handler will notice
+
+
+def accept_pending(server_socket, max_batch=DEFAULT_ACCEPT_BATCH):
+    """Accept up to `max_batch` queued connections from a non-blocking socket without waiting.
+
+    Errors other than "nothing pending" (e.g. EMFILE) are raised only when
+    nothing was accepted yet, so connections already taken are never lost.
+    """
+    accepted = []
+    while len(accepted) < max_batch:
+        try:
+            accepted.append(server_socket.accept())
+        except (BlockingIOError, InterruptedError):
+            break
+        except OSError:
+            if not accepted:
+                raise
+            break
+    return accepted
+
+
+def accept_queue(server_socket):
+    """Return (queued, limit) for a listening socket, or None where TCP_INFO is unavailable (non-Linux)."""
+    if not hasattr(socket, "TCP_INFO"):
+        return None
+    try:
+        info = server_socket.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, _TCP_INFO.size)
+    except OSError:
+        return None
+    fields = _TCP_INFO.unpack_from(info)
+    return fields[12], fields[13]
+
+
+def listen_overflows():
+    """Host-wide count of connections dropped because an accept queue was full (Linux), or None."""
+    try:
+        with open("/proc/net/netstat") as netstat:
+            lines = netstat.read().splitlines()
+    except OSError:
+        return None
+    for names, values in zip(lines[::2], lines[1::2]):
+        if names.startswith("TcpExt:"):
+            fields = dict(zip(names.split()[1:], values.split()[1:]))
+            return int(fields.get("ListenOverflows", 0))
+    return None
+
+
+class BacklogMonitor:
+    """Counts how often a listener's accept queue is found full, per port.
+
+    Drain loops call check() right before each batch of accepts; listeners
+    that accept on their own (blocking threads, asyncio) are sampled by
+    watch(). The host-wide kernel ListenOverflows counter, relative to when
+    the monitor was created, is reported alongside.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.backlog_full = 0
+        self.accept_batches = 0
+        self.max_accept_batch = 0
+        self.overflows_at_start = listen_overflows()
+
+    def check(self, server_socket, port):
+        queue_state = accept_queue(server_socket)
+        if queue_state is not None and queue_state[0] > queue_state[1]:
+            # The kernel drops new connections once the queue holds more than the backlog
+            with self.lock:
+                self.backlog_full += 1
+            metrics.inc("backlog_full", port)
+            return True
+        return False
+
+    def record_batch(self, size):
+        with self.lock:
+            self.accept_batches += 1
+            self.max_accept_batch = max(self.max_accept_batch, size)
+
+    def watch(self, sockets, interval=MONITOR_INTERVAL):
+        """Sample {port: listening socket} every `interval` seconds on a daemon thread."""
+        def sample():
+            while True:
+                for port, server_socket in list(sockets.items()):
+                    if server_socket.fileno() != -1:
+                        self.check(server_socket, port)
+                time.sleep(interval)
+
+        thread = threading.Thread(target=sample, name="backlog-monitor", daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self):
+        with self.lock:
+            snapshot = {"backlog_full": self.backlog_full, "accept_batches": self.accept_batches,
+                        "max_accept_batch": self.max_accept_batch}
+        current = listen_overflows()
+        if current is not None and self.overflows_at_start is not None:
+            snapshot["listen_overflows"] = current - self.overflows_at_start
+        return snapshot
+
+
+def add_socket_arguments(parser):
+    """Add the listening-socket options shared by the listener scripts to an argparse parser."""
+    group = parser.add_argument_group("listening sockets")
+    group.add_argument("--backlog", type=int, default=DEFAULT_BACKLOG,
+                       help="Accept queue length per port (capped by net.core.somaxconn)")
+    group.add_argument("--no-tcp-nodelay", action="store_true", help="Leave Nagle's algorithm on for clients")
+    group.add_argument("--defer-accept", type=int, default=0,
+                       help="Seconds to wait for the client's first bytes before accept() sees it (Linux)")
+    group.add_argument("--rcvbuf", type=int, help="SO_RCVBUF in bytes (default: kernel autotuning)")
+    group.add_argument("--sndbuf", type=int, help="SO_SNDBUF in bytes (default: kernel autotuning)")
+    group.add_argument("--accept-batch", type=int, default=DEFAULT_ACCEPT_BATCH,
+                       help="Connections drained from the accept queue per readiness event")
+    return group
+
+
+def socket_options_from_args(args):
+    return SocketOptions(backlog=args.backlog, nodelay=not args.no_tcp_nodelay, defer_accept=args.defer_accept,
+                         rcvbuf=args.rcvbuf, sndbuf=args.sndbuf)
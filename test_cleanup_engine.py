@@ -0,0 +1,121 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import cleanup_engine
+from cleanup_engine import remove_tree
+
+
+def _make_tree(root, depth=3, fanout=3, files=4):
+    """A tree of `fanout` subdirectories per level, each holding `files` files; returns the entry count."""
+    os.makedirs(root, exist_ok=True)
+    count = 0
+    for i in range(files):
+        with open(os.path.join(root, f"f{i}"), "w") as f:
+            f.write("x" * i)
+        count += 1
+    if depth:
+        for i in range(fanout):
+            count += 1 + _make_tree(os.path.join(root, f"d{i}"), depth - 1, fanout, files)
+    return count
+
+
+class RemoveTreeTest(unittest.TestCase):
+    def setUp(self):
+        self.base = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.base, ignore_errors=True)
+        self.root = os.path.join(self.base, "root")
+        self.entries = _make_tree(self.root)
+
+    def test_removes_everything(self):
+        skipped = []
+        result = remove_tree(self.root, workers=4, skipped=skipped)
+        self.assertFalse(os.path.exists(self.root))
+        self.assertEqual(result.deleted, self.entries + 1)
+        self.assertEqual((result.failed, skipped), ([], []))
+
+    def test_deep_tree_is_walked_inline(self):
+        deep = os.path.join(self.root, *["n"] * (cleanup_engine.MAX_INLINE_DEPTH + 20))
+        os.makedirs(deep)
+        open(os.path.join(deep, "leaf"), "w").close()
+        result = remove_tree(self.root, workers=1)
+        self.assertFalse(os.path.exists(self.root))
+        self.assertEqual(result.failed, [])
+
+    @unittest.skipUnless(cleanup_engine._USE_DIR_FD, "no dir_fd support on this platform")
+    def test_unlinks_by_name_relative_to_directory_fd(self):
+        calls = []
+        unlink = cleanup_engine._unlink
+
+        def record(name, path, dir_fd):
+            calls.append((name, path, dir_fd))
+            unlink(name, path, dir_fd)
+
+        with mock.patch.object(cleanup_engine, "_unlink", record):
+            remove_tree(self.root, workers=2)
+        self.assertFalse(os.path.exists(self.root))
+        self.assertTrue(calls)
+        for name, path, dir_fd in calls:
+            self.assertIsNotNone(dir_fd)
+            self.assertEqual(name, os.path.basename(path))
+
+    def test_removes_by_path_without_dir_fd(self):
+        with mock.patch.object(cleanup_engine, "_USE_DIR_FD", False):
+            result = remove_tree(self.root, workers=2)
+        self.assertFalse(os.path.exists(self.root))
+        self.assertEqual(result.deleted, self.entries + 1)
+
+    def test_keep_root_removes_only_the_contents(self):
+        result = remove_tree(self.root, workers=2, keep_root=True)
+        self.assertEqual(os.listdir(self.root), [])
+        self.assertEqual(result.deleted, self.entries)
+
+    def test_survivors_are_reported_and_their_parents_kept(self):
+        locked = os.path.join(self.root, "d1", "d0", "f2")
+        unlink = cleanup_engine._unlink
+
+        def refuse(name, path, dir_fd):
+            if path == locked:
+                raise PermissionError(13, "Locked", path)
+            unlink(name, path, dir_fd)
+
+        skipped = []
+        with mock.patch.object(cleanup_engine, "_unlink", refuse), self.assertLogs(level="WARNING"):
+            result = remove_tree(self.root, workers=4, skipped=skipped)
+        self.assertEqual([path for path, _ in result.failed], [locked])
+        self.assertIsInstance(result.failed[0][1], PermissionError)
+        self.assertEqual(skipped, [locked])
+        # Only the survivor and the directories above it are left
+        remaining = [os.path.join(directory, name) for directory, dirs, files in os.walk(self.root)
+                     for name in dirs + files]
+        self.assertEqual(sorted(remaining), sorted([os.path.dirname(os.path.dirname(locked)),
+                                                    os.path.dirname(locked), locked]))
+
+    def test_symlink_root_is_refused(self):
+        link = os.path.join(self.base, "link")
+        os.symlink(self.root, link)
+        with self.assertLogs(level="WARNING"):
+            result = remove_tree(link)
+        self.assertEqual([path for path, _ in result.failed], [link])
+        self.assertTrue(os.path.isdir(self.root))
+        self.assertEqual(result.deleted, 0)
+
+    def test_unexpected_error_is_raised_after_the_rest_is_removed(self):
+        broken = os.path.join(self.root, "d2", "f1")
+        unlink = cleanup_engine._unlink
+
+        def fail(name, path, dir_fd):
+            if path == broken:
+                raise ValueError("bug")
+            unlink(name, path, dir_fd)
+
+        with mock.patch.object(cleanup_engine, "_unlink", fail), self.assertRaises(ValueError):
+            remove_tree(self.root, workers=4)
+        self.assertTrue(os.path.isdir(os.path.join(self.root, "d2")))
+        self.assertFalse(os.path.exists(os.path.join(self.root, "d0")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import socket
+import unittest
+
+from http_parser import MAX_BODY_BYTES, MAX_HEADERS, RequestError, RequestParser, parse_head
+
+
+def _parse_all(parser, *chunks):
+    requests = []
+    for chunk in chunks:
+        parser.feed(chunk)
+        while True:
+            request = parser.next_request()
+            if request is None:
+                break
+            requests.append(request)
+    return requests
+
+
+class RequestParserTest(unittest.TestCase):
+    def test_single_request(self):
+        request, = _parse_all(RequestParser(), b"GET /a HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n")
+        self.assertEqual((request.method, request.path, request.version), ("GET", "/a", "HTTP/1.1"))
+        self.assertEqual(request.headers, {b"host": b"x", b"connection": b"close"})
+        self.assertFalse(request.keep_alive)
+
+    def test_head_split_across_reads(self):
+        head = b"GET /split HTTP/1.1\r\nHost: x\r\n\r\n"
+        for cut in range(1, len(head)):
+            with self.subTest(cut=cut):
+                request, = _parse_all(RequestParser(), head[:cut], head[cut:])
+                self.assertEqual(request.path, "/split")
+
+    def test_terminator_split_byte_by_byte(self):
+        parser = RequestParser()
+        requests = _parse_all(parser, *(bytes([b]) for b in b"GET / HTTP/1.1\r\n\r\n"))
+        self.assertEqual([request.path for request in requests], ["/"])
+
+    def test_pipelined_requests_with_bodies(self):
+        data = (b"POST /one HTTP/1.1\r\nContent-Length: 5\r\n\r\nhello"
+                b"GET /two HTTP/1.0\r\nConnection: keep-alive\r\n\r\n"
+                b"GET /three HTTP/1.0\r\n\r\n")
+        requests = _parse_all(RequestParser(), data)
+        self.assertEqual([request.path for request in requests], ["/one", "/two", "/three"])
+        self.assertEqual([request.keep_alive for request in requests], [True, True, False])
+
+    def test_body_split_from_next_request(self):
+        requests = _parse_all(RequestParser(), b"POST /one HTTP/1.1\r\nContent-Length: 6\r\n\r\nab",
+                              b"cd", b"efGET /two HTTP/1.1\r\n\r\n")
+        self.assertEqual([request.path for request in requests], ["/one", "/two"])
+
+    def test_buffer_is_compacted_when_full(self):
+        parser = RequestParser(buffer_size=64, max_head_bytes=48)
+        head = b"GET /%02d HTTP/1.1\r\n\r\n"
+        paths = []
+        for i in range(20):
+            data = head % i
+            while data:
+                room = parser.room()
+                self.assertGreater(room, 0)
+                chunk, data = data[:room], data[room:]
+                paths += [request.path for request in _parse_all(parser, chunk)]
+        self.assertEqual(paths, ["/%02d" % i for i in range(20)])
+
+    def test_recv_into_socket(self):
+        left, right = socket.socketpair()
+        with left, right:
+            left.sendall(b"GET /sock HTTP/1.1\r\n\r\n")
+            parser = RequestParser()
+            self.assertGreater(parser.recv_into(right), 0)
+            self.assertEqual(parser.next_request().path, "/sock")
+            left.close()
+            self.assertEqual(parser.recv_into(right), 0)
+
+    def assertRejected(self, status, *chunks, parser=None):
+        with self.assertRaises(RequestError) as raised:
+            _parse_all(parser or RequestParser(), *chunks)
+        self.assertEqual(raised.exception.status, status)
+        self.assertTrue(raised.exception.response.startswith(b"HTTP/1.1 %d " % status))
+        self.assertIn(b"Connection: close\r\n", raised.exception.response)
+
+    def test_malformed_request_line_is_400(self):
+        self.assertRejected(400, b"GET /\r\n\r\n")
+        self.assertRejected(400, b"GET / SPDY/3\r\n\r\n")
+
+    def test_malformed_header_is_400(self):
+        self.assertRejected(400, b"GET / HTTP/1.1\r\nNoColon\r\n\r\n")
+        self.assertRejected(400, b"GET / HTTP/1.1\r\nName : value\r\n\r\n")
+
+    def test_invalid_content_length_is_400(self):
+        self.assertRejected(400, b"POST / HTTP/1.1\r\nContent-Length: ten\r\n\r\n")
+        self.assertRejected(400, b"POST / HTTP/1.1\r\nContent-Length: -1\r\n\r\n")
+
+    def test_chunked_body_is_411(self):
+        self.assertRejected(411, b"POST / HTTP/1.1\r\nTransfer-Encoding: gzip, chunked\r\n\r\n")
+
+    def test_oversized_body_is_413(self):
+        self.assertRejected(413, b"POST / HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % (MAX_BODY_BYTES + 1))
+
+    def test_too_many_headers_is_431(self):
+        headers = b"".join(b"X-%d: y\r\n" % i for i in range(MAX_HEADERS + 1))
+        self.assertRejected(431, b"GET / HTTP/1.1\r\n" + headers + b"\r\n")
+
+    def test_unterminated_head_is_431(self):
+        parser = RequestParser(buffer_size=256, max_head_bytes=64)
+        self.assertRejected(431, b"GET / HTTP/1.1\r\n", b"X-Long: " + b"a" * 80, parser=parser)
+
+    def test_complete_oversized_head_is_431(self):
+        parser = RequestParser(buffer_size=256, max_head_bytes=64)
+        self.assertRejected(431, b"GET / HTTP/1.1\r\nX-Long: " + b"a" * 80 + b"\r\n\r\n", parser=parser)
+
+
+class ParseHeadTest(unittest.TestCase):
+    def test_keep_alive_defaults_by_version(self):
+        self.assertTrue(parse_head(b"GET / HTTP/1.1").keep_alive)
+        self.assertFalse(parse_head(b"GET / HTTP/1.0").keep_alive)
+        self.assertEqual(parse_head(b"GET / HTTP/1.1\r\nContent-Length: 12").content_length, 12)
+
+
+if __name__ == "__main__":
+    unittest.main()
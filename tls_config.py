@@ -0,0 +1,170 @@
+import logging
+import os
+import ssl
+import threading
+import time
+
+DEFAULT_CIPHERS = "HIGH:!aNULL:!MD5"
+DEFAULT_ECDH_CURVE = None  # Keep OpenSSL's key-exchange groups (X25519 first); a name restricts them to one curve
+DEFAULT_NUM_TICKETS = 2  # TLS 1.3 tickets sent after each full handshake
+
+
+def build_server_context(cert_file, key_file, session_tickets=True, num_tickets=DEFAULT_NUM_TICKETS,
+                         ecdh_curve=DEFAULT_ECDH_CURVE, ciphers=DEFAULT_CIPHERS):
+    """Create the shared server SSLContext with resumption enabled.
+
+    OpenSSL keeps a server-side session cache by default (20480 entries);
+    Python's ssl module cannot resize it, so its fill level is reported through
+    session_stats() instead. Tickets let TLS 1.2 and 1.3 clients resume
+    without hitting that cache at all.
+    """
+    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ssl_context.load_cert_chain(certfile=cert_file, keyfile=key_file)
+    ssl_context.minimum_version = ssl.TLSVersion.TLSv1_2  # Disable SSLv2/3, TLSv1 and TLSv1.1
+    ssl_context.set_ciphers(ciphers)
+    if ecdh_curve:
+        ssl_context.set_ecdh_curve(ecdh_curve)
+    if session_tickets:
+        ssl_context.options &= ~ssl.OP_NO_TICKET
+        ssl_context.num_tickets = num_tickets
+    else:
+        ssl_context.options |= ssl.OP_NO_TICKET
+        ssl_context.num_tickets = 0
+    logging.info(f"TLS context ready (tickets={'on' if session_tickets else 'off'}, "
+                 f"num_tickets={ssl_context.num_tickets}, curve={ecdh_curve or 'default'})")
+    return ssl_context
+
+
+def add_resumption_rate(stats):
+    """Add resumption_hit_rate derived from tls_handshakes/tls_resumed counters."""
+    handshakes = stats.get("tls_handshakes", 0)
+    stats["resumption_hit_rate"] = stats.get("tls_resumed", 0) / handshakes if handshakes else 0.0
+    return stats
+
+
+class ResumptionStats:
+    """Counts completed TLS handshakes and how many of them resumed a session."""
+
+    def __init__(self, ssl_context=None):
+        self.ssl_context = ssl_context
+        self.lock = threading.Lock()
+        self.handshakes = 0
+        self.resumed = 0
+
+    def record(self, ssl_object):
+        """Record one finished handshake from an SSLSocket or SSLObject."""
+        reused = ssl_object.session_reused
+        with self.lock:
+            self.handshakes += 1
+            if reused:
+                self.resumed += 1
+
+    def stats(self):
+        with self.lock:
+            snapshot = {"tls_handshakes": self.handshakes, "tls_resumed": self.resumed}
+        if self.ssl_context is not None:
+            # OpenSSL's own session cache counters (hits, misses, cache_full, ...)
+            for key, value in self.ssl_context.session_stats().items():
+                snapshot[f"session_cache_{key}"] = value
+        return add_resumption_rate(snapshot)
+
+
+class ReloadableContext:
+    """Server SSLContext stand-in whose certificate can be swapped while serving.
+
+    wrap_socket() and wrap_bio() use whichever context is current, so a reload
+    applies to new connections while established ones keep the context they
+    started with. Other attributes are read from the current context. Sessions
+    and tickets issued by the old context do not resume after a swap.
+    """
+
+    context = None
+
+    def __init__(self, cert_file, key_file, build=build_server_context):
+        self.cert_file = cert_file
+        self.key_file = key_file
+        self.build = build
+        self.lock = threading.Lock()  # One reload at a time; readers never take it
+        self.signature = self._signature()
+        self.failed_signature = None
+        self.context = build(cert_file, key_file)
+        self.reloads = 0
+        self.reload_failures = 0
+
+    def __getattr__(self, name):
+        return getattr(self.context, name)
+
+    def wrap_socket(self, *args, **kwargs):
+        return self.context.wrap_socket(*args, **kwargs)
+
+    def wrap_bio(self, *args, **kwargs):
+        return self.context.wrap_bio(*args, **kwargs)
+
+    def _signature(self):
+        try:
+            return tuple((stat.st_mtime_ns, stat.st_size) for stat in map(os.stat, (self.cert_file, self.key_file)))
+        except OSError:
+            return None  # Mid-rotation; try again later
+
+    def reload(self):
+        """Build a fresh context from the files; on failure keep serving with the current one."""
+        with self.lock:
+            signature = self._signature()
+            try:
+                context = self.build(self.cert_file, self.key_file)
+            except (OSError, ssl.SSLError) as e:
+                self.reload_failures += 1
+                self.failed_signature = signature  # Do not retry the same broken files every check
+                logging.error(f"Certificate reload failed, keeping the current one: {e}")
+                return False
+            self.context = context  # A single reference swap; new handshakes use it from here on
+            self.signature = signature
+            self.reloads += 1
+        logging.info(f"Reloaded certificate from {self.cert_file}")
+        return True
+
+    def reload_if_changed(self):
+        signature = self._signature()
+        if signature is None or signature in (self.signature, self.failed_signature):
+            return False
+        return self.reload()
+
+    def watch(self, interval):
+        """Reload whenever the cert or key file changes, checking every `interval` seconds."""
+        def poll():
+            while True:
+                time.sleep(interval)
+                self.reload_if_changed()
+
+        thread = threading.Thread(target=poll, name="cert-watcher", daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self):
+        return {"cert_reloads": self.reloads, "cert_reload_failures": self.reload_failures}
+
+    def server_context(self):
+        """A real SSLContext for servers that take one up front (asyncio.start_server, uvloop's included).
+
+        Its SNI callback moves each new handshake onto whichever context is
+        current, so reloads still apply without restarting the server.
+        """
+        context = self.context
+        context.sni_callback = self._use_current
+        return context
+
+    def _use_current(self, ssl_object, server_name, initial_context):
+        current = self.context
+        if ssl_object.context is not current:
+            ssl_object.context = current
+        return None
+
+
+def current_context(ssl_context):
+    """The real SSLContext behind `ssl_context`, for APIs that insist on one (loop.start_tls)."""
+    return ssl_context.context if isinstance(ssl_context, ReloadableContext) else ssl_context
+
+
+def server_context(ssl_context):
+    """An SSLContext to hand a server once; unlike current_context() it follows later reloads."""
+    return ssl_context.server_context() if isinstance(ssl_context, ReloadableContext) else ssl_context
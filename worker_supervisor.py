@@ -0,0 +1,181 @@
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import threading
+import time
+
+import listener_metrics
+
+DEFAULT_STATS_INTERVAL = 10.0  # Seconds between worker stats reports
+RESTART_DELAY = 1.0  # Pause before restarting a crashed worker, to avoid tight crash loops
+STOP_GRACE = 5.0  # Extra seconds a draining worker gets beyond its drain timeout before it is killed
+# Point-in-time values, not carried over from dead workers
+GAUGE_KEYS = ("ports", "queue_depth", "active_connections", "tracked_sources")
+HOST_KEYS = ("listen_overflows",)  # Host-wide counters every worker reads; summing would multiply them
+
+
+def reuse_port_supported():
+    return hasattr(socket, "SO_REUSEPORT") and "fork" in multiprocessing.get_all_start_methods()
+
+
+def merge_stats(snapshots):
+    """Sum numeric counters across workers; peak_/max_ keys and HOST_KEYS keep the largest value.
+
+    Derived mean_* and *_rate values cannot be summed and are dropped.
+    """
+    totals = {}
+    for snapshot in snapshots:
+        for key, value in snapshot.items():
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or key.startswith("mean_") \
+                    or key.endswith("_rate"):
+                continue
+            if key.startswith(("peak_", "max_")) or key in HOST_KEYS:
+                totals[key] = max(totals.get(key, value), value)
+            else:
+                totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+def start_stats_reporter(stats_queue, worker_id, collect, interval=DEFAULT_STATS_INTERVAL):
+    """Run in a worker: push collect() to the parent every `interval` seconds."""
+    def report():
+        while True:
+            time.sleep(interval)
+            try:
+                stats_queue.put_nowait((worker_id, collect()))
+            except queue.Full:
+                pass  # Parent is behind; the next report supersedes this one
+            except Exception as e:
+                logging.warning(f"Worker {worker_id} could not report stats: {e}")
+
+    thread = threading.Thread(target=report, name="stats-reporter", daemon=True)
+    thread.start()
+    return thread
+
+
+def start_stats_logger(collect, interval=DEFAULT_STATS_INTERVAL):
+    """Single-process counterpart of start_stats_reporter(): log collect() every `interval` seconds."""
+    def log_stats():
+        while True:
+            time.sleep(interval)
+            try:
+                logging.info(f"Stats: {collect()}")
+            except Exception as e:
+                logging.warning(f"Could not collect stats: {e}")
+
+    thread = threading.Thread(target=log_stats, name="stats-logger", daemon=True)
+    thread.start()
+    return thread
+
+
+def _worker_entry(worker_main, worker_id, stats_queue, args, forwarded):
+    # Drop the parent's forwarding handlers; worker_main installs its own
+    for signum in forwarded:
+        signal.signal(signum, signal.SIG_DFL if signum == signal.SIGTERM else signal.SIG_IGN)
+    try:
+        worker_main(worker_id, stats_queue, *args)
+    except KeyboardInterrupt:
+        pass
+
+
+def run_workers(count, worker_main, args=(), stats_interval=DEFAULT_STATS_INTERVAL, derive=None,
+                metrics_port=None, metrics_host="127.0.0.1", forward_signals=(), drain_timeout=None):
+    """Fork `count` workers running ``worker_main(worker_id, stats_queue, *args)`` and supervise them.
+
+    Each worker is expected to bind its ports with SO_REUSEPORT so the kernel
+    balances connections between them. Workers that exit are restarted, and the
+    parent logs the summed stats of all workers (including ones that died) at
+    every interval; `derive(totals)` can add ratios computed from the sums.
+    With `metrics_port`, the parent also serves the summed stats to Prometheus.
+
+    Signals named in `forward_signals` (e.g. "SIGHUP") are passed on to every
+    worker. SIGTERM terminates the workers; with `drain_timeout` it is passed
+    on instead and the parent stops restarting workers, waiting for them to
+    drain and exit.
+    """
+    if not reuse_port_supported():
+        raise RuntimeError("Multi-process workers need SO_REUSEPORT and fork(); run with a single worker instead.")
+
+    context = multiprocessing.get_context("fork")
+    stats_queue = context.Queue(maxsize=count * 16)
+    processes = {}
+    latest = {}  # worker_id -> last snapshot from the current process
+    state = {"retired": {}, "stopping": False}  # Folded final snapshots of workers that were restarted
+
+    def totals():
+        merged = merge_stats([state["retired"], *list(latest.values())])
+        if derive is not None:
+            derive(merged)
+        return merged
+
+    def spawn(worker_id):
+        process = context.Process(target=_worker_entry,
+                                  args=(worker_main, worker_id, stats_queue, args, list(forwarded)),
+                                  name=f"listener-worker-{worker_id}", daemon=True)
+        process.start()
+        processes[worker_id] = process
+        logging.info(f"Started worker {worker_id} (pid {process.pid})")
+
+    def forward(signum, frame):
+        if signum == signal.SIGTERM:
+            if drain_timeout is None or state["stopping"]:
+                raise SystemExit  # Immediate stop (or a second SIGTERM); workers are terminated below
+            state["stopping"] = True
+            state["deadline"] = time.monotonic() + drain_timeout + STOP_GRACE
+            logging.info("Draining workers before shutting down.")
+        for process in list(processes.values()):
+            if process.is_alive():
+                os.kill(process.pid, signum)
+
+    forwarded = [getattr(signal, name) for name in forward_signals if hasattr(signal, name)]
+    forwarded.append(signal.SIGTERM)  # Without a drain this just makes sure workers die with the parent
+    for signum in forwarded:
+        signal.signal(signum, forward)
+
+    for worker_id in range(count):
+        spawn(worker_id)
+    if metrics_port:
+        listener_metrics.start_admin_server(totals, metrics_port, metrics_host)
+
+    next_summary = time.monotonic() + stats_interval
+    try:
+        while True:
+            try:
+                worker_id, snapshot = stats_queue.get(timeout=0.5)
+                latest[worker_id] = snapshot
+            except queue.Empty:
+                pass
+
+            if state["stopping"]:
+                if not any(process.is_alive() for process in processes.values()):
+                    break
+                if time.monotonic() >= state["deadline"]:
+                    logging.warning("Workers did not drain in time; terminating them.")
+                    break
+                continue
+
+            for worker_id, process in list(processes.items()):
+                if process.is_alive():
+                    continue
+                logging.error(f"Worker {worker_id} (pid {process.pid}) exited with code {process.exitcode}; restarting")
+                if worker_id in latest:
+                    final = latest.pop(worker_id)
+                    final = {key: value for key, value in final.items() if key not in GAUGE_KEYS}
+                    state["retired"] = merge_stats([state["retired"], final])
+                time.sleep(RESTART_DELAY)
+                spawn(worker_id)
+
+            if time.monotonic() >= next_summary:
+                next_summary += stats_interval
+                summary = {key: value for key, value in totals().items()
+                           if not key.startswith(listener_metrics.PREFIX)}  # Series are for /metrics only
+                logging.info(f"Stats across {len(processes)} workers: {summary}")
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join(timeout=5)
+        logging.info("All workers have been shut down.")